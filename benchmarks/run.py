@@ -0,0 +1,262 @@
+"""
+Micro-benchmarks for the CPU hot paths of the client and CLI, with regression thresholds.
+
+Each benchmark is timed on synthetic payloads (10, 100 and 5,000 results, and a 1 MB code file),
+and divided by the time of a fixed pure-Python calibration workload, so results recorded on one
+machine can be compared on another. A benchmark regresses when its normalized time exceeds its
+baseline (in baseline.json) by more than the threshold.
+
+    python benchmarks/run.py                 # compare against baseline.json; exit 1 on regressions
+    python benchmarks/run.py --update        # record new baselines
+    python benchmarks/run.py -k print_panels # only run matching benchmarks
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import timeit
+import typing as t
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from rich.console import Console  # noqa: E402
+
+from searchcode import _lib  # noqa: E402
+from searchcode._cli import panels  # noqa: E402
+from searchcode._cli.highlight import TermMatcher  # noqa: E402
+from searchcode.filters import (  # noqa: E402
+    LANGUAGES,
+    SOURCES,
+    get_language_ids,
+    get_source_ids,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+RESULT_COUNTS = (10, 100, 5000)
+CODE_FILE_SIZE = 1024 * 1024
+
+_LANGUAGE_NAMES = list(t.get_args(LANGUAGES))
+_MATCHER = TermMatcher(terms=["import", "module", "result", "handler", "respond"])
+_SOURCE_NAMES = list(t.get_args(SOURCES))
+
+
+def make_response(count: int) -> t.Dict:
+    """
+    Build a synthetic search response with `count` results, shaped like the API's.
+    """
+    return {
+        "matchterm": "import module",
+        "previouspage": None,
+        "searchterm": "import module",
+        "query": "import module",
+        "total": count,
+        "page": 0,
+        "nextpage": 1,
+        "results": [
+            {
+                "repo": f"https://github.com/user{id % 97}/project{id % 13}",
+                "linescount": 40 + id % 900,
+                "location": f"/src/package{id % 7}",
+                "name": f"project{id % 13}",
+                "language": ("Python", "C", "JavaScript", "Go")[id % 4],
+                "url": f"https://searchcode.com/codesearch/view/{id}/",
+                "md5hash": f"{id:032x}",
+                "lines": {
+                    str(line): f"    result_{line} = import_module('module{id}')  # {line}"
+                    for line in range(10 + id % 5, 17 + id % 5)
+                },
+                "id": id,
+                "filename": f"module{id}.py",
+            }
+            for id in range(count)
+        ],
+        "language_filters": [{"count": count, "id": 19, "language": "Python"}],
+        "source_filters": [{"count": count, "id": 2, "source": "GitHub"}],
+    }
+
+
+def make_code_file(size: int) -> str:
+    """
+    Build a synthetic Python source file of about `size` bytes.
+    """
+    block = (
+        "def handler_{0}(request, *args, **kwargs):\n"
+        '    """Handle request {0}."""\n'
+        "    value = compute(request.data, factor={0})\n"
+        "    if value > {0}:\n"
+        "        return respond(value, status=200)\n"
+        "    return respond(None, status=404)\n\n"
+    )
+    parts, length, index = [], 0, 0
+    while length < size:
+        part = block.format(index)
+        parts.append(part)
+        length += len(part)
+        index += 1
+
+    return "".join(parts)
+
+
+def _calibrate():
+    """
+    Fixed pure-Python workload (dict building, string formatting and sorting) to normalize timings by.
+    """
+    items = {f"key{i}": str(i * 7) for i in range(2000)}
+    return sorted(f"{key}={value}" for key, value in items.items())
+
+
+def _offscreen_print_panels(data: t.Any, **kwargs):
+    """
+    Run print_panels against an offscreen console.
+    """
+    console = panels.console
+    panels.console = Console(
+        file=io.StringIO(), width=120, color_system="truecolor", force_terminal=True
+    )
+    try:
+        panels.print_panels(data=data, **kwargs)
+    finally:
+        panels.console = console
+
+
+def benchmarks() -> t.Dict[str, t.Callable[[], t.Any]]:
+    """
+    Build the benchmark cases, with their payloads prepared up front.
+    """
+    cases = {}
+    for count in RESULT_COUNTS:
+        response = make_response(count=count)
+        body = json.dumps(response)
+        namespace = _lib.dict_to_namespace(obj=response)
+        decoded = _lib.decode_search_response(obj=json.loads(body))
+        raw_lines = [result["lines"] for result in response["results"]]
+
+        cases[f"dict_to_namespace[{count}]"] = lambda r=response: _lib.dict_to_namespace(obj=r)
+        cases[f"decode_search_response[{count}]"] = (
+            lambda b=body: _lib.decode_search_response(obj=json.loads(b))
+        )
+        cases[f"namespace_to_dict[{count}]"] = lambda n=namespace: _lib.namespace_to_dict(obj=n)
+        cases[f"extract_code_lines[{count}]"] = lambda lines=raw_lines: [
+            panels._extract_code_string_with_linenumbers(lines_dict=item) for item in lines
+        ]
+        cases[f"filter_ids[{count}]"] = lambda r=response: (
+            get_language_ids(language_names=[item["language"] for item in r["results"]]),
+            get_source_ids(source_names=[_SOURCE_NAMES[i % 5] for i in range(len(r["results"]))]),
+        )
+        cases[f"print_panels[{count}]"] = (
+            lambda results=decoded.results: _offscreen_print_panels(data=results)
+        )
+        cases[f"print_panels_highlighted[{count}]"] = (
+            lambda results=decoded.results: _offscreen_print_panels(
+                data=results, highlight="import module lang:python"
+            )
+        )
+        cases[f"match_terms[{count}]"] = lambda lines=raw_lines: [
+            _MATCHER.find(line) for item in lines for line in item.values()
+        ]
+
+    code = make_code_file(size=CODE_FILE_SIZE)
+    code_lines = {str(number): line for number, line in enumerate(code.splitlines(), start=1)}
+    cases["extract_code_lines[1MB]"] = (
+        lambda: panels._extract_code_string_with_linenumbers(lines_dict=code_lines)
+    )
+    cases["filter_ids[all]"] = lambda: (
+        get_language_ids(language_names=_LANGUAGE_NAMES),
+        get_source_ids(source_names=_SOURCE_NAMES),
+    )
+    cases["print_panels[1MB]"] = lambda: _offscreen_print_panels(
+        data=SimpleNamespace(code=code, language="python")
+    )
+
+    return cases
+
+
+def measure(function: t.Callable[[], t.Any], repeat: int, min_time: float) -> float:
+    """
+    Time a function: the best of `repeat` runs, each calling it enough times to take `min_time`.
+    Functions that take over a second per call are only run twice.
+
+    :return: Seconds per call.
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number=number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed * 2 >= min_time else 10
+
+    if elapsed >= 1:
+        repeat = min(repeat, 2)
+
+    return min([elapsed, *timer.repeat(repeat=repeat - 1, number=number)]) / number
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--update", action="store_true", help="Record new baselines.")
+    parser.add_argument("-k", dest="pattern", default="", help="Only run benchmarks containing this.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="Allowed slowdown over the baseline, as a ratio (default: from baseline.json).",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark (best is kept).")
+    parser.add_argument(
+        "--min-time", type=float, default=0.05, help="Minimum seconds per run."
+    )
+    args = parser.parse_args(argv)
+
+    baseline = {"threshold": 2.0, "benchmarks": {}}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            baseline = json.load(file)
+    threshold = args.threshold or baseline["threshold"]
+
+    # calibrate before and after the benchmarks, keeping the faster, to smooth out machine noise
+    calibration = measure(_calibrate, repeat=args.repeat * 3, min_time=args.min_time)
+    seconds = {
+        name: measure(function, repeat=args.repeat, min_time=args.min_time)
+        for name, function in benchmarks().items()
+        if args.pattern in name
+    }
+    calibration = min(
+        calibration, measure(_calibrate, repeat=args.repeat * 3, min_time=args.min_time)
+    )
+
+    print(f"{'benchmark':<32} {'time':>12} {'normalized':>11} {'baseline':>10} {'ratio':>7}")
+    normalized, regressions = {}, []
+    for name, elapsed in seconds.items():
+        normalized[name] = elapsed / calibration
+        expected = baseline["benchmarks"].get(name)
+        ratio = normalized[name] / expected if expected else None
+        if ratio is not None and ratio > threshold:
+            regressions.append(name)
+
+        print(
+            f"{name:<32} {elapsed * 1000:>10.3f}ms {normalized[name]:>11.2f} "
+            f"{expected if expected else float('nan'):>10.2f} "
+            f"{ratio if ratio else float('nan'):>6.2f}x{'  REGRESSED' if name in regressions else ''}"
+        )
+
+    if args.update:
+        baseline["benchmarks"].update({name: round(value, 3) for name, value in normalized.items()})
+        baseline["threshold"] = threshold
+        with open(BASELINE_PATH, "w") as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"Updated {BASELINE_PATH}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} benchmarks regressed past {threshold}x: {', '.join(regressions)}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
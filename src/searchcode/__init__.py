@@ -15,15 +15,27 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import typing as t
 from datetime import datetime
 
-from .api import Searchcode
+if t.TYPE_CHECKING:
+    from .api import Searchcode, ResponseTooLargeError
 
 __pkg__ = "searchcode"
 __version__ = "0.6.3"
 __author__ = "Ritchie Mwewa"
 
-__all__ = ["Searchcode"]
+__all__ = ["Searchcode", "ResponseTooLargeError"]
+
+
+def __getattr__(name: str) -> t.Any:
+    # the client (and requests) is imported on first use, so `sc` can hand calls to the daemon without it
+    if name in __all__:
+        from . import api
+
+        return getattr(api, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class License:
@@ -598,4 +610,4 @@ copy of the Program in return for a fee.
 """
 
 
-__all__ = ["Searchcode"]
+__all__ = ["Searchcode", "ResponseTooLargeError"]
@@ -15,27 +15,60 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import contextlib
+import itertools
+import json
+import os
+import re
+import time
 import typing as t
 from types import SimpleNamespace
 
+import requests
 import rich_click as click
+from rich.table import Table
 
-from .panels import console, print_panels
+from .browse import ResultBrowser
+from .daemon import daemon_socket_path, forward_to_daemon, start_daemon
+from .highlight import TermMatcher
+from .panels import console, page_code, print_panels, slice_code_lines
 from .. import __pkg__, __version__, License
 from .._lib import (
+    MemoryReport,
+    SpillableList,
     clear_screen,
+    memory_phase,
     namespace_to_dict,
+    searchcode_endpoints,
     update_window_title,
 )
 from ..api import Searchcode
+from ..batch import read_queries, run_batch
+from ..blobstore import BlobStore, default_blobs_path
+from ..crawl import crawl as crawl_results
+from ..dedupe import Deduplicator
+from ..export import export_results
+from ..gateway import Gateway
+from ..grep import grep as grep_index
+from ..index import LocalIndex
+from ..stats import STATS_FIELDS, aggregate_stats
+from ..watch import Watcher
+from ..where import Where
 
 __all__ = ["cli"]
-sc = Searchcode(user_agent=f"{__pkg__}-sdk/__cli")
+sc = Searchcode(user_agent=f"{__pkg__}-sdk/__cli", endpoints=searchcode_endpoints())
 
 
 @click.group()
 @click.version_option(version=__version__, package_name=__pkg__)
-def cli():
+@click.option(
+    "--memory-report",
+    is_flag=True,
+    help="Trace memory allocations, and report the peak and retained memory of each phase "
+    "(HTTP body, JSON decode, namespaces, collected results, panels) when the command ends.",
+)
+@click.pass_context
+def cli(ctx: click.Context, memory_report: bool):
     """
     Searchcode
 
@@ -43,6 +76,53 @@ def cli():
     """
 
     update_window_title(text="Source code search engine.")
+    if memory_report:
+        report = MemoryReport()
+        report.start()
+        ctx.call_on_close(lambda: _print_memory_report(report=report))
+
+
+def _print_memory_report(report: MemoryReport):
+    """
+    Stop a memory report, and print its phases and their top allocation sites.
+    """
+    report.stop()
+    if not report.phases:
+        console.log("[bold yellow]✘[/bold yellow] No phases were measured.")
+        return
+
+    table = Table(title="Memory by phase", title_justify="left", border_style="#444444")
+    table.add_column("Phase")
+    table.add_column("Calls", justify="right")
+    table.add_column("Peak", justify="right", style="cyan")
+    table.add_column("Retained", justify="right", style="cyan")
+    table.add_column("Top allocation sites (retained)")
+
+    for name, phase in report.phases.items():
+        table.add_row(
+            name,
+            str(phase.calls),
+            _format_size(phase.peak),
+            _format_size(phase.retained),
+            "\n".join(
+                f"{_format_size(size)} {site}"
+                for site, size in phase.sites.most_common(report.top)
+            ),
+        )
+
+    console.print(table)
+
+
+def _format_size(size: int) -> str:
+    """
+    Format a number of bytes (e.g., 1.5 MiB).
+    """
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+    return f"{size:.1f} GiB"
 
 
 @cli.command("license")
@@ -73,6 +153,23 @@ def licence(
         click.echo(ctx.get_help())
 
 
+def _parse_where(
+    ctx: click.Context, param: click.Parameter, value: t.Tuple[str, ...]
+) -> t.Optional[Where]:
+    """
+    Parse `--where` clauses into a post-filter.
+
+    :return: The filter, or None if no clauses were given.
+    """
+    if not value:
+        return None
+
+    try:
+        return Where.parse(*value)
+    except ValueError as error:
+        raise click.BadParameter(str(error), ctx=ctx, param=param)
+
+
 @click.option(
     "--page", type=int, default=0, show_default=True, help="Start page number."
 )
@@ -108,6 +205,64 @@ def licence(
     help="Callback function for JSONP output (disables pagination).",
 )
 @click.option("--pretty", is_flag=True, help="Print raw JSON output.")
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Print each result as soon as it is received. Ignored if --callback is set.",
+)
+@click.option(
+    "--dedupe",
+    is_flag=True,
+    help="Drop results whose id or snippet was already seen. Ignored if --callback is set.",
+)
+@click.option(
+    "--local",
+    is_flag=True,
+    help="Search the local index (see `sc index`) instead of searchcode.com.",
+)
+@click.option(
+    "--save",
+    is_flag=True,
+    help="Add the results to the local index. Ignored if --callback is set.",
+)
+@click.option(
+    "--spill-after",
+    type=int,
+    help="Keep at most this many results in memory, spilling the rest to a temporary file.",
+)
+@click.option(
+    "--render-processes",
+    type=int,
+    help="Render result panels in this many worker processes (for large result sets).",
+)
+@click.option(
+    "--with-code",
+    type=int,
+    help="Fetch the full code files of the first N results concurrently (included with --pretty, "
+    "stored with --save and --store). Ignored if --callback is set.",
+)
+@click.option(
+    "--store",
+    is_flag=True,
+    help="Add the fetched code files (see --with-code) to the compressed blob store, with their "
+    "repositories (requires zstandard).",
+)
+@click.option(
+    "--where",
+    "where",
+    type=str,
+    multiple=True,
+    callback=_parse_where,
+    help="Keep only results matching a FIELD OP VALUE clause, e.g. 'line~TODO', "
+    "'filename=*.py', 'repo!=*fork*' or 'linescount<500' (repeatable; all must hold). "
+    "Ignored if --callback is set.",
+)
+@click.option(
+    "--limit",
+    type=int,
+    help="Page on (up to 50 pages) until this many results (matching --where, if set) were found, "
+    "and show no more than that. Ignored if --callback or --local is set.",
+)
 @click.argument("query", type=str)
 @cli.command()
 def search(
@@ -116,6 +271,16 @@ def search(
     pages: int,
     per_page: int,
     pretty: bool,
+    stream: bool,
+    dedupe: bool,
+    local: bool,
+    save: bool,
+    store: bool,
+    spill_after: t.Optional[int],
+    render_processes: t.Optional[int],
+    with_code: t.Optional[int],
+    where: t.Optional[Where],
+    limit: t.Optional[int],
     lines_of_code_lt: t.Optional[int],
     lines_of_code_gt: t.Optional[int],
     languages: t.Optional[str],
@@ -130,46 +295,252 @@ def search(
     clear_screen()
     update_window_title(text=query)
 
-    languages = languages.split(",") if languages else None
-    sources = sources.split(",") if sources else None
+    filters = dict(
+        languages=languages.split(",") if languages else None,
+        sources=sources.split(",") if sources else None,
+        lines_of_code_lt=lines_of_code_lt,
+        lines_of_code_gt=lines_of_code_gt,
+    )
     pages = max(1, min(pages, 5))  # limit 1 <= pages <= 5
+    if limit:
+        pages = 50  # page on until enough results match
+    if where and where.needs_code and not with_code:
+        raise click.BadParameter(
+            "clauses on the code file (code~REGEX) require --with-code.", param_hint="--where"
+        )
+    if store and not with_code:
+        raise click.BadParameter("there are no code files to store without --with-code.", param_hint="--store")
+
+    if local:
+        _print_local_results(
+            query=query,
+            page=page,
+            per_page=per_page,
+            pages=pages,
+            filters=filters,
+            pretty=pretty,
+            render_processes=render_processes,
+        )
+        return
 
     if callback:
         # JSONP mode = single page only
         response = sc.search(
+            query=query, page=page, per_page=per_page, callback=callback, **filters
+        )
+        print_panels(data=response)
+        return
+
+    deduplicator = Deduplicator() if dedupe else None
+    if stream:
+        _stream_search_results(
             query=query,
             page=page,
             per_page=per_page,
-            languages=languages,
-            sources=sources,
-            lines_of_code_lt=lines_of_code_lt,
-            lines_of_code_gt=lines_of_code_gt,
-            callback=callback,
+            pages=pages,
+            filters=filters,
+            deduplicator=deduplicator,
+            with_code=with_code,
+            where=where,
+            limit=limit,
+            pretty=pretty,
+            save=save,
+            store=store,
         )
-        print_panels(data=response)
         return
 
     # normal paginated search
-    with console.status(f"Querying code index with [green]{query}[/]...") as status:
+    _print_paginated_results(
+        query=query,
+        page=page,
+        per_page=per_page,
+        pages=pages,
+        filters=filters,
+        deduplicator=deduplicator,
+        with_code=with_code,
+        where=where,
+        limit=limit,
+        pretty=pretty,
+        save=save,
+        store=store,
+        spill_after=spill_after,
+        render_processes=render_processes,
+    )
+
+
+def _print_local_results(
+    query: str,
+    page: int,
+    per_page: int,
+    pages: int,
+    filters: t.Dict,
+    pretty: bool,
+    render_processes: t.Optional[int],
+):
+    """
+    Search the local index, and print the results.
+    """
+    with LocalIndex() as index:
+        response = index.search(query=query, page=page, per_page=per_page, pages=pages, **filters)
+    _print_search_results(
+        query=query,
+        results=response.results,
+        total=response.total,
+        pretty=pretty,
+        processes=render_processes,
+    )
+
+
+def _stream_search_results(
+    query: str,
+    page: int,
+    per_page: int,
+    pages: int,
+    filters: t.Dict,
+    deduplicator: t.Optional[Deduplicator],
+    with_code: t.Optional[int],
+    where: t.Optional[Where],
+    limit: t.Optional[int],
+    pretty: bool,
+    save: bool,
+    store: bool,
+):
+    """
+    Print each search result as soon as it is received, saving (and storing) it as it arrives.
+    """
+    count = 0
+    matcher = TermMatcher.from_query(query=query)
+    with _result_sinks(save=save, store=store) as (index, blobs):
+        for result in sc.iter_search(
+            query=query,
+            page=page,
+            per_page=per_page,
+            pages=pages,
+            deduplicator=deduplicator,
+            with_code=bool(with_code),
+            max_hydrate=with_code,
+            where=where,
+            limit=limit,
+            **filters,
+        ):
+            if pretty:
+                console.print(namespace_to_dict(obj=result))
+            else:
+                print_panels(data=[result], matcher=matcher)
+            _keep_results(results=[result], index=index, blobs=blobs)
+            count += 1
+
+    if not count:
+        console.log(
+            f"[bold yellow]✘[/bold yellow] No results found for [bold yellow]{query}[/bold yellow]."
+        )
+    if deduplicator and not pretty:
+        console.log(f"Dropped {deduplicator.collapsed} duplicate results")
+
+
+def _print_paginated_results(
+    query: str,
+    page: int,
+    per_page: int,
+    pages: int,
+    filters: t.Dict,
+    deduplicator: t.Optional[Deduplicator],
+    with_code: t.Optional[int],
+    where: t.Optional[Where],
+    limit: t.Optional[int],
+    pretty: bool,
+    save: bool,
+    store: bool,
+    spill_after: t.Optional[int],
+    render_processes: t.Optional[int],
+):
+    """
+    Fetch the pages of search results, save (and store) them, then print them.
+    """
+    with console.status(
+        f"Querying code index with [green]{query}[/]..."
+    ) as status:
         results, total = _fetch_paginated_results(
             query=query,
             start_page=page,
             per_page=per_page,
             pages=pages,
-            languages=languages,
-            sources=sources,
-            lines_of_code_lt=lines_of_code_lt,
-            lines_of_code_gt=lines_of_code_gt,
             status=status,
+            deduplicator=deduplicator,
+            max_in_memory=spill_after,
+            max_hydrate=with_code,
+            where=where,
+            limit=limit,
+            **filters,
         )
 
+    with _result_sinks(save=save, store=store) as (index, blobs):
+        _keep_results(results=results, index=index, blobs=blobs)
+    if deduplicator and results and not pretty:
+        console.log(f"Dropped {deduplicator.collapsed} duplicate results")
+    _print_search_results(
+        query=query,
+        results=results,
+        total=total,
+        pretty=pretty,
+        processes=render_processes,
+    )
+    if isinstance(results, SpillableList):
+        results.close()
+
+
+@contextlib.contextmanager
+def _result_sinks(
+    save: bool, store: bool
+) -> t.Iterator[t.Tuple[t.Optional[LocalIndex], t.Optional[BlobStore]]]:
+    """
+    Open the local index (if save) and the blob store (if store) for the results of a search.
+    """
+    with LocalIndex() if save else contextlib.nullcontext() as index, (
+        _open_blob_store() if store else contextlib.nullcontext()
+    ) as blobs:
+        yield index, blobs
+
+
+def _keep_results(
+    results: t.Iterable[SimpleNamespace],
+    index: t.Optional[LocalIndex],
+    blobs: t.Optional[BlobStore],
+):
+    """
+    Add search results to the local index, and their fetched code files to the blob store.
+    """
+    if index:
+        index.add_results(results=results)
+    if blobs:
+        for result in results:
+            if result.code:
+                _store_code(blobs=blobs, result=result)
+
+
+def _print_search_results(
+    query: str,
+    results: t.Union[t.List[SimpleNamespace], SpillableList],
+    total: int,
+    pretty: bool,
+    processes: t.Optional[int] = None,
+):
+    """
+    Print search results as panels (or raw JSON if pretty), or a notice if there are none.
+
+    If processes is set, panels are rendered in that many worker processes.
+    """
     if results:
-        if not callback and not pretty:
+        if not pretty:
             console.log(f"Showing {len(results)} of {total} results for '{query}'")
-        if pretty:
+        if pretty and isinstance(results, SpillableList):
+            # print one result at a time, so spilled results are never all loaded at once
+            for result in results:
+                console.print(namespace_to_dict(obj=result))
+        elif pretty:
             console.print(namespace_to_dict(obj=results))
         else:
-            print_panels(data=results)
+            print_panels(data=results, processes=processes, highlight=query)
     else:
         console.log(
             f"[bold yellow]✘[/bold yellow] No results found for [bold yellow]{query}[/bold yellow]."
@@ -186,51 +557,146 @@ def _fetch_paginated_results(
     lines_of_code_lt: t.Optional[int],
     lines_of_code_gt: t.Optional[int],
     status: console.status,
-) -> t.Tuple[t.List[SimpleNamespace], int]:
+    deduplicator: t.Optional[Deduplicator] = None,
+    max_in_memory: t.Optional[int] = None,
+    max_hydrate: t.Optional[int] = None,
+    where: t.Optional[Where] = None,
+    limit: t.Optional[int] = None,
+) -> t.Tuple[t.Union[t.List[SimpleNamespace], SpillableList], int]:
     """
     Fetch paginated results from the code index.
 
-    :return: Tuple of (results list, total number of results)
+    If max_in_memory is set, results are collected in a SpillableList,
+    which spills them to a temporary file past that many results.
+    If max_hydrate is set, the code files of that many results are fetched too.
+    If where is set, only matching results are kept; if limit is set, paging stops
+    once that many results were kept.
+
+    :return: Tuple of (results list, total number of results reported by the API)
     """
-    all_results = []
+    all_results = SpillableList(max_in_memory=max_in_memory) if max_in_memory else []
+    hydrated = 0
     current_page = start_page
     total_results = 0
 
-    for current_iteration in range(1, pages + 1):
-        response = sc.search(
-            query=query,
-            page=current_page,
-            per_page=per_page,
-            languages=languages,
-            sources=sources,
-            lines_of_code_lt=lines_of_code_lt,
-            lines_of_code_gt=lines_of_code_gt,
-            callback=None,
-        )
-        status.update(
-            f"Getting page results on page [cyan]{current_iteration}[/] of [cyan]{pages}[/] "
-            f"([cyan]{len(all_results)}[/] results collected)..."
-        )
+    # the retained memory of this phase is that of the collected results
+    with memory_phase("results"):
+        for current_iteration in range(1, pages + 1):
+            response = sc.search(
+                query=query,
+                page=current_page,
+                per_page=per_page,
+                languages=languages,
+                sources=sources,
+                lines_of_code_lt=lines_of_code_lt,
+                lines_of_code_gt=lines_of_code_gt,
+                callback=None,
+                with_code=bool(max_hydrate),
+                max_hydrate=max(0, max_hydrate - hydrated) if max_hydrate else None,
+                where=where,
+            )
+            status.update(
+                f"Getting page results on page [cyan]{current_iteration}[/] of [cyan]{pages}[/] "
+                f"([cyan]{len(all_results)}[/] results collected)..."
+            )
+
+            if isinstance(response, str):
+                break
 
-        if isinstance(response, str):
-            break
-        elif response.results:
-            all_results.extend(response.results)
+            # a page the where filter emptied is not the last page; the API total tells
             total_results = response.total
+            hydrated += len(response.results)
+            results = deduplicator(response.results) if deduplicator else response.results
+            if limit is not None:
+                results = itertools.islice(results, max(0, limit - len(all_results)))
+            all_results.extend(results)
 
-            if len(all_results) >= response.total:
+            if (
+                (limit is not None and len(all_results) >= limit)
+                or (not where and not response.results)
+                or (current_page + 1) * per_page >= response.total
+                or current_page + 1 >= 50
+            ):
                 break
 
             current_page += 1
-        else:
-            break
 
     return all_results, total_results
 
 
+def _parse_line_range(
+    ctx: click.Context, param: click.Parameter, value: t.Optional[str]
+) -> t.Optional[t.Tuple[t.Optional[int], t.Optional[int]]]:
+    """
+    Parse an `A-B` line range (either side may be omitted, e.g. `100-` or `-50`).
+
+    :return: Tuple of (start, end) line numbers, or None if no range was given.
+    """
+    if not value:
+        return None
+
+    start, separator, end = value.partition("-")
+    try:
+        start = int(start) if start else None
+        end = int(end) if end else None
+    except ValueError:
+        raise click.BadParameter(f"expected A-B, got '{value}'.", ctx=ctx, param=param)
+
+    if not separator or (start is None and end is None):
+        raise click.BadParameter(f"expected A-B, got '{value}'.", ctx=ctx, param=param)
+    if any(bound is not None and bound < 1 for bound in (start, end)):
+        raise click.BadParameter(
+            f"line numbers start at 1, got '{value}'.", ctx=ctx, param=param
+        )
+    if start is not None and end is not None and start > end:
+        raise click.BadParameter(
+            f"the range ends before it starts: '{value}'.", ctx=ctx, param=param
+        )
+
+    return start, end
+
+
 @cli.command()
 @click.argument("id", type=int)
-def code(id: int):
+@click.option(
+    "--lines",
+    "line_range",
+    type=str,
+    callback=_parse_line_range,
+    help="Only render (or, with --output, write) lines A-B (e.g., 120-180).",
+)
+@click.option(
+    "--pager",
+    is_flag=True,
+    help="Browse the file in a pager that only highlights the visible lines.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the raw code to FILE instead of printing it.",
+)
+@click.option(
+    "--local",
+    is_flag=True,
+    help="Read the code file from the local index (see `sc index`) or the blob store "
+    "(see `sc blobs`) instead of searchcode.com.",
+)
+@click.option("--save", is_flag=True, help="Add the code file to the local index.")
+@click.option(
+    "--store",
+    is_flag=True,
+    help="Add the code file to the compressed blob store, with its repository if the search result "
+    "is in the local index (requires zstandard).",
+)
+def code(
+    id: int,
+    line_range: t.Optional[t.Tuple[t.Optional[int], t.Optional[int]]],
+    pager: bool,
+    output: t.Optional[str],
+    local: bool,
+    save: bool,
+    store: bool,
+):
     """
     Get the raw data from a code file.
 
@@ -238,6 +704,839 @@ def code(id: int):
     """
     clear_screen()
     update_window_title(text=str(id))
+    data = _read_local_code(id=id) if local else _fetch_code(id=id, save=save, store=store)
+    if not data.code:
+        print_panels(data=data, id=id)
+        return
+
+    start_line = 1
+    if line_range:
+        data.code, start_line = slice_code_lines(data.code, *line_range)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            # sliced lines are joined without a trailing newline
+            file.write(f"{data.code}\n" if line_range and data.code else data.code)
+        console.log(f"[bold green]✔[/bold green] Saved code file {id} to [cyan]{output}[/]")
+        return
+
+    if pager:
+        page_code(code=data.code, language=data.language, start_line=start_line)
+    else:
+        print_panels(data=data, id=id, start_line=start_line)
+
+
+def _read_local_code(id: int) -> SimpleNamespace:
+    """
+    Read a code file from the local index, or else the blob store.
+    """
+    with LocalIndex() as index:
+        data = index.code(id)
+    if data is None and os.path.exists(default_blobs_path()):
+        with _open_blob_store() as blobs:
+            data = blobs.code(id)
+    return data or SimpleNamespace(code=None, language=None)
+
+
+def _fetch_code(id: int, save: bool, store: bool) -> SimpleNamespace:
+    """
+    Get a code file from searchcode.com, adding it to the local index (if save) and the blob store (if store).
+    """
     with console.status(f"Getting code file [cyan]{id}[/]..."):
         data = sc.code(id)
-        print_panels(data=data, id=id)
+
+    if save and data.code:
+        with LocalIndex() as index:
+            index.add_code(id, data)
+    if store and data.code:
+        # the code file has no repository; the search result has it, if it was saved to the index
+        with LocalIndex() as index:
+            result = index.document(id)
+        with _open_blob_store() as blobs:
+            blobs.add_code(id, data=data, result=result)
+    return data
+
+
+@cli.command()
+@click.argument("queries", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    required=True,
+    help="JSONL file to append results to.",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Checkpoint file for resuming (defaults to OUTPUT.checkpoint).",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Maximum number of concurrent requests.",
+)
+@click.option(
+    "--adaptive",
+    is_flag=True,
+    help="Adapt the number of concurrent requests to how the API responds (up to --workers).",
+)
+def batch(
+    queries: str, output: str, checkpoint: t.Optional[str], workers: int, adaptive: bool
+):
+    """
+    Run the queries in a JSONL file (one object of search parameters per line).
+
+    Completed pages are checkpointed, so rerunning the same command after a crash
+    resumes where it stopped.
+
+    e.g., sc batch queries.jsonl --output results.jsonl
+    """
+    update_window_title(text=f"Batch: {queries}")
+    try:
+        batch_queries = read_queries(path=queries)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="QUERIES")
+
+    client = (
+        Searchcode(
+            user_agent=sc.user_agent,
+            endpoints=sc.endpoints,
+            max_workers=workers,
+            adaptive_concurrency=True,
+        )
+        if adaptive
+        else sc
+    )
+    with console.status(f"Running [cyan]{len(batch_queries)}[/] queries...") as status:
+        summary = run_batch(
+            client=client,
+            queries=batch_queries,
+            output=output,
+            checkpoint=checkpoint,
+            workers=workers,
+            on_page=lambda query, page, count: status.update(
+                f"Got [cyan]{count}[/] results on page [cyan]{page}[/] of [green]{query['query']}[/]..."
+            ),
+        )
+
+    console.log(
+        f"[bold green]✔[/bold green] Fetched [cyan]{summary.results}[/] results "
+        f"from [cyan]{summary.pages}[/] pages ([cyan]{summary.skipped}[/] queries already done)."
+    )
+    if client.limiter:
+        concurrency = client.limiter.stats()
+        console.log(
+            f"[bold green]✔[/bold green] Settled at [cyan]{concurrency['limit']}[/] concurrent requests "
+            f"([cyan]{concurrency['increases']}[/] increases, [cyan]{concurrency['decreases']}[/] decreases)."
+        )
+    for query, page, error in summary.failed:
+        console.log(
+            f"[bold red]✘[/bold red] Page {page} of [yellow]{query['query']}[/] failed: {error}"
+        )
+
+
+@cli.command("stats")
+@click.argument("query", type=str)
+@click.option(
+    "--pages",
+    type=int,
+    default=10,
+    show_default=True,
+    help="Maximum number of pages to count (at most 50).",
+)
+@click.option(
+    "--by",
+    type=str,
+    default=",".join(STATS_FIELDS),
+    show_default=True,
+    help="Comma-separated fields to count by. With only language and source, "
+    "the API's facet totals are used and no further pages are fetched.",
+)
+@click.option("--top", type=int, default=10, show_default=True, help="Rows shown per field.")
+@click.option(
+    "--workers",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Maximum number of pages fetched concurrently.",
+)
+@click.option(
+    "--lines-of-code-lt",
+    type=int,
+    help="Filter to sources with fewer lines of code (0 to 10000).",
+)
+@click.option(
+    "--lines-of-code-gt",
+    type=int,
+    help="Filter to sources with more lines of code (0 to 10000).",
+)
+@click.option("--sources", type=str, help="Comma-separated list of source filters.")
+@click.option("--languages", type=str, help="Comma-separated list of language filters.")
+@click.option("--pretty", is_flag=True, help="Print the counts as JSON.")
+def stats_command(
+    query: str,
+    pages: int,
+    by: str,
+    top: int,
+    workers: int,
+    lines_of_code_lt: t.Optional[int],
+    lines_of_code_gt: t.Optional[int],
+    sources: t.Optional[str],
+    languages: t.Optional[str],
+    pretty: bool,
+):
+    """
+    Count a query's results by language, source, repository and lines of code.
+
+    e.g., sc stats "import module" --pages 20
+    """
+    update_window_title(text=f"Stats: {query}")
+    try:
+        with console.status(f"Counting results for [green]{query}[/]...") as status:
+            stats = aggregate_stats(
+                client=sc,
+                query=query,
+                pages=pages,
+                languages=languages.split(",") if languages else None,
+                sources=sources.split(",") if sources else None,
+                lines_of_code_gt=lines_of_code_gt,
+                lines_of_code_lt=lines_of_code_lt,
+                fields=[field.strip() for field in by.split(",") if field.strip()],
+                workers=workers,
+                on_page=lambda page, count: status.update(
+                    f"Counted [cyan]{count}[/] results on page [cyan]{page}[/] of [green]{query}[/]..."
+                ),
+            )
+    except requests.RequestException as error:
+        raise click.ClickException(f"Could not count the results of '{query}': {error}")
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="--by")
+
+    fields = [field for field in STATS_FIELDS if getattr(stats, field) is not None]
+    if pretty:
+        console.print_json(
+            json.dumps(
+                {
+                    "total": stats.total,
+                    "counted": stats.counted,
+                    "from_facets": stats.from_facets,
+                    "failed": [{"page": page, "error": error} for page, error in stats.failed],
+                    **{field: dict(getattr(stats, field).most_common()) for field in fields},
+                }
+            )
+        )
+        return
+
+    for field in fields:
+        counts = getattr(stats, field)
+        scope = "all results" if field in stats.from_facets else f"{stats.counted} results"
+        table = Table(
+            title=f"By {field} ({scope})", title_justify="left", border_style="#444444"
+        )
+        table.add_column(field.capitalize())
+        table.add_column("Results", justify="right", style="cyan")
+        rows = (
+            sorted(counts.items(), key=lambda item: int(item[0].strip("<+").split("-")[0]))
+            if field == "linescount"
+            else counts.most_common(top)
+        )
+        for name, count in rows:
+            table.add_row(str(name), str(count))
+        console.print(table)
+
+    console.log(
+        f"[bold green]✔[/bold green] Counted [cyan]{stats.counted}[/] of [cyan]{stats.total}[/] "
+        f"results from [cyan]{stats.pages}[/] pages."
+    )
+    for page, error in stats.failed:
+        console.log(
+            f"[bold yellow]✘[/bold yellow] Page {page} failed ({error}); its results are not counted."
+        )
+
+
+@cli.command()
+@click.argument("pattern", type=str)
+@click.option("--languages", type=str, help="Comma-separated list of language filters.")
+@click.option(
+    "--sources",
+    type=str,
+    help="Comma-separated list of source filters (matched against the repository's host).",
+)
+@click.option("--ignore-case", "-i", is_flag=True, help="Match case-insensitively.")
+@click.option("--max-count", type=int, help="Maximum number of matching lines per file.")
+@click.option(
+    "--processes",
+    type=int,
+    help="Number of worker processes (defaults to the number of CPUs).",
+)
+@click.option("--pretty", is_flag=True, help="Print raw JSON output.")
+def grep(
+    pattern: str,
+    languages: t.Optional[str],
+    sources: t.Optional[str],
+    ignore_case: bool,
+    max_count: t.Optional[int],
+    processes: t.Optional[int],
+    pretty: bool,
+):
+    """
+    Search the code files in the local index with a regex.
+
+    Only code files fetched with `sc code --save` (or `--with-code` and `--save`) are searched;
+    no requests are sent.
+
+    e.g., sc grep "def \\w+_handler" --languages Python
+    """
+    update_window_title(text=pattern)
+
+    files = lines = 0
+    try:
+        for result in grep_index(
+            pattern=pattern,
+            languages=languages.split(",") if languages else None,
+            sources=sources.split(",") if sources else None,
+            ignore_case=ignore_case,
+            max_count=max_count,
+            processes=processes,
+        ):
+            if pretty:
+                console.print(namespace_to_dict(obj=result))
+            else:
+                # the pattern is a regex, not query terms; every line shown matches it
+                print_panels(data=[result])
+            files += 1
+            lines += len(result.lines)
+    except re.error as error:
+        raise click.BadParameter(f"invalid regex: {error}", param_hint="PATTERN")
+
+    if not files:
+        console.log(
+            f"[bold yellow]✘[/bold yellow] No matches for [bold yellow]{pattern}[/bold yellow] "
+            "in the local index."
+        )
+    elif not pretty:
+        console.log(f"{lines} matching lines in {files} files")
+
+
+@cli.command()
+@click.argument("query", type=str)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    required=True,
+    help="JSONL file to write results to.",
+)
+@click.option(
+    "--processes",
+    type=int,
+    help="Number of worker processes (defaults to the number of CPUs).",
+)
+@click.option("--languages", type=str, help="Comma-separated list of language filters.")
+@click.option("--sources", type=str, help="Comma-separated list of source filters.")
+@click.option(
+    "--lines-of-code-gt",
+    type=int,
+    help="Filter to sources with more lines of code (0 to 10000).",
+)
+@click.option(
+    "--lines-of-code-lt",
+    type=int,
+    help="Filter to sources with fewer lines of code (0 to 10000).",
+)
+def crawl(
+    query: str,
+    output: str,
+    processes: t.Optional[int],
+    languages: t.Optional[str],
+    sources: t.Optional[str],
+    lines_of_code_gt: t.Optional[int],
+    lines_of_code_lt: t.Optional[int],
+):
+    """
+    Fetch every result of a query, past the 50 page limit.
+
+    The query is split into slices by source, lines of code and language,
+    which are fetched in parallel worker processes.
+
+    e.g., sc crawl "import module" --output results.jsonl
+    """
+    update_window_title(text=f"Crawl: {query}")
+    stats = SimpleNamespace()
+
+    with console.status(
+        f"Crawling [green]{query}[/]..."
+    ) as status, open(output, "w", encoding="utf-8") as file:
+        for result in crawl_results(
+            client=sc,
+            query=query,
+            languages=languages.split(",") if languages else None,
+            sources=sources.split(",") if sources else None,
+            lines_of_code_gt=lines_of_code_gt,
+            lines_of_code_lt=lines_of_code_lt,
+            processes=processes,
+            stats=stats,
+        ):
+            file.write(json.dumps(namespace_to_dict(obj=result)) + "\n")
+            status.update(
+                f"Crawling [green]{query}[/] ([cyan]{stats.results}[/] results "
+                f"from [cyan]{stats.slices}[/] slices)..."
+            )
+
+    console.log(
+        f"[bold green]✔[/bold green] Wrote [cyan]{stats.results}[/] results from "
+        f"[cyan]{stats.slices}[/] slices to [cyan]{output}[/] "
+        f"([cyan]{stats.duplicates}[/] duplicates dropped)."
+    )
+    if stats.truncated:
+        console.log(
+            f"[bold yellow]✘[/bold yellow] {stats.truncated} slices were still over "
+            f"the cap and could not be split further; their results are incomplete."
+        )
+    _log_crawl_failures(stats=stats)
+
+
+def _log_crawl_failures(stats: SimpleNamespace):
+    """
+    Report the crawl slices whose pages still failed after their retries.
+    """
+    for crawl_slice, page, error in stats.failed:
+        filters = {name: value for name, value in crawl_slice.search_filters().items() if value}
+        console.log(
+            f"[bold yellow]✘[/bold yellow] Slice {filters or 'all'} failed at page {page} "
+            f"({error}); its results are incomplete."
+        )
+
+
+def _store_code(blobs: BlobStore, result: SimpleNamespace):
+    """
+    Store the code file attached to a search result, with the result's repository.
+    """
+    blobs.add_code(
+        result.id,
+        data=SimpleNamespace(code=result.code, language=result.language),
+        result=result,
+    )
+
+
+def _open_blob_store() -> BlobStore:
+    """
+    Open the default blob store, or exit with a hint if zstandard is not installed.
+    """
+    try:
+        return BlobStore()
+    except ImportError as error:
+        raise click.ClickException(str(error))
+
+
+@cli.group("blobs")
+def blobs_group():
+    """
+    Manage the compressed, content-addressed store of code files.
+
+    Store code files with `sc code --store` (or `sc search --with-code N --store`), then read them
+    offline with `sc code --local`.
+    """
+
+
+@blobs_group.command("stats")
+def blobs_stats():
+    """
+    Show what is in the blob store, and how well it is compressed.
+    """
+    with _open_blob_store() as blobs:
+        stats = blobs.stats()
+
+    console.log(
+        f"[cyan]{stats.codes}[/] code files in [cyan]{stats.blobs}[/] distinct blobs: "
+        f"[cyan]{_format_size(stats.size)}[/] stored in [cyan]{_format_size(stats.stored)}[/] "
+        f"({stats.size / stats.stored if stats.stored else 0:.1f}x, "
+        f"[cyan]{stats.dictionaries}[/] dictionaries) in [cyan]{stats.path}[/]"
+    )
+
+
+@blobs_group.command("train")
+@click.option(
+    "--samples",
+    type=int,
+    default=1000,
+    show_default=True,
+    help="Maximum number of stored code files to train on.",
+)
+def blobs_train(samples: int):
+    """
+    Train a new compression dictionary on the stored code files.
+    """
+    with _open_blob_store() as blobs:
+        try:
+            size = blobs.train(samples=samples)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+
+    console.log(
+        f"[bold green]✔[/bold green] Trained a [cyan]{_format_size(size)}[/] dictionary; "
+        f"code files stored from now on are compressed with it."
+    )
+
+
+@cli.group("index")
+def index_group():
+    """
+    Manage the local index of saved results and code files.
+
+    Save results with `sc search --save` and `sc code --save`,
+    then search them offline with `sc search --local`.
+    """
+
+
+@index_group.command("stats")
+def index_stats():
+    """
+    Show what is in the local index.
+    """
+    with LocalIndex() as index:
+        stats = index.stats()
+
+    console.log(
+        f"[cyan]{stats.documents}[/] documents ([cyan]{stats.code_files}[/] with full code) "
+        f"in [cyan]{stats.path}[/]"
+    )
+
+
+@index_group.command("clear")
+@click.confirmation_option(prompt="Remove everything from the local index?")
+def index_clear():
+    """
+    Remove everything from the local index.
+    """
+    with LocalIndex() as index:
+        index.clear()
+
+    console.log("[bold green]✔[/bold green] Cleared the local index.")
+
+
+@cli.command()
+@click.argument("query", type=str)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    required=True,
+    help="File to write results to.",
+)
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(["parquet", "arrow"]),
+    default="parquet",
+    show_default=True,
+    help="Output format (arrow is Arrow IPC).",
+)
+@click.option(
+    "--pages",
+    type=int,
+    default=50,
+    show_default=True,
+    help="Number of pages to export (maximum 50). Ignored if --crawl is set.",
+)
+@click.option(
+    "--crawl",
+    "use_crawl",
+    is_flag=True,
+    help="Export every result, past the 50 page limit (see `sc crawl`).",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=10_000,
+    show_default=True,
+    help="Results per record batch.",
+)
+@click.option("--languages", type=str, help="Comma-separated list of language filters.")
+@click.option("--sources", type=str, help="Comma-separated list of source filters.")
+def export(
+    query: str,
+    output: str,
+    export_format: str,
+    pages: int,
+    use_crawl: bool,
+    batch_size: int,
+    languages: t.Optional[str],
+    sources: t.Optional[str],
+):
+    """
+    Export search results to a Parquet or Arrow file.
+
+    Results are written in fixed-size record batches as they are fetched.
+    Requires pyarrow (pip install searchcode[arrow]).
+
+    e.g., sc export "import module" --output results.parquet
+    """
+    update_window_title(text=f"Export: {query}")
+    filters = {
+        "languages": languages.split(",") if languages else None,
+        "sources": sources.split(",") if sources else None,
+    }
+    stats = SimpleNamespace(failed=[])
+    if use_crawl:
+        results = crawl_results(client=sc, query=query, stats=stats, **filters)
+    else:
+        results = sc.iter_search(query=query, pages=max(1, min(pages, 50)), **filters)
+
+    with console.status(f"Exporting results for [green]{query}[/]..."):
+        try:
+            count = export_results(
+                results=results,
+                path=output,
+                format=export_format,
+                batch_size=batch_size,
+            )
+        except ImportError as error:
+            raise click.UsageError(str(error))
+
+    console.log(
+        f"[bold green]✔[/bold green] Exported [cyan]{count}[/] results to [cyan]{output}[/]"
+    )
+    _log_crawl_failures(stats=stats)
+
+
+@cli.command()
+@click.argument("query", type=str)
+@click.option(
+    "--interval",
+    type=float,
+    default=300,
+    show_default=True,
+    help="Seconds to wait between polls.",
+)
+@click.option(
+    "--pages",
+    type=int,
+    default=5,
+    show_default=True,
+    help="Maximum number of pages to fetch per poll.",
+)
+@click.option(
+    "--per-page",
+    type=int,
+    default=100,
+    show_default=True,
+    help="Results per page (maximum 100).",
+)
+@click.option("--languages", type=str, help="Comma-separated list of language filters.")
+@click.option("--sources", type=str, help="Comma-separated list of source filters.")
+@click.option("--pretty", is_flag=True, help="Print raw JSON output.")
+def watch(
+    query: str,
+    interval: float,
+    pages: int,
+    per_page: int,
+    languages: t.Optional[str],
+    sources: t.Optional[str],
+    pretty: bool,
+):
+    """
+    Re-run a search periodically, printing only new or changed results.
+
+    e.g., sc watch "AKIA lang:python" --interval 600
+    """
+    update_window_title(text=f"Watch: {query}")
+    watcher = Watcher(
+        client=sc,
+        query=query,
+        pages=pages,
+        per_page=per_page,
+        languages=languages.split(",") if languages else None,
+        sources=sources.split(",") if sources else None,
+    )
+
+    while True:
+        with console.status(f"Polling [green]{query}[/]..."):
+            changes = watcher.poll()
+
+        if changes:
+            console.log(f"{len(changes)} new or changed results for '{query}'")
+            if pretty:
+                console.print(namespace_to_dict(obj=changes))
+            else:
+                print_panels(data=changes)
+        else:
+            console.log(f"No changes for '{query}'")
+
+        with console.status(f"Next poll in [cyan]{interval:g}[/] seconds..."):
+            time.sleep(interval)
+
+
+@cli.command()
+@click.argument("query", type=str)
+@click.option(
+    "--page", type=int, default=0, show_default=True, help="Start page number."
+)
+@click.option(
+    "--per-page",
+    type=int,
+    default=50,
+    show_default=True,
+    help="Results per page (maximum 100).",
+)
+@click.option("--languages", type=str, help="Comma-separated list of language filters.")
+@click.option("--sources", type=str, help="Comma-separated list of source filters.")
+def browse(
+    query: str,
+    page: int,
+    per_page: int,
+    languages: t.Optional[str],
+    sources: t.Optional[str],
+):
+    """
+    Browse search results interactively.
+
+    The next page and the selected file are prefetched in the background.
+    Keys: j/k move, n/p next/previous page, enter opens the file, q quits.
+
+    e.g., sc browse "import module"
+    """
+    update_window_title(text=query)
+    ResultBrowser(
+        client=sc,
+        query=query,
+        page=page,
+        per_page=per_page,
+        languages=languages.split(",") if languages else None,
+        sources=sources.split(",") if sources else None,
+    ).run()
+
+
+@cli.group()
+def daemon():
+    """
+    Manage the background daemon.
+
+    While the daemon runs, `sc search` and `sc code` are forwarded to it,
+    reusing its warm client, connections, response cache and lexers.
+    """
+
+
+@daemon.command("start")
+@click.option(
+    "--cache-ttl",
+    type=float,
+    default=300,
+    show_default=True,
+    help="Seconds cached responses stay valid.",
+)
+def daemon_start(cache_ttl: float):
+    """
+    Start the daemon in the background.
+    """
+    reply = forward_to_daemon(command="ping", params={})
+    if reply:
+        console.log(f"The daemon is already running (pid [cyan]{reply['pid']}[/]).")
+        return
+
+    with console.status("Starting the daemon..."):
+        pid = start_daemon(cache_ttl=cache_ttl)
+
+    if pid:
+        console.log(
+            f"[bold green]✔[/bold green] Started the daemon (pid [cyan]{pid}[/]) "
+            f"on [cyan]{daemon_socket_path()}[/]"
+        )
+    else:
+        console.log("[bold red]✘[/bold red] The daemon did not start.")
+
+
+@daemon.command("stop")
+def daemon_stop():
+    """
+    Stop the daemon.
+    """
+    if forward_to_daemon(command="shutdown", params={}):
+        console.log("[bold green]✔[/bold green] Stopped the daemon.")
+    else:
+        console.log("The daemon is not running.")
+
+
+@daemon.command("status")
+def daemon_status():
+    """
+    Show whether the daemon is running, and its cache statistics.
+    """
+    reply = forward_to_daemon(command="ping", params={})
+    if reply:
+        console.log(
+            f"The daemon is running (pid [cyan]{reply['pid']}[/]): "
+            f"[cyan]{reply['cached']}[/] cached responses, "
+            f"[cyan]{reply['hits']}[/] hits, [cyan]{reply['misses']}[/] misses."
+        )
+    else:
+        console.log("The daemon is not running.")
+
+
+@cli.command()
+@click.option("--host", type=str, default="127.0.0.1", show_default=True, help="Address to listen on.")
+@click.option("--port", type=int, default=8080, show_default=True, help="Port to listen on.")
+@click.option(
+    "--rate",
+    type=float,
+    default=5.0,
+    show_default=True,
+    help="Maximum upstream requests per second.",
+)
+@click.option(
+    "--burst",
+    type=int,
+    default=10,
+    show_default=True,
+    help="Maximum burst of upstream requests.",
+)
+@click.option(
+    "--concurrency",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Maximum concurrent upstream requests.",
+)
+@click.option(
+    "--quota",
+    type=int,
+    help="Maximum requests per client per minute (clients are told apart by X-Client-Id, or address).",
+)
+@click.option(
+    "--cache-ttl",
+    type=float,
+    default=300,
+    show_default=True,
+    help="Seconds cached responses stay valid.",
+)
+def serve(
+    host: str,
+    port: int,
+    rate: float,
+    burst: int,
+    concurrency: int,
+    quota: t.Optional[int],
+    cache_ttl: float,
+):
+    """
+    Serve a searchcode-compatible API gateway.
+
+    Point other tools at http://HOST:PORT/api instead of https://searchcode.com/api to share
+    one rate-limited client, its connections and a response cache. Per-client counters are on /stats.
+    """
+    gateway = Gateway(
+        client=sc,
+        rate=rate,
+        burst=burst,
+        max_concurrency=concurrency,
+        quota_per_minute=quota,
+        cache_ttl=cache_ttl,
+    )
+    console.log(
+        f"[bold green]✔[/bold green] Serving on [cyan]http://{host}:{port}/api[/] "
+        "(press Ctrl+C to stop)"
+    )
+    try:
+        gateway.serve(host=host, port=port)
+    except KeyboardInterrupt:
+        console.log("Stopped the gateway.")
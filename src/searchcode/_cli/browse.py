@@ -0,0 +1,210 @@
+import typing as t
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+
+import rich_click as click
+from rich.console import Group
+from rich.markup import escape
+from rich.text import Text
+
+from .highlight import TermMatcher
+from .panels import _make_result_panel, console, page_code
+from ..api import Searchcode
+
+__all__ = ["ResultBrowser"]
+
+
+class ResultBrowser:
+    """
+    Interactive, full-screen browser over the results of a search.
+
+    Only the visible rows (and the selected result's snippet) are rendered. The next page
+    and the selected result's full code file are prefetched in the background, and fetched
+    pages and files are cached, so moving around and opening files does not wait on requests.
+    Pages and files that fail to fetch are dropped from the cache (so they are fetched again),
+    and the error is shown in the status line.
+
+    Keys: j/k move, n/p next/previous page, enter opens the selected file, q quits.
+    """
+
+    def __init__(
+        self,
+        client: Searchcode,
+        query: str,
+        page: int = 0,
+        per_page: int = 50,
+        **filters,
+    ):
+        self.client = client
+        self.query = query
+        self.page = page
+        self.per_page = per_page
+        self.filters = filters
+        self.selected = 0
+        self.error: t.Optional[str] = None
+        self.__matcher = TermMatcher.from_query(query=query)
+
+        self.__executor = ThreadPoolExecutor(max_workers=4)
+        self.__pages: t.Dict[int, Future] = {}
+        self.__code: t.Dict[int, Future] = {}
+
+    def fetch_page(self, page: int) -> Future:
+        """
+        Get (or start fetching) a results page.
+        """
+        if page not in self.__pages:
+            self.__pages[page] = self.__executor.submit(
+                self.client.search,
+                query=self.query,
+                page=page,
+                per_page=self.per_page,
+                **self.filters,
+            )
+        return self.__pages[page]
+
+    def fetch_code(self, __id: int) -> Future:
+        """
+        Get (or start fetching) a code file.
+        """
+        if __id not in self.__code:
+            self.__code[__id] = self.__executor.submit(self.client.code, __id)
+        return self.__code[__id]
+
+    def get_page(self, page: int) -> t.Optional[SimpleNamespace]:
+        """
+        Wait for a results page.
+
+        :return: The page, or None if it failed to fetch (the error is kept in `error`).
+        """
+        self.fetch_page(page=page)
+        return self.__resolve(cache=self.__pages, key=page, what=f"page {page}")
+
+    def get_code(self, __id: int) -> t.Optional[SimpleNamespace]:
+        """
+        Wait for a code file.
+
+        :return: The code file, or None if it failed to fetch (the error is kept in `error`).
+        """
+        self.fetch_code(__id)
+        return self.__resolve(cache=self.__code, key=__id, what=f"code file {__id}")
+
+    def run(self):
+        """
+        Show the browser until the user quits.
+        """
+        try:
+            with console.screen() as screen:
+                self.__loop(screen=screen)
+        finally:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def __loop(self, screen):
+        while True:
+            page_future = self.fetch_page(page=self.page)
+            if not page_future.done():
+                screen.update(
+                    Text.from_markup(f"[dim]Loading page {self.page} of '{self.query}'...[/]")
+                )
+            response = self.get_page(page=self.page) or SimpleNamespace(results=[], total=0)
+            results = response.results
+            self.selected = max(0, min(self.selected, len(results) - 1))
+
+            if results and len(results) == self.per_page:
+                self.fetch_page(page=self.page + 1)
+            if results:
+                self.fetch_code(results[self.selected].id)
+
+            screen.update(self.__render(response=response))
+
+            self.error = None
+            if not self.__handle_key(screen=screen, key=click.getchar(), results=results):
+                break
+
+    def __handle_key(self, screen, key: str, results: t.List[SimpleNamespace]) -> bool:
+        """
+        (Private function) Move the selection, change pages or open the selected result.
+
+        :return: Whether to keep browsing.
+        """
+        if key in ("q", "Q", "\x1b"):
+            return False
+        elif key in ("j", "\x1b[B") and results:
+            self.selected = min(self.selected + 1, len(results) - 1)
+        elif key in ("k", "\x1b[A") and results:
+            self.selected = max(self.selected - 1, 0)
+        elif key == "n" and len(results) == self.per_page:
+            self.page += 1
+            self.selected = 0
+        elif key == "p" and self.page > 0:
+            self.page -= 1
+            self.selected = 0
+        elif key in ("\r", "\n") and results:
+            self.__open(screen=screen, result=results[self.selected])
+        return True
+
+    def __open(self, screen, result: SimpleNamespace):
+        """
+        Show the selected result's code file in the pager, from the prefetch cache if it is ready.
+        """
+        code_future = self.fetch_code(result.id)
+        if not code_future.done():
+            screen.update(Text.from_markup(f"[dim]Loading {result.filename}...[/]"))
+
+        data = self.get_code(result.id)
+        if data is None:
+            return
+        if data.code:
+            page_code(code=data.code, language=data.language, screen=screen)
+
+    def __resolve(
+        self, cache: t.Dict[int, Future], key: int, what: str
+    ) -> t.Optional[SimpleNamespace]:
+        """
+        (Private function) Wait for a cached fetch. A failed fetch is evicted, so the next
+        request for it starts a new one instead of re-raising the same error.
+        """
+        try:
+            return cache[key].result()
+        except Exception as error:
+            cache.pop(key, None)
+            self.error = f"Could not fetch {what}: {error}"
+            return None
+
+    def __render(self, response: SimpleNamespace) -> Group:
+        """
+        Render the visible rows of the results list, and the selected result's snippet.
+        """
+        results = response.results
+        rows_height = max(3, console.height // 2 - 2)
+        top = max(0, min(self.selected - rows_height // 2, len(results) - rows_height))
+
+        rows = []
+        for index in range(top, min(top + rows_height, len(results))):
+            result = results[index]
+            row = Text.from_markup(
+                f"{'➜' if index == self.selected else ' '} [bold]{result.filename}[/] "
+                f"([blue]{result.repo}[/]) {result.language} · [cyan]{result.linescount}[/] lines",
+                overflow="ellipsis",
+            )
+            row.no_wrap = True
+            if index == self.selected:
+                row.stylize("reverse")
+            rows.append(row)
+
+        header = Text.from_markup(
+            f"[bold]{self.query}[/] · page [cyan]{self.page}[/] · "
+            f"result [cyan]{self.selected + 1 if results else 0}[/] of [cyan]{len(results)}[/] "
+            f"([cyan]{response.total}[/] total)"
+        )
+        footer = (
+            Text.from_markup(f"[bold red]✘[/bold red] {escape(self.error)} [dim](any key retries)[/]")
+            if self.error
+            else Text.from_markup("[dim]j/k move · n/p page · enter open · q quit[/]")
+        )
+        preview = (
+            [_make_result_panel(item=results[self.selected], matcher=self.__matcher)]
+            if results
+            else [Text("No results.")]
+        )
+
+        return Group(header, *rows, *preview, footer)
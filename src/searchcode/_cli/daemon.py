@@ -0,0 +1,243 @@
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import typing as t
+
+from .._lib import ResponseCache, searchcode_endpoints, searchcode_home
+
+if t.TYPE_CHECKING:
+    from ..api import Searchcode
+
+__all__ = [
+    "daemon_socket_path",
+    "forward_to_daemon",
+    "run_daemon",
+    "start_daemon",
+]
+
+# Lexers for the most common languages, loaded when the daemon starts.
+_WARM_LEXERS = ("python", "c", "cpp", "java", "javascript", "go", "rust", "php", "ruby")
+
+
+def daemon_socket_path() -> str:
+    """
+    :return: Path of the daemon's Unix socket (in `$SEARCHCODE_HOME`, or `~/.searchcode`).
+    :rtype: str
+    """
+    return os.path.join(searchcode_home(), "daemon.sock")
+
+
+def forward_to_daemon(
+    command: str, params: t.Dict, timeout: float = 120
+) -> t.Optional[t.Dict]:
+    """
+    Send a command to the running daemon.
+
+    :param command: The command (`search`, `code`, `ping` or `shutdown`).
+    :type command: str
+    :param params: The command's parameters.
+    :type params: Dict
+    :param timeout: Seconds to wait for the reply.
+    :type timeout: float
+    :return: The daemon's reply, or None if no daemon is running.
+    :rtype: Optional[Dict]
+    """
+    path = daemon_socket_path()
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(timeout)
+            connection.connect(path)
+            connection.sendall(
+                json.dumps({"command": command, "params": params}).encode() + b"\n"
+            )
+            with connection.makefile("rb") as reply:
+                return json.loads(reply.readline())
+    except (OSError, ValueError):
+        return None
+
+
+class _DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, client: "Searchcode", cache: ResponseCache):
+        self.client = client
+        self.cache = cache
+        super().__init__(path, _DaemonHandler)
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    server: _DaemonServer
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            reply = self.__dispatch(request["command"], request.get("params", {}))
+        except Exception as error:
+            reply = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+    def __dispatch(self, command: str, params: t.Dict) -> t.Dict:
+        if command == "ping":
+            return {
+                "ok": True,
+                "pid": os.getpid(),
+                "cached": len(self.server.cache),
+                "hits": self.server.cache.hits,
+                "misses": self.server.cache.misses,
+            }
+        elif command == "shutdown":
+            # shutdown() waits for serve_forever() to return, so it can't run on this thread
+            threading.Thread(target=self.server.shutdown).start()
+            return {"ok": True}
+        elif command == "search":
+            return self.__search(**params)
+        elif command == "code":
+            return self.__code(**params)
+
+        raise ValueError(f"Unknown command: {command}")
+
+    def __cached(self, key: t.Tuple, fetch: t.Callable[[], t.Any]) -> t.Any:
+        value = self.server.cache.get(key)
+        if value is None:
+            value = fetch()
+            self.server.cache.set(key, value)
+        return value
+
+    def __search(
+        self,
+        width: int,
+        color_system: t.Optional[str],
+        pages: int = 1,
+        **search_params,
+    ) -> t.Dict:
+        from .highlight import TermMatcher
+        from .panels import _make_result_panel, render_offscreen
+
+        results, total = [], 0
+        page, per_page = search_params.pop("page", 0), search_params["per_page"]
+        for current_page in range(page, page + pages):
+            response = self.__cached(
+                key=("search", current_page, json.dumps(search_params, sort_keys=True)),
+                fetch=lambda: self.server.client.search(page=current_page, **search_params),
+            )
+            results.extend(response.results)
+            total = response.total
+            if len(response.results) < per_page or len(results) >= total:
+                break
+
+        matcher = TermMatcher.from_query(query=search_params["query"])
+        return {
+            "ok": True,
+            "count": len(results),
+            "total": total,
+            "output": render_offscreen(
+                renderables=[
+                    _make_result_panel(item=result, matcher=matcher) for result in results
+                ],
+                width=width,
+                color_system=color_system,
+            ),
+        }
+
+    def __code(self, id: int, width: int, color_system: t.Optional[str]) -> t.Dict:
+        from .panels import _make_syntax, _make_syntax_panel, render_offscreen
+
+        data = self.__cached(key=("code", id), fetch=lambda: self.server.client.code(id))
+        if not data.code:
+            return {"ok": True, "found": False, "output": ""}
+
+        syntax = _make_syntax(data.code, data.language, line_numbers=True)
+        return {
+            "ok": True,
+            "found": True,
+            "output": render_offscreen(
+                renderables=[_make_syntax_panel(syntax)],
+                width=width,
+                color_system=color_system,
+            ),
+        }
+
+
+def run_daemon(path: t.Optional[str] = None, cache_ttl: float = 300):
+    """
+    Run the daemon in the foreground until it is sent `shutdown`.
+
+    Keeps one Searchcode client (and its connection pool), a response cache and
+    the lexers of common languages warm for every `sc` call forwarded to it.
+
+    :param path: Path of the Unix socket to listen on (defaults to `daemon_socket_path()`).
+    :type path: Optional[str]
+    :param cache_ttl: Seconds cached responses stay valid.
+    :type cache_ttl: float
+    """
+    from pygments.lexers import get_lexer_by_name
+
+    from .. import __pkg__
+    from ..api import Searchcode
+
+    path = path or daemon_socket_path()
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+
+    for name in _WARM_LEXERS:
+        get_lexer_by_name(name)
+
+    client = Searchcode(
+        user_agent=f"{__pkg__}-sdk/__daemon", endpoints=searchcode_endpoints()
+    )
+    # create the socket owner-only; a chmod after bind() would leave a window for other users to connect
+    umask = os.umask(0o177)
+    try:
+        server = _DaemonServer(path=path, client=client, cache=ResponseCache(ttl=cache_ttl))
+    finally:
+        os.umask(umask)
+
+    try:
+        with server:
+            server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def start_daemon(cache_ttl: float = 300, timeout: float = 10) -> t.Optional[int]:
+    """
+    Start the daemon in a background process, and wait until it answers.
+
+    :param cache_ttl: Seconds cached responses stay valid.
+    :type cache_ttl: float
+    :param timeout: Seconds to wait for the daemon to come up.
+    :type timeout: float
+    :return: The daemon's process id, or None if it did not come up in time.
+    :rtype: Optional[int]
+    """
+    subprocess.Popen(
+        [sys.executable, "-m", "searchcode._cli.daemon", str(cache_ttl)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        reply = forward_to_daemon(command="ping", params={}, timeout=1)
+        if reply:
+            return reply["pid"]
+        time.sleep(0.1)
+
+    return None
+
+
+if __name__ == "__main__":
+    run_daemon(cache_ttl=float(sys.argv[1]) if len(sys.argv) > 1 else 300)
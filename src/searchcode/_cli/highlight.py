@@ -0,0 +1,96 @@
+import re
+import typing as t
+
+from rich.style import Style
+
+from ..index import parse_query
+
+__all__ = ["HIGHLIGHT_STYLE", "TermMatcher", "query_terms"]
+
+HIGHLIGHT_STYLE = Style.parse("bold #282a36 on #f1fa8c")
+
+_OPERATORS = {"AND", "OR", "NOT"}
+
+
+def query_terms(query: str) -> t.List[str]:
+    """
+    Get the terms of a query worth highlighting: its words, without `lang:`, `repo:` and `ext:`
+    filters, boolean operators or quotes.
+
+    :param query: The query, in searchcode's query syntax.
+    :type query: str
+    :return: The terms.
+    :rtype: List[str]
+    """
+    terms, _ = parse_query(query=query)
+    return [
+        term.strip("\"'")
+        for term in terms
+        if term not in _OPERATORS and term.strip("\"'")
+    ]
+
+
+class TermMatcher:
+    """
+    Finds every occurrence of any of a set of terms in a single pass over a text, with one
+    compiled regex of all the terms, so the cost of matching a line doesn't grow with the number of terms.
+
+    Matches are returned as merged spans, ready to be highlighted.
+    """
+
+    def __init__(self, terms: t.Iterable[str], ignore_case: bool = True):
+        """
+        :param terms: The terms to find.
+        :type terms: Iterable[str]
+        :param ignore_case: Whether to match case-insensitively.
+        :type ignore_case: bool
+        """
+        self.ignore_case = ignore_case
+        self.terms = sorted({term.lower() if ignore_case else term for term in terms if term})
+
+        # longest first, inside a lookahead: the longest term starting at each position is found,
+        # even where it overlaps a match that started earlier
+        alternation = "|".join(map(re.escape, sorted(self.terms, key=len, reverse=True)))
+        self.__pattern = (
+            re.compile(f"(?=({alternation}))", re.IGNORECASE if ignore_case else 0)
+            if self.terms
+            else None
+        )
+
+    @classmethod
+    def from_query(cls, query: str) -> t.Optional["TermMatcher"]:
+        """
+        :param query: The query, in searchcode's query syntax.
+        :type query: str
+        :return: A matcher for the query's terms, or None if it has none.
+        :rtype: Optional[TermMatcher]
+        """
+        terms = query_terms(query=query)
+        return cls(terms=terms) if terms else None
+
+    def __bool__(self) -> bool:
+        return bool(self.terms)
+
+    def find(self, text: str, start: int = 0) -> t.List[t.Tuple[int, int]]:
+        """
+        Find the spans of text covered by the terms.
+
+        :param text: The text to search.
+        :type text: str
+        :param start: Index to start searching at.
+        :type start: int
+        :return: Sorted, non-overlapping (start, end) spans; overlapping and adjacent matches are merged.
+        :rtype: List[Tuple[int, int]]
+        """
+        if self.__pattern is None:
+            return []
+
+        spans: t.List[t.List[int]] = []
+        for match in self.__pattern.finditer(text, start):
+            begin, end = match.span(1)
+            if spans and begin <= spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([begin, end])
+
+        return [(begin, end) for begin, end in spans]
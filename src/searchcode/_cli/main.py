@@ -0,0 +1,133 @@
+import os
+import sys
+import typing as t
+
+from .daemon import daemon_socket_path, forward_to_daemon
+from .._lib import clear_screen
+
+__all__ = ["main"]
+
+# the options of `sc search` the daemon handles, with the types of their values
+_SEARCH_OPTIONS = {
+    "--page": int,
+    "--pages": int,
+    "--per-page": int,
+    "--languages": str,
+    "--sources": str,
+    "--lines-of-code-lt": int,
+    "--lines-of-code-gt": int,
+}
+
+
+def main():
+    """
+    Entry point of `sc`.
+
+    Plain `sc search` and `sc code` calls are handed to the daemon (see `sc daemon`), if it runs,
+    before the CLI and its dependencies are imported; everything else runs the CLI.
+    """
+    if not _forward(args=sys.argv[1:]):
+        from .app import cli
+
+        cli()
+
+
+def _forward(args: t.List[str]) -> bool:
+    """
+    Hand a command to the daemon, and print its output.
+
+    :return: Whether the daemon handled the command.
+    """
+    request = _parse_daemon_request(args=args)
+    if request is None or not os.path.exists(daemon_socket_path()):
+        return False
+
+    from rich.console import Console
+
+    from .. import __pkg__, __version__
+
+    command, params = request
+    console = Console(highlight=True, log_time=False)
+    reply = forward_to_daemon(
+        command=command,
+        params={**params, "width": console.width, "color_system": console.color_system},
+    )
+    if not reply or not reply["ok"]:
+        return False
+
+    clear_screen()
+    title = params["query"] if command == "search" else str(params["id"])
+    console.set_window_title(f"{__pkg__.capitalize()} v{__version__} - {title}")
+    if command == "code" and reply["found"]:
+        console.file.write(reply["output"])
+    elif command == "code":
+        console.log(
+            f"[bold yellow]✘[/bold yellow] No matching file found: [bold yellow]{params['id']}[/bold yellow]."
+        )
+    elif reply["count"]:
+        console.log(f"Showing {reply['count']} of {reply['total']} results for '{params['query']}'")
+        console.file.write(reply["output"])
+    else:
+        console.log(
+            f"[bold yellow]✘[/bold yellow] No results found for [bold yellow]{params['query']}[/bold yellow]."
+        )
+
+    return True
+
+
+def _parse_daemon_request(args: t.List[str]) -> t.Optional[t.Tuple[str, t.Dict]]:
+    """
+    Parse `sc search QUERY [OPTIONS]` (with only the options in `_SEARCH_OPTIONS`) and `sc code ID`.
+
+    :return: Tuple of (command, params) for the daemon, or None if the daemon can't handle the arguments.
+    """
+    if len(args) == 2 and args[0] == "code":
+        return ("code", {"id": int(args[1])}) if args[1].isdigit() else None
+    if not args or args[0] != "search":
+        return None
+
+    params = _parse_search_args(args=args[1:])
+    if params is None:
+        return None
+
+    params["pages"] = max(1, min(params["pages"], 5))
+    for name in ("languages", "sources"):
+        params[name] = params[name].split(",") if params[name] else None
+    return "search", params
+
+
+def _parse_search_args(args: t.List[str]) -> t.Optional[t.Dict]:
+    """
+    Parse the query and options of `sc search`.
+
+    :return: The search params, or None if the arguments have no query, more than one, or an option not in `_SEARCH_OPTIONS`.
+    """
+    # the defaults of `sc search`
+    params = {
+        "query": None,
+        "page": 0,
+        "pages": 1,
+        "per_page": 50,
+        "languages": None,
+        "sources": None,
+        "lines_of_code_lt": None,
+        "lines_of_code_gt": None,
+    }
+    remaining = iter(args)
+    for arg in remaining:
+        if not arg.startswith("-"):
+            if params["query"] is not None:
+                return None
+            params["query"] = arg
+            continue
+
+        name, equals, value = arg.partition("=")
+        value = value if equals else next(remaining, None)
+        if name not in _SEARCH_OPTIONS or value is None:
+            return None
+        try:
+            params[name[2:].replace("-", "_")] = _SEARCH_OPTIONS[name](value)
+        except ValueError:
+            return None
+
+    return params if params["query"] is not None else None
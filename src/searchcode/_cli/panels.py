@@ -1,25 +1,40 @@
+import io
+import itertools
 import typing as t
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from types import SimpleNamespace
 
-from rich.console import Group, Console
+import rich_click as click
+from rich.console import Group, Console, ScreenContext
 from rich.panel import Panel
 from rich.rule import Rule
 from rich.syntax import Syntax
 from rich.text import Text
 
+from .highlight import HIGHLIGHT_STYLE, TermMatcher
+from .._lib import LineMap, memory_phase
+
 console = Console(highlight=True, log_time=False)
 
 
-def _extract_code_string_with_linenumbers(lines_dict: t.Dict[str, str]) -> str:
+def _extract_code_string_with_linenumbers(
+    lines_dict: t.Union[t.Dict[str, str], LineMap],
+) -> str:
     """
     Convert a dictionary of line_number: code_line into a single
     multiline string sorted by line number.
 
     Each line is right-aligned to maintain visual alignment in output.
+    A LineMap already holds this string, so it is returned as is.
 
-    :param lines_dict: Dictionary where keys are line numbers (as strings) and values are lines of code.
+    :param lines_dict: Dictionary where keys are line numbers (as strings) and values are lines of code,
+      or a LineMap.
     :return: Multiline string with original line numbers included.
     """
+    if isinstance(lines_dict, LineMap):
+        return lines_dict.numbered_text
+
     sorted_lines = sorted(lines_dict.items(), key=lambda x: int(x[0]))
     numbered_lines = [
         f"{line_no.rjust(4)} {line.rstrip()}" for line_no, line in sorted_lines
@@ -40,14 +55,13 @@ def _make_syntax(code: str, language: str, **syntax_kwargs) -> Syntax:
     :return: A rich Syntax object for displaying code.
     :rtype: Syntax
     """
-    return Syntax(
-        code=code,
-        lexer=language,
-        theme="dracula",
-        word_wrap=True,
-        indent_guides=True,
+    options = {
+        "theme": "dracula",
+        "word_wrap": True,
+        "indent_guides": True,
         **syntax_kwargs,
-    )
+    }
+    return Syntax(code=code, lexer=language, **options)
 
 
 def _make_syntax_panel(
@@ -76,8 +90,166 @@ def _make_syntax_panel(
     return Panel(renderable=content, border_style="#444444", title_align="left")
 
 
+def _highlight_matches(syntax: Syntax, code_string: str, matcher: TermMatcher):
+    """
+    Style the spans of a numbered snippet that match the query terms (not the line numbers).
+
+    :param syntax: The Syntax object rendering the snippet.
+    :type syntax: Syntax
+    :param code_string: The snippet, as returned by `_extract_code_string_with_linenumbers`.
+    :type code_string: str
+    :param matcher: Matcher of the query terms.
+    :type matcher: TermMatcher
+    """
+    for line_number, line in enumerate(code_string.split("\n"), start=1):
+        # Syntax expands tabs before it applies the ranges, so the columns must be counted the same way
+        line = line.expandtabs(syntax.tab_size)
+        # skip the right-aligned line number and the space after it
+        code_start = line.find(" ", len(line) - len(line.lstrip(" "))) + 1
+        if not code_start:
+            continue
+        for start, end in matcher.find(line, start=code_start):
+            syntax.stylize_range(
+                HIGHLIGHT_STYLE, start=(line_number, start), end=(line_number, end)
+            )
+
+
+def _make_result_panel(
+    item: SimpleNamespace, matcher: t.Optional[TermMatcher] = None
+) -> Panel:
+    """
+    Create the Panel for a single search result.
+
+    :param item: A search result with fields `filename`, `repo`, `language`, `linescount`, `lines`.
+    :type item: SimpleNamespace
+    :param matcher: Optional matcher of the query terms to highlight in the snippet.
+    :type matcher: Optional[TermMatcher]
+    :return: A rich Panel with the result's header and highlighted snippet.
+    :rtype: Panel
+    """
+    lines = item.lines
+    code_string = _extract_code_string_with_linenumbers(
+        lines_dict=lines if isinstance(lines, LineMap) else lines.__dict__
+    )
+
+    syntax = _make_syntax(code=code_string, language=item.language)
+    if matcher:
+        _highlight_matches(syntax=syntax, code_string=code_string, matcher=matcher)
+
+    header_text = (
+        f"[bold]{item.filename}[/] ([blue]{item.repo}[/]) "
+        f"{item.language} · [cyan]{item.linescount}[/] lines"
+    )
+
+    return _make_syntax_panel(syntax=syntax, header_text=header_text, add_divider=True)
+
+
+def render_offscreen(
+    renderables: t.Iterable[t.Any], width: int, color_system: t.Optional[str]
+) -> str:
+    """
+    Render renderables to a string, as the console would print them.
+
+    :param renderables: The renderables to render.
+    :type renderables: Iterable[Any]
+    :param width: Console width to render at.
+    :type width: int
+    :param color_system: Color system to render with (e.g., `truecolor`), or None for no color.
+    :type color_system: Optional[str]
+    :return: The rendered (ANSI) output.
+    :rtype: str
+    """
+    file = io.StringIO()
+    offscreen = Console(
+        file=file,
+        width=width,
+        color_system=color_system,
+        force_terminal=color_system is not None,
+        highlight=True,
+    )
+    for renderable in renderables:
+        offscreen.print(renderable)
+
+    return file.getvalue()
+
+
+def _render_result_panels(
+    items: t.List[SimpleNamespace],
+    width: int,
+    color_system: t.Optional[str],
+    matcher: t.Optional[TermMatcher] = None,
+) -> str:
+    """
+    (Worker function) Render search result panels to an ANSI string.
+
+    :param items: The search results to render.
+    :type items: List[SimpleNamespace]
+    :param width: Console width to render at.
+    :type width: int
+    :param color_system: Color system to render with (e.g., `truecolor`), or None for no color.
+    :type color_system: Optional[str]
+    :param matcher: Optional matcher of the query terms to highlight.
+    :type matcher: Optional[TermMatcher]
+    :return: The rendered panels.
+    :rtype: str
+    """
+    return render_offscreen(
+        renderables=[_make_result_panel(item=item, matcher=matcher) for item in items],
+        width=width,
+        color_system=color_system,
+    )
+
+
+def render_panels(
+    data: t.Iterable[SimpleNamespace],
+    processes: int,
+    chunk_size: int = 16,
+    matcher: t.Optional[TermMatcher] = None,
+) -> t.Iterator[str]:
+    """
+    Render search result panels in a pool of worker processes.
+
+    Pygments lexing is CPU-bound, so rendering large result sets scales with cores this way.
+    Panels are rendered at the console's current width and color system, in chunks of
+    `chunk_size` results, and yielded in result order. Results are read lazily, and at most
+    twice as many chunks as processes are in flight, so (e.g., spilled) result sets are never
+    all held in memory.
+
+    :param data: The search results to render.
+    :type data: Iterable[SimpleNamespace]
+    :param processes: Number of worker processes.
+    :type processes: int
+    :param chunk_size: Number of results each worker renders at a time.
+    :type chunk_size: int
+    :param matcher: Optional matcher of the query terms to highlight.
+    :type matcher: Optional[TermMatcher]
+    :return: An iterator over the rendered (ANSI) chunks, in order.
+    :rtype: Iterator[str]
+    """
+    items = iter(data)
+    width, color_system = console.width, console.color_system
+    pending: t.Deque[Future] = deque()
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        try:
+            for chunk in iter(lambda: list(itertools.islice(items, chunk_size)), []):
+                pending.append(
+                    executor.submit(
+                        _render_result_panels, chunk, width, color_system, matcher
+                    )
+                )
+                if len(pending) >= processes * 2:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
 def print_panels(
-    data: t.Union[t.List[SimpleNamespace], SimpleNamespace, str], **kwargs
+    data: t.Union[t.Iterable[SimpleNamespace], SimpleNamespace, str], **kwargs
 ):
     """
     Print panels for displaying code or structured file information.
@@ -89,50 +261,139 @@ def print_panels(
 
     :param data: The input data to display as panels.
     :type data: Union[List[SimpleNamespace], SimpleNamespace, str]
-    :param kwargs: Additional optional keyword arguments (e.g., id for logging).
+    :param kwargs: Additional optional keyword arguments (e.g., id for logging,
+      start_line for a sliced code file, processes to render a list of results
+      in that many worker processes, highlight to highlight a query's terms in
+      a list of results, or matcher to highlight them with a TermMatcher built once,
+      e.g., for every result of a stream).
     :type kwargs: Any
     """
-    panels: t.List[Panel] = []
+    with memory_phase("panels"):
+        panels: t.List[Panel] = []
+        matcher = kwargs.get("matcher") or (
+            TermMatcher.from_query(query=kwargs["highlight"])
+            if kwargs.get("highlight")
+            else None
+        )
 
-    if isinstance(data, SimpleNamespace):
-        code = data.code
-        language = data.language
-        if code:
-            syntax = _make_syntax(code, language, line_numbers=True)
+        if isinstance(data, SimpleNamespace):
+            code = data.code
+            language = data.language
+            if code:
+                syntax = _make_syntax(
+                    code,
+                    language,
+                    line_numbers=True,
+                    start_line=kwargs.get("start_line", 1),
+                )
+                panel = _make_syntax_panel(syntax)
+                panels.append(panel)
+            else:
+                console.log(
+                    f"[bold yellow]✘[/bold yellow] No matching file found: [bold yellow]{kwargs.get('id')}[/bold yellow]."
+                )
+                return
+        elif isinstance(data, str):
+            syntax = _make_syntax(data, "text", line_numbers=True)
             panel = _make_syntax_panel(syntax)
             panels.append(panel)
+        elif kwargs.get("processes"):
+            for rendered in render_panels(
+                data=data, processes=kwargs["processes"], matcher=matcher
+            ):
+                console.file.write(rendered)
         else:
-            console.log(
-                f"[bold yellow]✘[/bold yellow] No matching file found: [bold yellow]{kwargs.get('id')}[/bold yellow]."
-            )
-            return
-    elif isinstance(data, str):
-        syntax = _make_syntax(data, "text", line_numbers=True)
-        panel = _make_syntax_panel(syntax)
-        panels.append(panel)
-    else:
-        for item in data:
-            filename = item.filename
-            repo = item.repo
-            language = item.language
-            lines_count = item.linescount
-            lines = item.lines
-
-            code_string = _extract_code_string_with_linenumbers(
-                lines_dict=lines.__dict__
-            )
+            for item in data:
+                # print as we go, so panels for large (or spilled) result sets are not all kept in memory
+                console.print(_make_result_panel(item=item, matcher=matcher))
 
-            syntax = _make_syntax(code=code_string, language=language)
+        console.print(*panels)
 
-            header_text = (
-                f"[bold]{filename}[/] ([blue]{repo}[/]) "
-                f"{language} · [cyan]{lines_count}[/] lines"
-            )
 
-            panel = _make_syntax_panel(
-                syntax=syntax, header_text=header_text, add_divider=True
+def slice_code_lines(
+    code: str, start: t.Optional[int] = None, end: t.Optional[int] = None
+) -> t.Tuple[str, int]:
+    """
+    Cut an inclusive, 1-based range of lines out of a code string.
+
+    :param code: The full source code.
+    :type code: str
+    :param start: First line to keep (defaults to the first line).
+    :type start: Optional[int]
+    :param end: Last line to keep (defaults to the last line).
+    :type end: Optional[int]
+    :return: Tuple of (sliced code, line number of the first kept line).
+    :rtype: Tuple[str, int]
+    """
+    start = max(1, start or 1)
+    lines = code.splitlines()[start - 1 : end]
+    return "\n".join(lines), start
+
+
+def page_code(
+    code: str,
+    language: str,
+    start_line: int = 1,
+    screen: t.Optional[ScreenContext] = None,
+):
+    """
+    Show code in a full-screen pager that only highlights the visible window.
+
+    Only the lines that fit on the screen are passed to Syntax, so scrolling through
+    multi-megabyte files costs the same as rendering a single screen.
+
+    Keys: j/k (or enter/backspace) scroll a line, space/b scroll a page,
+    g/G jump to the top/bottom, q quits.
+
+    :param code: The source code to page through.
+    :type code: str
+    :param language: The programming language lexer to use.
+    :type language: str
+    :param start_line: Line number of the first line in `code`.
+    :type start_line: int
+    :param screen: An already open `console.screen()` to draw on (a new one is opened if None).
+    :type screen: Optional[ScreenContext]
+    """
+    if screen is None:
+        with console.screen() as screen:
+            return page_code(
+                code=code, language=language, start_line=start_line, screen=screen
             )
 
-            panels.append(panel)
+    lines = code.splitlines()
+    top = 0
+
+    while True:
+        height = max(1, console.height - 3)  # panel borders + footer
+        last_top = max(0, len(lines) - height)
+        top = max(0, min(top, last_top))
+
+        window = "\n".join(lines[top : top + height])
+        syntax = _make_syntax(
+            window,
+            language,
+            line_numbers=True,
+            start_line=start_line + top,
+            word_wrap=False,
+        )
+        footer = Text.from_markup(
+            f"[dim]lines {start_line + top}-{start_line + min(top + height, len(lines)) - 1} "
+            f"of {start_line + len(lines) - 1} · j/k line · space/b page · g/G top/bottom · q quit[/]"
+        )
+        screen.update(Group(_make_syntax_panel(syntax), footer))
 
-    console.print(*panels)
+        key = click.getchar()
+        if key in ("q", "Q", "\x1b"):
+            break
+        elif key in ("j", "\r", "\n"):
+            top += 1
+        elif key in ("k", "\x7f", "\x08"):
+            top -= 1
+        elif key == " ":
+            top += height
+        elif key == "b":
+            top -= height
+        elif key == "g":
+            top = 0
+        elif key == "G":
+            top = last_top
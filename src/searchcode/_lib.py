@@ -1,9 +1,135 @@
+import contextlib
 import os
+import pickle
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from array import array
+from bisect import bisect_left
 import subprocess
+import tempfile
 import typing as t
 from types import SimpleNamespace
 
 
+class LineMap:
+    """
+    Compact representation of a search result's snippet `lines`.
+
+    Built once when a response is decoded: line numbers are kept as a sorted integer array,
+    alongside a list of the (right-stripped) lines, and the numbered text used for rendering
+    is built on first use and then cached.
+
+    Attribute access by line number (`lines.__dict__`, `getattr(lines, "12")`) still works,
+    for code written against the previous SimpleNamespace representation.
+    """
+
+    __slots__ = ("numbers", "lines", "_numbered_text")
+
+    def __init__(self, numbers: t.Iterable[int], lines: t.Iterable[str]):
+        """
+        :param numbers: Sorted line numbers.
+        :type numbers: Iterable[int]
+        :param lines: The lines, in the same order as `numbers`.
+        :type lines: Iterable[str]
+        """
+        self.numbers = array("l", numbers)
+        self.lines = list(lines)
+        self._numbered_text: t.Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, lines_dict: t.Dict[str, str]) -> "LineMap":
+        """
+        Build a LineMap from the API's `{"line number": "line"}` mapping.
+
+        :param lines_dict: Dictionary where keys are line numbers (as strings) and values are lines of code.
+        :type lines_dict: Dict[str, str]
+        :return: The LineMap.
+        :rtype: LineMap
+        """
+        items = sorted((int(number), line) for number, line in lines_dict.items())
+        return cls(
+            numbers=(number for number, _ in items), lines=(line for _, line in items)
+        )
+
+    @property
+    def numbered_text(self) -> str:
+        """
+        The lines as a single multiline string, each prefixed with its right-aligned line number.
+        """
+        if self._numbered_text is None:
+            self._numbered_text = "\n".join(
+                f"{str(number).rjust(4)} {line.rstrip()}"
+                for number, line in zip(self.numbers, self.lines)
+            )
+        return self._numbered_text
+
+    def ranges(self) -> t.List[t.Tuple[int, int]]:
+        """
+        Get the contiguous runs of line numbers.
+
+        :return: List of inclusive (first, last) line number ranges.
+        :rtype: List[Tuple[int, int]]
+        """
+        ranges = []
+        for number in self.numbers:
+            if ranges and number == ranges[-1][1] + 1:
+                ranges[-1] = (ranges[-1][0], number)
+            else:
+                ranges.append((number, number))
+        return ranges
+
+    def get(self, number: int, default: t.Optional[str] = None) -> t.Optional[str]:
+        """
+        :param number: A line number.
+        :type number: int
+        :param default: Value to return if the line is not in the snippet.
+        :type default: Optional[str]
+        :return: The line with that number.
+        :rtype: Optional[str]
+        """
+        index = bisect_left(self.numbers, number)
+        if index < len(self.numbers) and self.numbers[index] == number:
+            return self.lines[index]
+        return default
+
+    def to_dict(self) -> t.Dict[str, str]:
+        """
+        :return: The lines in the API's `{"line number": "line"}` form.
+        :rtype: Dict[str, str]
+        """
+        return {str(number): line for number, line in zip(self.numbers, self.lines)}
+
+    @property
+    def __dict__(self) -> t.Dict[str, str]:
+        return self.to_dict()
+
+    def items(self) -> t.Iterator[t.Tuple[int, str]]:
+        return zip(self.numbers, self.lines)
+
+    def __getattr__(self, name: str) -> str:
+        if name.isdigit():
+            line = self.get(int(name))
+            if line is not None:
+                return line
+        raise AttributeError(name)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __eq__(self, other: t.Any) -> bool:
+        if not isinstance(other, LineMap):
+            return NotImplemented
+        return self.numbers == other.numbers and self.lines == other.lines
+
+    def __reduce__(self):
+        return LineMap, (self.numbers, self.lines)
+
+    def __repr__(self) -> str:
+        return f"LineMap({self.to_dict()!r})"
+
+
 def namespace_to_dict(
     obj: t.Union[SimpleNamespace, t.List[SimpleNamespace]],
 ) -> t.Union[t.Dict, t.List[t.Dict], SimpleNamespace, t.List[SimpleNamespace]]:
@@ -17,6 +143,8 @@ def namespace_to_dict(
     """
     if isinstance(obj, SimpleNamespace):
         return {key: namespace_to_dict(value) for key, value in vars(obj).items()}
+    elif isinstance(obj, LineMap):
+        return obj.to_dict()
     elif isinstance(obj, list):
         return [namespace_to_dict(item) for item in obj]
     elif isinstance(obj, dict):
@@ -47,6 +175,300 @@ def dict_to_namespace(
         return obj
 
 
+def decode_search_response(obj: t.Dict) -> SimpleNamespace:
+    """
+    Convert a search API response into a SimpleNamespace, with each result's `lines` as a LineMap.
+
+    :param obj: The search response (or a single search result).
+    :type obj: Dict
+    :return: The decoded response.
+    :rtype: SimpleNamespace
+    """
+    results = obj.get("results") if "results" in obj else [obj]
+    for result in results or []:
+        if isinstance(result, dict) and isinstance(result.get("lines"), dict):
+            result["lines"] = LineMap.from_dict(result["lines"])
+
+    return dict_to_namespace(obj=obj)
+
+
+def snippet_lines(result: SimpleNamespace) -> t.List[str]:
+    """
+    Get a search result's snippet lines, ordered by line number.
+
+    :param result: The search result.
+    :type result: SimpleNamespace
+    :return: The snippet lines.
+    :rtype: List[str]
+    """
+    lines = getattr(result, "lines", None)
+    if lines is None:
+        return []
+    elif isinstance(lines, LineMap):
+        return lines.lines
+
+    items = lines.items() if isinstance(lines, dict) else vars(lines).items()
+    return [line for _, line in sorted(items, key=lambda item: int(item[0]))]
+
+
+class SpillableList:
+    """
+    An append-only, list-like container that keeps at most `max_in_memory` items in memory.
+
+    Once that many items are buffered, they are pickled to an anonymous temporary file and
+    dropped from memory. Iteration yields every item in insertion order (reading spilled
+    items back one at a time), and `len()` counts spilled and buffered items.
+    """
+
+    def __init__(self, max_in_memory: int = 1000):
+        """
+        :param max_in_memory: Maximum number of items to keep in memory.
+        :type max_in_memory: int
+        """
+        self.max_in_memory = max(1, max_in_memory)
+        self.spilled = 0
+        self.__buffer: t.List = []
+        self.__file: t.Optional[t.BinaryIO] = None
+
+    def append(self, item: t.Any):
+        self.__buffer.append(item)
+        if len(self.__buffer) >= self.max_in_memory:
+            self.__spill()
+
+    def extend(self, items: t.Iterable):
+        for item in items:
+            self.append(item)
+
+    def close(self):
+        """
+        Delete the temporary file (if any) and drop every item.
+        """
+        if self.__file:
+            self.__file.close()
+            self.__file = None
+        self.__buffer = []
+        self.spilled = 0
+
+    def __enter__(self) -> "SpillableList":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.spilled + len(self.__buffer)
+
+    def __iter__(self) -> t.Iterator:
+        if self.__file:
+            self.__file.seek(0)
+            unpickler = pickle.Unpickler(self.__file)
+            for _ in range(self.spilled):
+                yield unpickler.load()
+            self.__file.seek(0, os.SEEK_END)
+
+        yield from self.__buffer
+
+    def __spill(self):
+        """
+        (Private function) Move the buffered items to the temporary file.
+        """
+        if self.__file is None:
+            self.__file = tempfile.TemporaryFile(prefix="searchcode-")
+
+        for item in self.__buffer:
+            pickle.dump(item, self.__file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled += len(self.__buffer)
+        self.__buffer = []
+
+
+class ResponseCache:
+    """
+    A thread-safe, size-bounded LRU cache whose entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300):
+        """
+        :param max_entries: Maximum number of entries (least recently used are evicted first).
+        :type max_entries: int
+        :param ttl: Seconds an entry stays valid.
+        :type ttl: float
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries: t.OrderedDict[t.Hashable, t.Tuple[float, t.Any]] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key: t.Hashable, default: t.Any = None) -> t.Any:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.__entries.pop(key, None)
+                self.misses += 1
+                return default
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: t.Hashable, value: t.Any):
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+class MemoryReport:
+    """
+    Reports the peak and retained memory of named phases (e.g., HTTP body, JSON decode), using tracemalloc.
+
+    While a report is running, `memory_phase(name)` blocks on the thread that started it are measured;
+    otherwise they do nothing. A phase entered several times (e.g., once per page) is aggregated:
+    its peak is the highest of any call, and its retained memory and allocation sites are summed.
+    Phases can be nested; a phase's peak includes the peaks of the phases nested in it.
+    """
+
+    def __init__(self, top: int = 3):
+        """
+        :param top: Number of allocation sites to report per phase (by memory retained).
+        :type top: int
+        """
+        self.top = top
+        self.phases: t.Dict[str, SimpleNamespace] = {}
+        self.__thread: t.Optional[int] = None
+        # Per open phase: [traced memory at entry, highest peak seen inside it, snapshot at entry]
+        self.__stack: t.List[t.List] = []
+
+    def start(self):
+        """
+        Start tracing allocations, and measuring phases.
+        """
+        global _memory_report
+        tracemalloc.start()
+        self.__thread = threading.get_ident()
+        _memory_report = self
+
+    def stop(self):
+        """
+        Stop tracing allocations.
+        """
+        global _memory_report
+        _memory_report = None
+        tracemalloc.stop()
+
+    def __enter__(self) -> "MemoryReport":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> t.Iterator[None]:
+        """
+        Measure a phase.
+
+        :param name: Name of the phase.
+        :type name: str
+        """
+        if threading.get_ident() != self.__thread or not tracemalloc.is_tracing():
+            yield
+            return
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self.__stack:
+            # the peak is reset for this phase, so carry the enclosing phase's peak so far
+            self.__stack[-1][1] = max(self.__stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        self.__stack.append([current, current, self.__snapshot()])
+        try:
+            yield
+        finally:
+            started, highest, snapshot = self.__stack.pop()
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, highest)
+            if self.__stack:
+                self.__stack[-1][1] = max(self.__stack[-1][1], peak)
+
+            phase = self.phases.setdefault(
+                name, SimpleNamespace(calls=0, peak=0, retained=0, sites=Counter())
+            )
+            phase.calls += 1
+            phase.peak = max(phase.peak, peak - started)
+            phase.retained += current - started
+            for statistic in self.__snapshot().compare_to(snapshot, "lineno"):
+                if statistic.size_diff > 0:
+                    frame = statistic.traceback[0]
+                    # keep the package (or parent directory) and file name, e.g. json/decoder.py
+                    filename = os.path.join(
+                        os.path.basename(os.path.dirname(frame.filename)),
+                        os.path.basename(frame.filename),
+                    )
+                    phase.sites[f"{filename}:{frame.lineno}"] += statistic.size_diff
+
+    @staticmethod
+    def __snapshot() -> tracemalloc.Snapshot:
+        """
+        (Private function) Take a snapshot of traced allocations, leaving out tracemalloc's own.
+        """
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            )
+        )
+
+
+_memory_report: t.Optional[MemoryReport] = None
+_NO_PHASE = contextlib.nullcontext()
+
+
+def memory_phase(name: str) -> t.ContextManager:
+    """
+    Measure a phase in the running MemoryReport, if there is one (otherwise, this does nothing).
+
+    :param name: Name of the phase (e.g., `http body`).
+    :type name: str
+    :return: A context manager around the phase.
+    :rtype: ContextManager
+    """
+    report = _memory_report
+    return report.phase(name) if report is not None else _NO_PHASE
+
+
+def searchcode_home() -> str:
+    """
+    Get the directory searchcode keeps local data in: `$SEARCHCODE_HOME`, or `~/.searchcode`.
+
+    :return: Path of the directory.
+    :rtype: str
+    """
+    return os.environ.get("SEARCHCODE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".searchcode"
+    )
+
+
+def searchcode_endpoints() -> t.Optional[t.List[str]]:
+    """
+    Get the API endpoints configured in `$SEARCHCODE_ENDPOINTS` (a comma-separated list of base URLs).
+
+    :return: List of base URLs, or None if none are configured.
+    :rtype: Optional[List[str]]
+    """
+    endpoints = os.environ.get("SEARCHCODE_ENDPOINTS", "")
+    return [endpoint.strip() for endpoint in endpoints.split(",") if endpoint.strip()] or None
+
+
 def update_window_title(text: str):
     """
     Update the current window title with the specified text.
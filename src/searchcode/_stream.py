@@ -0,0 +1,162 @@
+import codecs
+import json
+import re
+import typing as t
+
+# an opening bracket, a closing bracket, a whole string, or the quote of a string that isn't complete yet
+_TOKENS = re.compile(r'([{\[])|([}\]])|("[^"\\]*(?:\\.[^"\\]*)*")|"')
+_OPEN, _CLOSE, _STRING = 1, 2, 3
+_STRING_SPECIAL_CHARS = re.compile(r'["\\]')
+
+
+class _ArrayItemScanner:
+    """
+    Incrementally scans JSON text for the array stored under a top-level key,
+    and returns each of its object items as soon as the item is complete.
+
+    Only structural characters are inspected (by regex), and only the text of
+    the item currently being received is kept in the buffer.
+    """
+
+    def __init__(self, key: str):
+        self.key_token = json.dumps(key)
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.string_start = 0
+        self.last_string: t.Optional[str] = None
+        self.in_array = False
+        self.item_start: t.Optional[int] = None
+        self.done = False
+
+    def feed(self, text: str) -> t.List[t.Any]:
+        """
+        Feed the next piece of JSON text into the scanner.
+
+        :param text: The next piece of the JSON document.
+        :type text: str
+        :return: The array items completed by this piece of text.
+        :rtype: List[Any]
+        """
+        items = []
+        buffer = self.buffer + text
+        pos = self.pos
+
+        while pos < len(buffer) and not self.done:
+            if self.in_string:
+                pos, waiting = self.__skip_string(buffer=buffer, pos=pos)
+                if waiting:
+                    break
+                continue
+
+            match = _TOKENS.search(buffer, pos)
+            if not match:
+                pos = len(buffer)
+                break
+
+            token = match.lastindex
+            pos = match.end()
+            if token == _STRING:
+                if self.depth == 1:
+                    self.last_string = match.group(_STRING)
+            elif token == _OPEN:
+                self.__open(char=match.group(_OPEN), start=match.start())
+            elif token == _CLOSE:
+                self.__close(buffer=buffer, end=pos, items=items)
+            else:
+                self.in_string = True
+                self.string_start = match.start()
+
+        self.__keep_needed(buffer=buffer, pos=pos)
+        return items
+
+    def __skip_string(self, buffer: str, pos: int) -> t.Tuple[int, bool]:
+        """
+        (Private function) Move past the rest of the string being scanned.
+
+        :return: Tuple of (position, whether the buffer ends in an escape and more text is needed).
+        """
+        match = _STRING_SPECIAL_CHARS.search(buffer, pos)
+        if not match:
+            return len(buffer), False
+
+        if match.group() == "\\":
+            if match.end() >= len(buffer):
+                # wait for the escaped character
+                return match.start(), True
+            return match.end() + 1, False
+
+        self.in_string = False
+        if self.depth == 1:
+            self.last_string = buffer[self.string_start : match.end()]
+        return match.end(), False
+
+    def __open(self, char: str, start: int):
+        """
+        (Private function) Enter an object or array: an item of the array, or the array itself.
+        """
+        if self.in_array and self.depth == 2:
+            self.item_start = start
+        elif (
+            not self.in_array
+            and self.depth == 1
+            and char == "["
+            and self.last_string == self.key_token
+        ):
+            self.in_array = True
+        self.depth += 1
+
+    def __close(self, buffer: str, end: int, items: t.List[t.Any]):
+        """
+        (Private function) Leave an object or array, parsing it if it was an item of the array.
+        """
+        self.depth -= 1
+        if self.in_array and self.depth == 2 and self.item_start is not None:
+            items.append(json.loads(buffer[self.item_start : end]))
+            self.item_start = None
+        elif self.in_array and self.depth == 1:
+            self.done = True
+
+    def __keep_needed(self, buffer: str, pos: int):
+        """
+        (Private function) Keep only the text that is still needed: an unfinished item or string.
+        """
+        if self.item_start is not None:
+            cut = self.item_start
+        elif self.in_string:
+            cut = self.string_start
+        else:
+            cut = pos
+
+        self.buffer = buffer[cut:]
+        self.pos = pos - cut
+        if self.item_start is not None:
+            self.item_start -= cut
+        if self.in_string:
+            self.string_start -= cut
+
+
+def iter_json_array(chunks: t.Iterable[bytes], key: str) -> t.Iterator[t.Any]:
+    """
+    Yield the items of the top-level `key` array of a JSON document as it is received.
+
+    Each item is parsed and yielded as soon as its closing bracket arrives,
+    and reading stops once the array is closed.
+
+    :param chunks: The raw (UTF-8) JSON body as an iterable of byte chunks.
+    :type chunks: Iterable[bytes]
+    :param key: Top-level key of the array to yield items from (e.g., `results`).
+    :type key: str
+    :return: An iterator over the decoded array items.
+    :rtype: Iterator[Any]
+    """
+    scanner = _ArrayItemScanner(key=key)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+
+    for chunk in chunks:
+        yield from scanner.feed(decoder.decode(chunk))
+        if scanner.done:
+            return
+
+    yield from scanner.feed(decoder.decode(b"", final=True))
@@ -15,22 +15,130 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import contextlib
+import itertools
+import json
+import time
 import typing as t
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from platform import python_version, platform
 from types import SimpleNamespace
 
 import requests
 
-from ._lib import dict_to_namespace
+from ._lib import decode_search_response, dict_to_namespace, memory_phase
+from ._stream import iter_json_array
+from .balancer import DEFAULT_ENDPOINT, EndpointBalancer
+from .concurrency import AdaptiveLimiter, RequestScheduler
+from .dedupe import Deduplicator
 from .filters import LANGUAGES, SOURCES, get_language_ids, get_source_ids
+from .where import Where
 
-__all__ = ["Searchcode"]
+__all__ = ["Searchcode", "ResponseTooLargeError"]
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class ResponseTooLargeError(requests.exceptions.RequestException):
+    """
+    Raised when a response body is larger than the client's `max_response_size`.
+    """
 
 
 class Searchcode:
-    def __init__(self, user_agent: str):
+    def __init__(
+        self,
+        user_agent: str,
+        max_response_size: t.Optional[int] = None,
+        endpoints: t.Union[str, t.Sequence[str], None] = None,
+        max_error_rate: float = 0.5,
+        max_latency: t.Optional[float] = None,
+        probe_interval: float = 30,
+        max_workers: int = 8,
+        adaptive_concurrency: bool = False,
+        scheduler: t.Optional[RequestScheduler] = None,
+    ):
+        """
+        :param user_agent: User agent to identify the client with.
+        :type user_agent: str
+        :param max_response_size: Maximum size (in bytes) of a response body.
+          Larger responses raise ResponseTooLargeError instead of being read into memory.
+        :type max_response_size: Optional[int]
+        :param endpoints: Base URL, or list of equivalent base URLs, of the API
+          (default is `https://searchcode.com/api`). Requests are balanced across them
+          by least outstanding requests.
+        :type endpoints: Union[str, Sequence[str], None]
+        :param max_error_rate: Fraction of an endpoint's recent requests that may fail before it is ejected.
+        :type max_error_rate: float
+        :param max_latency: Optional mean latency (in seconds) of an endpoint's recent requests
+          at which it is ejected.
+        :type max_latency: Optional[float]
+        :param probe_interval: Seconds between background probes of ejected endpoints.
+        :type probe_interval: float
+        :param max_workers: Maximum number of requests the client runs concurrently on its own
+          (e.g., fetching the code files of search results with `with_code=True`).
+        :type max_workers: int
+        :param adaptive_concurrency: Whether to cap concurrent requests with a limit that grows
+          while the API responds quickly, and backs off on 429s, server errors and latency spikes
+          (up to `max_workers`). Useful with many threads sharing the client (e.g., `run_batch`).
+        :type adaptive_concurrency: bool
+        :param scheduler: Optional scheduler that queues requests by the `priority` they are sent
+          with, so a client shared by interactive lookups and background jobs serves the former first.
+        :type scheduler: Optional[RequestScheduler]
+        """
         self.user_agent = user_agent
-        self.__base_api_endpoint: str = "https://searchcode.com/api"
+        self.max_response_size = max_response_size
+        self.balancer = EndpointBalancer(
+            endpoints=[endpoints] if isinstance(endpoints, str) else endpoints or [DEFAULT_ENDPOINT],
+            probe=self.probe,
+            max_error_rate=max_error_rate,
+            max_latency=max_latency,
+            probe_interval=probe_interval,
+        )
+        self.max_workers = max_workers
+        self.limiter = (
+            AdaptiveLimiter(initial=min(4, max_workers), max_limit=max_workers)
+            if adaptive_concurrency
+            else None
+        )
+        self.scheduler = scheduler
+        if scheduler is not None:
+            scheduler.limiter = self.limiter
+        self.__session = requests.Session()
+        self.__executors = self.__make_executors()
+
+    def __getstate__(self) -> t.Dict:
+        # Executors can't be pickled (e.g., when the client is sent to crawl's worker processes)
+        state = self.__dict__.copy()
+        del state["_Searchcode__executors"]
+        return state
+
+    def __setstate__(self, state: t.Dict):
+        self.__dict__.update(state)
+        if self.scheduler is not None:
+            self.scheduler.limiter = self.limiter
+        self.__executors = self.__make_executors()
+
+    @property
+    def endpoints(self) -> t.List[str]:
+        """
+        :return: Base URLs of the API endpoints the client balances requests across.
+        :rtype: List[str]
+        """
+        return self.balancer.endpoints
+
+    def stats(self) -> t.Dict:
+        """
+        :return: Health of each endpoint, the adaptive concurrency limit (None unless
+          `adaptive_concurrency` is enabled), and the scheduler's priority classes (None without a scheduler).
+        :rtype: Dict
+        """
+        return {
+            "endpoints": self.balancer.stats(),
+            "concurrency": self.limiter.stats() if self.limiter else None,
+            "priorities": self.scheduler.stats() if self.scheduler else None,
+        }
 
     def search(
         self,
@@ -42,7 +150,12 @@ class Searchcode:
         lines_of_code_gt: t.Optional[int] = None,
         lines_of_code_lt: t.Optional[int] = None,
         callback: t.Optional[str] = None,
-    ) -> t.Union[SimpleNamespace, str]:
+        validators: t.Optional[t.Dict[str, str]] = None,
+        with_code: bool = False,
+        max_hydrate: t.Optional[int] = None,
+        where: t.Optional[Where] = None,
+        priority: str = "default",
+    ) -> t.Union[SimpleNamespace, str, None]:
         """
         Searches and returns code snippets matching the query.
 
@@ -71,50 +184,202 @@ class Searchcode:
         :type lines_of_code_lt: int
         :param callback: Callback function (JSONP only)
         :type callback: str
-        :return: The search results as a Dict object.
+        :param validators: Optional dict of cache validators (`etag`, `last_modified`) from a
+          previous call with the same parameters. They are sent as If-None-Match/If-Modified-Since,
+          and the dict is updated from the response.
+        :type validators: Optional[Dict[str, str]]
+        :param with_code: Whether to fetch each result's full code file (concurrently, on the
+          client's workers) and attach it to the result as `code`. A result whose code file
+          fails to fetch gets `code` None, and the error as `code_error`. Ignored if callback is set.
+        :type with_code: bool
+        :param max_hydrate: Maximum number of results to fetch code files for; the others get `code` None.
+        :type max_hydrate: Optional[int]
+        :param where: Optional post-filter; only matching results are kept. Clauses that read the
+          code file (`code~REGEX`) are applied after it is attached. Ignored if callback is set.
+        :type where: Optional[Where]
+        :param priority: Priority class of the requests (`interactive`, `default` or `background`,
+          unless the client's scheduler defines others). Only used if the client has a scheduler.
+        :type priority: str
+        :return: The search results as a Dict object, or None if validators were given
+          and the server reports the results have not been modified.
         :rtype: Dict
+        :raises ValueError: If where has clauses that read the code file, but with_code is off.
         """
 
-        language_ids = (
-            [] if not languages else get_language_ids(language_names=languages)
-        )
-        source_ids = [] if not sources else get_source_ids(source_names=sources)
+        where, code_where = self.__split_where(where=where, with_code=with_code)
 
         response = self.__send_request(
-            endpoint=f"{self.__base_api_endpoint}/{'jsonp_codesearch_I' if callback else 'codesearch_I'}/",
-            params=[
-                ("q", query),
-                ("p", page),
-                ("per_page", per_page),
-                ("loc", lines_of_code_gt),
-                ("loc2", lines_of_code_lt),
-                ("callback", callback),
-                *[("lan", language_id) for language_id in language_ids],
-                *[("src", source_id) for source_id in source_ids],
-            ],
+            path=f"{'jsonp_codesearch_I' if callback else 'codesearch_I'}/",
+            params=self.__search_params(
+                query=query,
+                page=page,
+                per_page=per_page,
+                languages=languages,
+                sources=sources,
+                lines_of_code_gt=lines_of_code_gt,
+                lines_of_code_lt=lines_of_code_lt,
+                callback=callback,
+            ),
             callback=callback,
+            validators=validators,
+            priority=priority,
         )
 
+        if response is None:
+            return None
+
         if not callback:
-            response = dict_to_namespace(obj=response)
+            with memory_phase("namespace"):
+                response = decode_search_response(obj=response)
             response.results = response.results[:per_page]
+            if where:
+                response.results = list(where.filter(results=response.results))
+            if with_code:
+                response.results = list(
+                    self.__hydrate(
+                        results=response.results, limit=max_hydrate, priority=priority
+                    )
+                )
+            if code_where:
+                response.results = list(code_where.filter(results=response.results))
 
         return response
 
-    def code(self, __id: int) -> SimpleNamespace:
+    def iter_search(
+        self,
+        query: str,
+        page: int = 0,
+        per_page: int = 100,
+        pages: int = 1,
+        languages: t.Optional[t.List[LANGUAGES]] = None,
+        sources: t.Optional[t.List[SOURCES]] = None,
+        lines_of_code_gt: t.Optional[int] = None,
+        lines_of_code_lt: t.Optional[int] = None,
+        deduplicator: t.Optional[Deduplicator] = None,
+        with_code: bool = False,
+        max_hydrate: t.Optional[int] = None,
+        where: t.Optional[Where] = None,
+        limit: t.Optional[int] = None,
+        priority: str = "default",
+    ) -> t.Iterator[SimpleNamespace]:
+        """
+        Searches and yields code snippets matching the query, one result at a time.
+
+        Results are parsed incrementally from the response body, so each result is
+        yielded as soon as it has been received, instead of after the whole page.
+        Takes the same parameters as `search()`, plus `pages`.
+
+        :param pages: Number of consecutive pages to fetch, starting at `page`.
+          Stops early when a page has fewer than `per_page` results.
+        :type pages: int
+        :param deduplicator: Optional Deduplicator that drops results already seen (by id or
+          snippet content); its `collapsed` count reports how many were dropped.
+        :type deduplicator: Optional[Deduplicator]
+        :param with_code: Whether to attach each result's full code file as `code` (see `search()`).
+          Code files are fetched concurrently as results arrive, overlapping with the pages still
+          being received.
+        :type with_code: bool
+        :param max_hydrate: Maximum number of results (over all pages) to fetch code files for.
+        :type max_hydrate: Optional[int]
+        :param where: Optional post-filter, applied to each result as it arrives (before
+          deduplication and fetching code files); only matching results are yielded.
+          Clauses that read the code file (`code~REGEX`) are applied after it is attached.
+        :type where: Optional[Where]
+        :param limit: Stop (without requesting further pages) once this many results were yielded.
+        :type limit: Optional[int]
+        :param priority: Priority class of the requests (see `search()`).
+        :type priority: str
+        :return: An iterator over the search results.
+        :rtype: Iterator[SimpleNamespace]
+        :raises ValueError: If where has clauses that read the code file, but with_code is off.
+        """
+
+        where, code_where = self.__split_where(where=where, with_code=with_code)
+
+        results = self.__iter_results(
+            query=query,
+            page=page,
+            per_page=per_page,
+            pages=pages,
+            languages=languages,
+            sources=sources,
+            lines_of_code_gt=lines_of_code_gt,
+            lines_of_code_lt=lines_of_code_lt,
+            deduplicator=deduplicator,
+            where=where,
+            priority=priority,
+        )
+        if with_code:
+            # with code clauses, it is not known how many results are kept until their code is fetched
+            if limit is not None and not code_where:
+                max_hydrate = limit if max_hydrate is None else min(max_hydrate, limit)
+            results = self.__hydrate(results=results, limit=max_hydrate, priority=priority)
+        if code_where:
+            results = code_where.filter(results=results)
+
+        yield from itertools.islice(results, limit)
+
+    def code(self, __id: int, priority: str = "default") -> SimpleNamespace:
         """
         Returns the raw data from a code file given the code ID which can be found as the `id` in a code search result.
 
         :param __id: The unique identifier of the code result.
         :type __id: int
+        :param priority: Priority class of the request (see `search()`).
+        :type priority: str
         :return: SimpleNamespace object containing code file data.
         :rtype: SimpleNamespace
         """
 
-        response = self.__send_request(
-            endpoint=f"{self.__base_api_endpoint}/result/{__id}"
-        )
-        return dict_to_namespace(obj=response)
+        response = self.__send_request(path=f"result/{__id}", priority=priority)
+        with memory_phase("namespace"):
+            return dict_to_namespace(obj=response)
+
+    def request(
+        self,
+        path: str,
+        params: t.Optional[t.List[t.Tuple[str, str]]] = None,
+        priority: str = "default",
+    ) -> t.Tuple[bytes, str]:
+        """
+        Sends a GET request to a path under the API endpoints, and returns the raw response.
+
+        :param path: Path relative to the API endpoint, e.g. `codesearch_I/` or `result/4061576`.
+        :type path: str
+        :param params: Optional list of query parameters as key-value tuples.
+        :type params: Optional[List[Tuple[str, str]]]
+        :param priority: Priority class of the request (see `search()`).
+        :type priority: str
+        :return: Tuple of (response body, content type).
+        :rtype: Tuple[bytes, str]
+        :raises requests.HTTPError: If the server returns an error.
+        """
+
+        with self.__get(path=path.lstrip("/"), params=params, priority=priority) as response:
+            body = b"".join(self.__iter_body(response=response))
+            return body, response.headers.get("Content-Type", "application/json")
+
+    def probe(self, endpoint: str) -> bool:
+        """
+        Checks whether an endpoint answers a small search (used to re-probe ejected endpoints).
+
+        :param endpoint: Base URL of the endpoint.
+        :type endpoint: str
+        :return: True if the endpoint answered without a server error.
+        :rtype: bool
+        """
+
+        try:
+            response = self.__session.get(
+                url=f"{endpoint}/codesearch_I/",
+                params=[("q", "test"), ("per_page", 1)],
+                headers={"User-Agent": self.user_agent.replace(" ", "-")},
+                timeout=10,
+            )
+        except requests.RequestException:
+            return False
+
+        return response.status_code < 500
 
     # This is deprecated (for now).
     # def related(_id: int) -> Dict:
@@ -132,31 +397,347 @@ class Searchcode:
     #    response = _get_response(endpoint=f"{_BASE_API_ENDPOINT}/related_results/{_id}")
     #    return _response_to_namespace_obj(response=response)
 
+    @staticmethod
+    def __search_params(
+        query: str,
+        page: int,
+        per_page: int,
+        languages: t.Optional[t.List[LANGUAGES]],
+        sources: t.Optional[t.List[SOURCES]],
+        lines_of_code_gt: t.Optional[int],
+        lines_of_code_lt: t.Optional[int],
+        callback: t.Optional[str] = None,
+    ) -> t.List[t.Tuple[str, t.Any]]:
+        """
+        (Private function) Builds the query parameters of a code search request.
+
+        :return: List of query parameters as key-value tuples.
+        :rtype: List[Tuple[str, Any]]
+        """
+
+        language_ids = (
+            [] if not languages else get_language_ids(language_names=languages)
+        )
+        source_ids = [] if not sources else get_source_ids(source_names=sources)
+
+        return [
+            ("q", query),
+            ("p", page),
+            ("per_page", per_page),
+            ("loc", lines_of_code_gt),
+            ("loc2", lines_of_code_lt),
+            ("callback", callback),
+            *[("lan", language_id) for language_id in language_ids],
+            *[("src", source_id) for source_id in source_ids],
+        ]
+
+    @staticmethod
+    def __split_where(
+        where: t.Optional[Where], with_code: bool
+    ) -> t.Tuple[t.Optional[Where], t.Optional[Where]]:
+        """
+        (Private function) Splits a post-filter into the clauses that can be applied as results
+        arrive, and those that read the code file (so must wait until it is attached).
+
+        :raises ValueError: If there are clauses that read the code file, but with_code is off.
+        """
+
+        if not where:
+            return None, None
+
+        where, code_where = where.split()
+        if code_where and not with_code:
+            raise ValueError("Clauses on the code file (code~REGEX) require with_code.")
+        return where, code_where
+
+    def __iter_results(
+        self,
+        query: str,
+        page: int,
+        per_page: int,
+        pages: int,
+        languages: t.Optional[t.List[LANGUAGES]],
+        sources: t.Optional[t.List[SOURCES]],
+        lines_of_code_gt: t.Optional[int],
+        lines_of_code_lt: t.Optional[int],
+        deduplicator: t.Optional[Deduplicator],
+        where: t.Optional[Where] = None,
+        priority: str = "default",
+    ) -> t.Iterator[SimpleNamespace]:
+        """
+        (Private function) Streams the results of consecutive search pages, parsing each page incrementally.
+
+        :return: An iterator over the search results.
+        :rtype: Iterator[SimpleNamespace]
+        """
+
+        for current_page in range(page, min(page + pages, 50)):
+            count = 0
+            with self.__get(
+                path="codesearch_I/",
+                params=self.__search_params(
+                    query=query,
+                    page=current_page,
+                    per_page=per_page,
+                    languages=languages,
+                    sources=sources,
+                    lines_of_code_gt=lines_of_code_gt,
+                    lines_of_code_lt=lines_of_code_lt,
+                ),
+                priority=priority,
+            ) as response:
+                for result in iter_json_array(
+                    chunks=self.__iter_body(response=response), key="results"
+                ):
+                    result = decode_search_response(obj=result)
+                    count += 1
+                    if (not where or where(result)) and (
+                        not deduplicator or not deduplicator.is_duplicate(result=result)
+                    ):
+                        yield result
+                    if count >= per_page:
+                        break
+
+            if count < per_page:
+                break
+
+    def __hydrate(
+        self,
+        results: t.Iterable[SimpleNamespace],
+        limit: t.Optional[int],
+        priority: str = "default",
+    ) -> t.Iterator[SimpleNamespace]:
+        """
+        (Private function) Fetches the code files of results on the client's workers, and yields
+        each result (in order) with its code attached as `code`.
+
+        Fetches run ahead of the consumer by up to twice the number of workers,
+        so they overlap with receiving the remaining results.
+
+        :param results: The search results.
+        :type results: Iterable[SimpleNamespace]
+        :param limit: Maximum number of results to fetch code files for; the others get `code` None.
+        :type limit: Optional[int]
+        :param priority: Priority class of the code file requests.
+        :type priority: str
+        :return: An iterator over the results, with their code attached.
+        :rtype: Iterator[SimpleNamespace]
+        """
+
+        executor = self.__executors.get(priority) or self.__executors[None]
+        pending: t.Deque[t.Tuple[SimpleNamespace, t.Optional[Future]]] = deque()
+        lookahead = self.max_workers * 2
+        hydrated = 0
+        try:
+            for result in results:
+                future = None
+                if limit is None or hydrated < limit:
+                    future = executor.submit(self.code, result.id, priority=priority)
+                    hydrated += 1
+                pending.append((result, future))
+
+                while pending and (
+                    len(pending) > lookahead
+                    or pending[0][1] is None
+                    or pending[0][1].done()
+                ):
+                    yield self.__attach_code(*pending.popleft())
+
+            while pending:
+                yield self.__attach_code(*pending.popleft())
+        finally:
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()
+
+    def __make_executors(self) -> t.Dict[t.Optional[str], ThreadPoolExecutor]:
+        """
+        (Private function) Creates the worker pools that fetch code files. With a scheduler, each
+        priority class gets its own pool, so background fetches queued on the workers can't delay
+        interactive ones (the scheduler still shares the concurrency between them).
+        """
+
+        classes = self.scheduler.weights if self.scheduler is not None else []
+        return {
+            name: ThreadPoolExecutor(max_workers=self.max_workers)
+            for name in [None, *classes]
+        }
+
+    @staticmethod
+    def __attach_code(
+        result: SimpleNamespace, future: t.Optional[Future]
+    ) -> SimpleNamespace:
+        """
+        (Private function) Attaches the code file fetched by a future to its search result.
+        A failed fetch only costs its own result the code file: `code` is None, and the error
+        is kept as `code_error`.
+        """
+
+        result.code = None
+        if future is not None:
+            try:
+                result.code = future.result().code
+            except (requests.RequestException, ValueError) as error:
+                result.code_error = f"{type(error).__name__}: {error}"
+        return result
+
     def __send_request(
         self,
-        endpoint: str,
+        path: str,
         params: t.Optional[t.List[t.Tuple[str, str]]] = None,
         callback: str = None,
-    ) -> t.Union[t.Dict, t.List, str]:
+        validators: t.Optional[t.Dict[str, str]] = None,
+        priority: str = "default",
+    ) -> t.Union[t.Dict, t.List, str, None]:
         """
-        (Private function) Sends a GET request to the specified endpoint with the given headers and parameters.
+        (Private function) Sends a GET request to the specified path with the given headers and parameters.
 
-        :param endpoint: The API endpoint to send the request to.
-        :type endpoint: str
+        :param path: The path (relative to the API endpoints) to send the request to.
+        :type path: str
         :param params: Optional list of query parameters as key-value tuples.
         :type params: Optional[List[Tuple[str, str]]]
-        :return: The parsed JSON response, which could be a dictionary, list, or string.
-        :rtype: Union[Dict, List, str]
+        :param validators: Optional dict of cache validators to make the request conditional with.
+        :type validators: Optional[Dict[str, str]]
+        :param priority: Priority class of the request.
+        :type priority: str
+        :return: The parsed JSON response, which could be a dictionary, list, or string,
+          or None if the request was conditional and the resource has not been modified.
+        :rtype: Union[Dict, List, str, None]
         :raises Exception: If the request fails or the server returns an error.
         """
 
-        response = requests.get(
-            url=endpoint,
-            params=params,
-            headers={
-                "User-Agent": f"{self.user_agent.replace(' ', '-')} "
-                f"(Python {python_version} on {platform}; +https://pypi.org/project/searchcode)"
-            },
-        )
-        response.raise_for_status()
-        return response.text if callback else response.json()
+        headers = {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+
+        with self.__get(
+            path=path, params=params, headers=headers, priority=priority
+        ) as response:
+            if response.status_code == 304:
+                return None
+            if validators is not None:
+                validators["etag"] = response.headers.get("ETag")
+                validators["last_modified"] = response.headers.get("Last-Modified")
+            with memory_phase("http body"):
+                body = b"".join(self.__iter_body(response=response))
+
+        if callback:
+            return body.decode(response.encoding or "utf-8")
+        with memory_phase("json decode"):
+            return json.loads(body)
+
+    @contextlib.contextmanager
+    def __get(
+        self,
+        path: str,
+        params: t.Optional[t.List[t.Tuple[str, str]]] = None,
+        headers: t.Optional[t.Dict[str, str]] = None,
+        priority: str = "default",
+    ) -> t.Iterator[requests.Response]:
+        """
+        (Private function) Opens a streamed GET request to the specified path, on the endpoint
+        picked by the balancer. The endpoint counts the request as outstanding until the
+        context exits, and connection errors or server errors count against its health.
+        With a scheduler, the request first waits its turn in its priority class; with adaptive
+        concurrency, it also waits for, and reports back to, the limiter. Both slots are freed
+        as soon as the response headers arrive.
+
+        The body is not read; use `__iter_body` to read it.
+
+        :param path: The path (relative to the API endpoints) to send the request to.
+        :type path: str
+        :param params: Optional list of query parameters as key-value tuples.
+        :type params: Optional[List[Tuple[str, str]]]
+        :param headers: Optional extra request headers.
+        :type headers: Optional[Dict[str, str]]
+        :param priority: Priority class of the request.
+        :type priority: str
+        :return: A context manager over the open response.
+        :rtype: Iterator[requests.Response]
+        :raises requests.HTTPError: If the server returns an error.
+        """
+
+        if self.scheduler:
+            self.scheduler.acquire(priority=priority)
+        if self.limiter:
+            self.limiter.acquire()
+        endpoint = self.balancer.acquire()
+        started = time.monotonic()
+        latency = None
+        failed = True
+        throttled = False
+        gated = True
+        try:
+            response = self.__session.get(
+                url=f"{endpoint}/{path}",
+                params=params,
+                headers={
+                    "User-Agent": f"{self.user_agent.replace(' ', '-')} "
+                    f"(Python {python_version} on {platform}; +https://pypi.org/project/searchcode)",
+                    **(headers or {}),
+                },
+                stream=True,
+            )
+            latency = time.monotonic() - started
+            failed = response.status_code >= 500
+            throttled = response.status_code == 429
+            # free the slot once the upstream has responded, so a caller slowly reading a streamed
+            # body (e.g., iter_search fetching code files as results arrive) can't hold up the
+            # requests it waits for
+            gated = False
+            self.__leave_gate(priority=priority, latency=latency, overloaded=failed or throttled)
+            with response:
+                response.raise_for_status()
+                yield response
+        except requests.RequestException as error:
+            if not isinstance(error, (requests.HTTPError, ResponseTooLargeError)):
+                failed = True
+            raise
+        finally:
+            latency = time.monotonic() - started if latency is None else latency
+            self.balancer.release(endpoint, failed=failed, latency=latency)
+            if gated:
+                self.__leave_gate(priority=priority, latency=latency, overloaded=failed)
+
+    def __leave_gate(self, priority: str, latency: float, overloaded: bool):
+        """
+        (Private function) Reports a response to the adaptive limiter, and frees the request's
+        scheduler slot.
+        """
+
+        if self.limiter:
+            self.limiter.release(latency=latency, overloaded=overloaded)
+        if self.scheduler:
+            self.scheduler.release(priority=priority)
+
+    def __iter_body(self, response: requests.Response) -> t.Iterator[bytes]:
+        """
+        (Private function) Reads a streamed response body in chunks, enforcing `max_response_size`.
+
+        :param response: The open (streamed) response.
+        :type response: requests.Response
+        :return: An iterator over the body's byte chunks.
+        :rtype: Iterator[bytes]
+        :raises ResponseTooLargeError: If the body exceeds `max_response_size`.
+        """
+
+        limit = self.max_response_size
+        content_length = response.headers.get("Content-Length")
+        if limit is not None and content_length and int(content_length) > limit:
+            raise ResponseTooLargeError(
+                f"Response body is {content_length} bytes, limit is {limit} bytes.",
+                response=response,
+            )
+
+        received = 0
+        for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+            received += len(chunk)
+            if limit is not None and received > limit:
+                raise ResponseTooLargeError(
+                    f"Response body exceeds the limit of {limit} bytes.",
+                    response=response,
+                )
+            yield chunk
@@ -0,0 +1,238 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+import typing as t
+from collections import deque
+
+__all__ = ["DEFAULT_ENDPOINT", "EndpointBalancer"]
+
+DEFAULT_ENDPOINT = "https://searchcode.com/api"
+
+
+class _Endpoint:
+    __slots__ = ("url", "healthy", "outstanding", "requests", "failures", "outcomes")
+
+    def __init__(self, url: str, window: int):
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        # (failed, latency) of the most recent requests
+        self.outcomes: t.Deque[t.Tuple[bool, float]] = deque(maxlen=window)
+
+
+class EndpointBalancer:
+    """
+    Spreads requests across equivalent API endpoints (e.g., searchcode.com, mirrors, or a gateway).
+
+    Each request goes to the healthy endpoint with the fewest outstanding requests (ties are taken
+    in turn). An endpoint is ejected when too many of its recent requests failed, or were too slow,
+    and is re-probed in the background until it answers again. If every endpoint is ejected, requests go to the least busy one.
+    """
+
+    def __init__(
+        self,
+        endpoints: t.Sequence[str],
+        probe: t.Optional[t.Callable[[str], bool]] = None,
+        max_error_rate: float = 0.5,
+        max_latency: t.Optional[float] = None,
+        window: int = 20,
+        min_requests: int = 5,
+        probe_interval: float = 30,
+    ):
+        """
+        :param endpoints: Base URLs of the endpoints (e.g., `https://searchcode.com/api`).
+        :type endpoints: Sequence[str]
+        :param probe: Callable that checks whether an ejected endpoint is up again.
+          Without one, ejected endpoints are reinstated after `probe_interval`.
+        :type probe: Optional[Callable[[str], bool]]
+        :param max_error_rate: Fraction of failed recent requests at which an endpoint is ejected.
+        :type max_error_rate: float
+        :param max_latency: Optional mean latency (in seconds) of recent requests at which an endpoint is ejected.
+        :type max_latency: Optional[float]
+        :param window: Number of recent requests per endpoint that health is judged on.
+        :type window: int
+        :param min_requests: Minimum number of recent requests before an endpoint can be ejected.
+        :type min_requests: int
+        :param probe_interval: Seconds between probes of ejected endpoints.
+        :type probe_interval: float
+        """
+        if not endpoints:
+            raise ValueError("At least one endpoint is required.")
+
+        self.probe = probe
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency
+        self.window = window
+        self.min_requests = min_requests
+        self.probe_interval = probe_interval
+
+        self.__endpoints = [
+            _Endpoint(url=endpoint.rstrip("/"), window=window) for endpoint in endpoints
+        ]
+        self.__next = 0
+        self.__lock = threading.Lock()
+        self.__prober: t.Optional[threading.Thread] = None
+
+    def __getstate__(self) -> t.Dict:
+        # Locks and threads can't be pickled (e.g., when a client is sent to crawl's worker
+        # processes), so only the configuration is; health is tracked afresh after unpickling.
+        return {
+            "endpoints": self.endpoints,
+            "probe": self.probe,
+            "max_error_rate": self.max_error_rate,
+            "max_latency": self.max_latency,
+            "window": self.window,
+            "min_requests": self.min_requests,
+            "probe_interval": self.probe_interval,
+        }
+
+    def __setstate__(self, state: t.Dict):
+        self.__init__(**state)
+
+    @property
+    def endpoints(self) -> t.List[str]:
+        """
+        :return: Base URLs of all endpoints, healthy or not.
+        :rtype: List[str]
+        """
+        return [endpoint.url for endpoint in self.__endpoints]
+
+    def acquire(self) -> str:
+        """
+        Pick an endpoint for a request. Every call must be followed by a call to `release()`.
+
+        :return: Base URL of the endpoint with the fewest outstanding requests.
+        :rtype: str
+        """
+        with self.__lock:
+            candidates = [
+                endpoint for endpoint in self.__endpoints if endpoint.healthy
+            ] or self.__endpoints
+            # Rotate the candidates, so ties (e.g., sequential requests) are broken round-robin
+            self.__next = (self.__next + 1) % len(candidates)
+            candidates = candidates[self.__next :] + candidates[: self.__next]
+            endpoint = min(candidates, key=lambda candidate: candidate.outstanding)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint.url
+
+    def release(self, url: str, failed: bool = False, latency: float = 0.0):
+        """
+        Record the outcome of a request, ejecting the endpoint if it has become unhealthy.
+
+        :param url: Base URL returned by `acquire()`.
+        :type url: str
+        :param failed: Whether the request failed because of the endpoint (connection errors, 5xx).
+        :type failed: bool
+        :param latency: Seconds the endpoint took to respond.
+        :type latency: float
+        """
+        with self.__lock:
+            endpoint = self.__find(url=url)
+            endpoint.outstanding -= 1
+            endpoint.failures += failed
+            endpoint.outcomes.append((failed, latency))
+
+            if endpoint.healthy and not self.__is_healthy(endpoint=endpoint):
+                endpoint.healthy = False
+                self.__start_prober()
+
+    def stats(self) -> t.List[t.Dict]:
+        """
+        :return: Health, outstanding requests, totals and recent mean latency of each endpoint.
+        :rtype: List[Dict]
+        """
+        with self.__lock:
+            return [
+                {
+                    "endpoint": endpoint.url,
+                    "healthy": endpoint.healthy,
+                    "outstanding": endpoint.outstanding,
+                    "requests": endpoint.requests,
+                    "failures": endpoint.failures,
+                    "latency": (
+                        sum(latency for _, latency in endpoint.outcomes)
+                        / len(endpoint.outcomes)
+                        if endpoint.outcomes
+                        else None
+                    ),
+                }
+                for endpoint in self.__endpoints
+            ]
+
+    def __find(self, url: str) -> _Endpoint:
+        """
+        (Private function) Get an endpoint's state by its base URL.
+        """
+        for endpoint in self.__endpoints:
+            if endpoint.url == url:
+                return endpoint
+
+        raise KeyError(url)
+
+    def __is_healthy(self, endpoint: _Endpoint) -> bool:
+        """
+        (Private function) Judge an endpoint's health on its recent requests.
+        """
+        outcomes = endpoint.outcomes
+        if len(outcomes) < self.min_requests:
+            return True
+
+        failures = sum(failed for failed, _ in outcomes)
+        if failures / len(outcomes) >= self.max_error_rate:
+            return False
+        if self.max_latency is not None:
+            mean_latency = sum(latency for _, latency in outcomes) / len(outcomes)
+            if mean_latency >= self.max_latency:
+                return False
+
+        return True
+
+    def __start_prober(self):
+        """
+        (Private function) Start the background thread that re-probes ejected endpoints, if it is not running.
+        """
+        if self.__prober is None or not self.__prober.is_alive():
+            self.__prober = threading.Thread(target=self.__probe_ejected, daemon=True)
+            self.__prober.start()
+
+    def __probe_ejected(self):
+        """
+        (Private function) Re-probe ejected endpoints until all of them are healthy again.
+        """
+        while True:
+            time.sleep(self.probe_interval)
+            with self.__lock:
+                ejected = [endpoint for endpoint in self.__endpoints if not endpoint.healthy]
+                if not ejected:
+                    self.__prober = None
+                    return
+
+            for endpoint in ejected:
+                try:
+                    recovered = self.probe(endpoint.url) if self.probe else True
+                except Exception:
+                    recovered = False
+
+                if recovered:
+                    with self.__lock:
+                        endpoint.outcomes.clear()
+                        endpoint.healthy = True
@@ -0,0 +1,245 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import os
+import typing as t
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+
+from ._lib import namespace_to_dict
+from .api import Searchcode
+
+__all__ = ["BATCH_QUERY_PARAMS", "read_queries", "run_batch"]
+
+BATCH_QUERY_PARAMS = (
+    "query",
+    "page",
+    "pages",
+    "per_page",
+    "languages",
+    "sources",
+    "lines_of_code_gt",
+    "lines_of_code_lt",
+)
+
+
+def read_queries(path: str) -> t.List[t.Dict]:
+    """
+    Read batch queries from a JSONL file, one JSON object of `search()` parameters per line.
+
+    Besides the `search()` parameters, a query may set `pages` (default 1),
+    the number of consecutive pages to fetch starting at `page`.
+    Blank lines and lines starting with `#` are skipped.
+
+    :param path: Path to the queries file.
+    :type path: str
+    :return: List of query objects.
+    :rtype: List[Dict]
+    :raises ValueError: If a line is not a JSON object, has no `query`, or has unknown keys.
+    """
+    queries = []
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            query = json.loads(line)
+            if not isinstance(query, dict) or "query" not in query:
+                raise ValueError(f"{path}:{line_number}: expected an object with a 'query'.")
+
+            unknown = set(query) - set(BATCH_QUERY_PARAMS)
+            if unknown:
+                raise ValueError(
+                    f"{path}:{line_number}: unknown parameter(s) {', '.join(sorted(unknown))}."
+                )
+            queries.append(query)
+
+    return queries
+
+
+def _query_key(query: t.Dict) -> str:
+    """
+    Identify a query by its parameters, so checkpoints survive reordering the queries file.
+    """
+    encoded = json.dumps(query, sort_keys=True).encode()
+    return hashlib.blake2b(encoded, digest_size=12).hexdigest()
+
+
+def _read_checkpoint(path: str) -> t.Dict[str, t.Tuple[int, bool]]:
+    """
+    Read the last completed page (and whether it was the final page) of each query.
+    """
+    done: t.Dict[str, t.Tuple[int, bool]] = {}
+    if not os.path.exists(path):
+        return done
+
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+                key, page, last = entry["key"], int(entry["page"]), bool(entry["last"])
+            except (ValueError, KeyError, TypeError):
+                # a torn write from a crashed run, or a malformed entry; that page is simply fetched again
+                continue
+            last_page, _ = done.get(key, (-1, False))
+            if page >= last_page:
+                done[key] = (page, last)
+
+    return done
+
+
+def _resume_page(query: t.Dict, done: t.Tuple[int, bool]) -> t.Optional[int]:
+    """
+    Get the page a query resumes from, given its last checkpointed page (and whether that was its final page).
+
+    :return: The page, or None if the query is done.
+    """
+    last_page, finished = done
+    first_page = query.get("page", 0)
+    if finished or last_page >= first_page + query.get("pages", 1) - 1:
+        return None
+    return max(first_page, last_page + 1)
+
+
+def _is_last_page(query: t.Dict, page: int, response: SimpleNamespace) -> bool:
+    """
+    Whether a page is the last one to fetch for a query: the results ran out, or the query wants no more pages.
+    """
+    per_page = query.get("per_page", 100)
+    last_wanted_page = min(query.get("page", 0) + query.get("pages", 1), 50) - 1
+    return (
+        len(response.results) < per_page
+        or (page + 1) * per_page >= response.total
+        or page >= last_wanted_page
+    )
+
+
+def _fetch_page(client: Searchcode, query: t.Dict, page: int) -> SimpleNamespace:
+    """
+    (Worker function) Fetch a page of a query.
+    """
+    params = {key: value for key, value in query.items() if key != "pages"}
+    params["page"] = page
+    return client.search(**params)
+
+
+def _write_page(
+    output_file: t.TextIO,
+    checkpoint_file: t.TextIO,
+    query: t.Dict,
+    key: str,
+    page: int,
+    response: SimpleNamespace,
+) -> bool:
+    """
+    Write a page's results, then record the page in the checkpoint.
+
+    :return: Whether it was the last page of the query.
+    """
+    for result in response.results:
+        record = {"query": query, "page": page, "result": namespace_to_dict(result)}
+        output_file.write(json.dumps(record) + "\n")
+    output_file.flush()
+
+    last = _is_last_page(query=query, page=page, response=response)
+    checkpoint_file.write(json.dumps({"key": key, "page": page, "last": last}) + "\n")
+    checkpoint_file.flush()
+    return last
+
+
+def run_batch(
+    client: Searchcode,
+    queries: t.List[t.Dict],
+    output: str,
+    checkpoint: t.Optional[str] = None,
+    workers: int = 4,
+    on_page: t.Optional[t.Callable[[t.Dict, int, int], None]] = None,
+) -> SimpleNamespace:
+    """
+    Run many searches with a bounded worker pool, writing every result to a JSONL file.
+
+    Each output line is `{"query": ..., "page": ..., "result": ...}`. After a page's results
+    have been written, the page is recorded in the checkpoint file, and a rerun with the same
+    checkpoint skips the pages already done. A crash between the two writes means that page
+    is fetched (and written) again on resume.
+
+    :param client: The Searchcode client to run the searches with.
+    :type client: Searchcode
+    :param queries: Query objects (see `read_queries`).
+    :type queries: List[Dict]
+    :param output: Path of the JSONL file to append results to.
+    :type output: str
+    :param checkpoint: Path of the checkpoint file (defaults to `<output>.checkpoint`).
+    :type checkpoint: Optional[str]
+    :param workers: Maximum number of concurrent requests.
+    :type workers: int
+    :param on_page: Optional callable called with (query, page, number of results) after each page.
+    :type on_page: Optional[Callable[[Dict, int, int], None]]
+    :return: Summary with the number of `pages` and `results` fetched, `skipped` (already done)
+      queries and `failed` pages (which are retried on the next run).
+    :rtype: SimpleNamespace
+    """
+    checkpoint = checkpoint or f"{output}.checkpoint"
+    done = _read_checkpoint(path=checkpoint)
+    summary = SimpleNamespace(pages=0, results=0, skipped=0, failed=[])
+
+    pending: t.Dict[Future, t.Tuple[t.Dict, str, int]] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor, open(
+        output, "a", encoding="utf-8"
+    ) as output_file, open(checkpoint, "a", encoding="utf-8") as checkpoint_file:
+
+        def submit(query: t.Dict, key: str, page: int):
+            pending[executor.submit(_fetch_page, client, query, page)] = (query, key, page)
+
+        for query in queries:
+            key = _query_key(query=query)
+            page = _resume_page(query=query, done=done.get(key, (-1, False)))
+            if page is None:
+                summary.skipped += 1
+                continue
+            submit(query=query, key=key, page=page)
+
+        while pending:
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                query, key, page = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as error:
+                    summary.failed.append((query, page, error))
+                    continue
+
+                last = _write_page(
+                    output_file=output_file,
+                    checkpoint_file=checkpoint_file,
+                    query=query,
+                    key=key,
+                    page=page,
+                    response=response,
+                )
+                summary.pages += 1
+                summary.results += len(response.results)
+                if on_page:
+                    on_page(query, page, len(response.results))
+                if not last:
+                    submit(query=query, key=key, page=page + 1)
+
+    return summary
@@ -0,0 +1,357 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import typing as t
+from types import SimpleNamespace
+
+from ._lib import searchcode_home
+
+__all__ = ["BlobStore", "default_blobs_path"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    dictionary INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS codes (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    language TEXT,
+    repo TEXT
+);
+CREATE INDEX IF NOT EXISTS codes_hash ON codes (hash);
+CREATE TABLE IF NOT EXISTS dictionaries (
+    id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL
+);
+"""
+
+
+def _import_zstandard():
+    """
+    Import zstandard, which is an optional dependency.
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "The blob store requires zstandard: pip install searchcode[blobs]"
+        ) from None
+
+    return zstandard
+
+
+def default_blobs_path() -> str:
+    """
+    Get the default blob store directory: `$SEARCHCODE_HOME/blobs`, or `~/.searchcode/blobs`.
+
+    :return: Path of the default blob store directory.
+    :rtype: str
+    """
+    return os.path.join(searchcode_home(), "blobs")
+
+
+class BlobStore:
+    """
+    A content-addressed, compressed store of fetched code files.
+
+    Each distinct body is stored once (under its BLAKE2b hash), however many code ids share it,
+    so forked and vendored files cost one copy. Bodies are compressed with zstd, using a
+    dictionary trained on the stored files once there are enough of them, and appended to a
+    single pack file that is read back through a memory map (the compressed bytes are
+    decompressed straight from the map). A SQLite index maps each code id to its hash,
+    language and repository.
+    """
+
+    def __init__(
+        self,
+        path: t.Optional[str] = None,
+        level: int = 10,
+        dictionary_size: int = 112_640,
+        train_after: t.Optional[int] = 256,
+    ):
+        """
+        :param path: Directory to keep the store in (defaults to `default_blobs_path()`).
+        :type path: Optional[str]
+        :param level: zstd compression level.
+        :type level: int
+        :param dictionary_size: Maximum size (in bytes) of trained dictionaries.
+        :type dictionary_size: int
+        :param train_after: Number of stored files after which a dictionary is trained
+          automatically, if there is none yet (None to only train with `train()`).
+        :type train_after: Optional[int]
+        """
+        self.__zstandard = _import_zstandard()
+        self.path = path or default_blobs_path()
+        self.level = level
+        self.dictionary_size = dictionary_size
+        self.train_after = train_after
+        os.makedirs(self.path, exist_ok=True)
+
+        self.__lock = threading.RLock()
+        self.__local = threading.local()
+        self.__db = sqlite3.connect(
+            os.path.join(self.path, "blobs.db"), check_same_thread=False
+        )
+        self.__db.row_factory = sqlite3.Row
+        self.__db.executescript(_SCHEMA)
+        self.__pack = open(os.path.join(self.path, "blobs.pack"), "a+b")
+        self.__map: t.Optional[mmap.mmap] = None
+
+        row = self.__db.execute(
+            "SELECT id, data FROM dictionaries ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        self.__dictionary = (row["id"], row["data"]) if row else (0, None)
+        self.__compressor = self.__make_compressor()
+
+    def close(self):
+        with self.__lock:
+            if self.__map is not None:
+                self.__map.close()
+                self.__map = None
+            self.__db.close()
+            self.__pack.close()
+
+    def __enter__(self) -> "BlobStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_code(
+        self,
+        __id: int,
+        data: SimpleNamespace,
+        result: t.Optional[SimpleNamespace] = None,
+    ) -> str:
+        """
+        Add (or update) a code file in the store.
+
+        :param __id: The unique identifier of the code file.
+        :type __id: int
+        :param data: The code file, as returned by `Searchcode.code()`.
+        :type data: SimpleNamespace
+        :param result: Optional search result of the same file, for its repository.
+        :type result: Optional[SimpleNamespace]
+        :return: Hash the body is stored under.
+        :rtype: str
+        """
+        body = data.code.encode("utf-8")
+        digest = hashlib.blake2b(body, digest_size=20).hexdigest()
+
+        with self.__lock:
+            with self.__db:
+                if not self.__db.execute(
+                    "SELECT 1 FROM blobs WHERE hash = ?", (digest,)
+                ).fetchone():
+                    compressed = self.__compressor.compress(body)
+                    offset = self.__pack.seek(0, os.SEEK_END)
+                    self.__pack.write(compressed)
+                    # the body must be on disk before the index points at it
+                    self.__pack.flush()
+                    self.__db.execute(
+                        "INSERT INTO blobs (hash, offset, length, size, dictionary) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (digest, offset, len(compressed), len(body), self.__dictionary[0]),
+                    )
+
+                self.__db.execute(
+                    "INSERT OR REPLACE INTO codes (id, hash, language, repo) VALUES (?, ?, ?, ?)",
+                    (
+                        __id,
+                        digest,
+                        getattr(data, "language", None),
+                        getattr(result, "repo", None),
+                    ),
+                )
+
+            if self.__dictionary[0] == 0 and self.train_after:
+                self.__maybe_train()
+
+        return digest
+
+    def code(self, __id: int) -> t.Optional[SimpleNamespace]:
+        """
+        Get a code file from the store.
+
+        :param __id: The unique identifier of the code file.
+        :type __id: int
+        :return: SimpleNamespace with `code`, `language`, `repo` and `hash`, or None if the file is not stored.
+        :rtype: Optional[SimpleNamespace]
+        """
+        row = self.__db.execute(
+            "SELECT hash, language, repo FROM codes WHERE id = ?", (__id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        return SimpleNamespace(
+            code=self.blob(row["hash"]).decode("utf-8"),
+            language=row["language"],
+            repo=row["repo"],
+            hash=row["hash"],
+        )
+
+    def blob(self, digest: str) -> bytes:
+        """
+        Get a stored body by its hash.
+
+        :param digest: The body's hash (see `add_code()`).
+        :type digest: str
+        :return: The body.
+        :rtype: bytes
+        :raises KeyError: If no body is stored under the hash.
+        """
+        row = self.__db.execute(
+            "SELECT offset, length, size, dictionary FROM blobs WHERE hash = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(digest)
+
+        view = self.__view(offset=row["offset"], length=row["length"])
+        try:
+            return self.__decompressor(row["dictionary"]).decompress(
+                view, max_output_size=row["size"]
+            )
+        finally:
+            view.release()
+
+    def train(self, samples: int = 1000) -> int:
+        """
+        Train a new compression dictionary on stored code files. Files added afterwards are
+        compressed with it; files already stored keep the dictionary they were compressed with.
+
+        :param samples: Maximum number of stored files to train on.
+        :type samples: int
+        :return: Size (in bytes) of the trained dictionary.
+        :rtype: int
+        :raises ValueError: If there are too few (or too uniform) files to train on.
+        """
+        with self.__lock:
+            return self.__train(samples=samples)
+
+    def stats(self) -> SimpleNamespace:
+        """
+        :return: SimpleNamespace with the number of stored `codes` and distinct `blobs`, their total
+          `size` and compressed size (`stored`), the number of `dictionaries`, and the `path`.
+        :rtype: SimpleNamespace
+        """
+        codes = self.__db.execute("SELECT COUNT(*) FROM codes").fetchone()[0]
+        blobs, size, stored = self.__db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM blobs"
+        ).fetchone()
+        dictionaries = self.__db.execute("SELECT COUNT(*) FROM dictionaries").fetchone()[0]
+        return SimpleNamespace(
+            codes=codes,
+            blobs=blobs,
+            size=size,
+            stored=stored,
+            dictionaries=dictionaries,
+            path=self.path,
+        )
+
+    def __make_compressor(self):
+        """
+        (Private function) Create a compressor with the current dictionary, if any.
+        """
+        zstandard = self.__zstandard
+        _, data = self.__dictionary
+        return zstandard.ZstdCompressor(
+            level=self.level,
+            dict_data=zstandard.ZstdCompressionDict(data) if data else None,
+        )
+
+    def __decompressor(self, dictionary: int):
+        """
+        (Private function) Get this thread's decompressor for a dictionary
+        (zstd contexts can't be shared between threads).
+        """
+        decompressors = getattr(self.__local, "decompressors", None)
+        if decompressors is None:
+            decompressors = self.__local.decompressors = {}
+        if dictionary not in decompressors:
+            data = None
+            if dictionary:
+                data = self.__db.execute(
+                    "SELECT data FROM dictionaries WHERE id = ?", (dictionary,)
+                ).fetchone()["data"]
+            decompressors[dictionary] = self.__zstandard.ZstdDecompressor(
+                dict_data=self.__zstandard.ZstdCompressionDict(data) if data else None
+            )
+
+        return decompressors[dictionary]
+
+    def __view(self, offset: int, length: int) -> memoryview:
+        """
+        (Private function) Get a view of a range of the pack file, mapping it again if it grew.
+        """
+        current = self.__map
+        if current is None or offset + length > len(current):
+            with self.__lock:
+                if self.__map is None or offset + length > len(self.__map):
+                    # views of the previous map keep it open until they are released
+                    self.__map = mmap.mmap(self.__pack.fileno(), 0, access=mmap.ACCESS_READ)
+                current = self.__map
+
+        return memoryview(current)[offset : offset + length]
+
+    def __maybe_train(self):
+        """
+        (Private function) Train the first dictionary once enough files are stored; the caller holds the lock.
+        """
+        blobs = self.__db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        if blobs < self.train_after or blobs % self.train_after:
+            return
+
+        try:
+            self.__train(samples=blobs)
+        except ValueError:
+            # too little (or too uniform) data; try again after another train_after files
+            pass
+
+    def __train(self, samples: int) -> int:
+        """
+        (Private function) Train and save a dictionary; the caller holds the lock.
+        """
+        hashes = [
+            row["hash"]
+            for row in self.__db.execute(
+                "SELECT hash FROM blobs ORDER BY rowid DESC LIMIT ?", (samples,)
+            )
+        ]
+        try:
+            dictionary = self.__zstandard.train_dictionary(
+                self.dictionary_size, [self.blob(digest) for digest in hashes]
+            )
+        except self.__zstandard.ZstdError as error:
+            raise ValueError(
+                f"Could not train a dictionary on {len(hashes)} code files: {error}"
+            ) from None
+        data = dictionary.as_bytes()
+        with self.__db:
+            cursor = self.__db.execute("INSERT INTO dictionaries (data) VALUES (?)", (data,))
+        self.__dictionary = (cursor.lastrowid, data)
+        self.__compressor = self.__make_compressor()
+        return len(data)
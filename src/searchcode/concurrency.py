@@ -0,0 +1,320 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import threading
+import typing as t
+from collections import deque
+
+__all__ = ["AdaptiveLimiter", "DEFAULT_PRIORITY_WEIGHTS", "RequestScheduler"]
+
+DEFAULT_PRIORITY_WEIGHTS = {"interactive": 8, "default": 4, "background": 1}
+
+
+class AdaptiveLimiter:
+    """
+    Caps the number of concurrent requests with an AIMD (additive increase, multiplicative
+    decrease) limit, to find the most concurrency the upstream can sustain.
+
+    Each successful request with a normal latency grows the limit by 1/limit (so by one per
+    limit's worth of requests). A request that is rejected as overloaded (429, 5xx, connection
+    errors), or whose latency spikes past `latency_tolerance` times the usual latency, multiplies
+    the limit by `backoff`, at most once per limit's worth of requests.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        smoothing: float = 0.1,
+    ):
+        """
+        :param initial: Initial limit.
+        :type initial: int
+        :param min_limit: Lowest the limit can go.
+        :type min_limit: int
+        :param max_limit: Highest the limit can go.
+        :type max_limit: int
+        :param backoff: Factor the limit is multiplied by on overload.
+        :type backoff: float
+        :param latency_tolerance: How many times the usual latency counts as a spike.
+        :type latency_tolerance: float
+        :param smoothing: Weight of each new latency in the moving average of the usual latency.
+        :type smoothing: float
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.latency: t.Optional[float] = None
+        self.__since_decrease = self.max_limit
+        self.__condition = threading.Condition()
+
+    def __getstate__(self) -> t.Dict:
+        # Conditions can't be pickled; the limit is learned afresh after unpickling
+        return {
+            "initial": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "backoff": self.backoff,
+            "latency_tolerance": self.latency_tolerance,
+            "smoothing": self.smoothing,
+        }
+
+    def __setstate__(self, state: t.Dict):
+        self.__init__(**state)
+
+    def acquire(self):
+        """
+        Wait until a request may start. Every call must be followed by a call to `release()`.
+        """
+        with self.__condition:
+            while self.in_flight >= int(self.limit):
+                self.__condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, overloaded: bool = False):
+        """
+        Record the outcome of a request, and adjust the limit.
+
+        :param latency: Seconds the upstream took to respond.
+        :type latency: float
+        :param overloaded: Whether the upstream rejected the request as overloaded (429, 5xx, connection errors).
+        :type overloaded: bool
+        """
+        with self.__condition:
+            self.in_flight -= 1
+            self.__since_decrease += 1
+
+            spike = (
+                self.latency is not None
+                and latency > self.latency * self.latency_tolerance
+            )
+            if overloaded or spike:
+                if self.__since_decrease >= int(self.limit):
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self.decreases += 1
+                    self.__since_decrease = 0
+            elif self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.increases += 1
+
+            if not overloaded:
+                # spikes count too (slowly), so a lasting change in latency becomes the new normal
+                self.latency = (
+                    latency
+                    if self.latency is None
+                    else (1 - self.smoothing) * self.latency + self.smoothing * latency
+                )
+
+            self.__condition.notify_all()
+
+    def stats(self) -> t.Dict:
+        """
+        :return: The current limit, requests in flight, usual latency, and the number of increases and decreases.
+        :rtype: Dict
+        """
+        with self.__condition:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "latency": self.latency,
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+
+
+class RequestScheduler:
+    """
+    Queues the requests of a shared client by priority class, and admits them up to a total
+    concurrency, sharing it between the classes with waiting requests in proportion to their weights
+    (e.g., with the default weights, while both have requests waiting, interactive requests get
+    8 free slots for every one that goes to background requests). Each class can also be capped
+    at a number of concurrent requests, to keep slots free for the others.
+
+    Requests of one class are admitted in the order they arrived.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        weights: t.Optional[t.Dict[str, float]] = None,
+        caps: t.Optional[t.Dict[str, int]] = None,
+        limiter: t.Optional[AdaptiveLimiter] = None,
+    ):
+        """
+        :param max_concurrency: Maximum number of concurrent requests over all classes.
+        :type max_concurrency: int
+        :param weights: Priority classes and their shares of the concurrency
+          (default is `DEFAULT_PRIORITY_WEIGHTS`).
+        :type weights: Optional[Dict[str, float]]
+        :param caps: Optional maximum number of concurrent requests per class.
+        :type caps: Optional[Dict[str, int]]
+        :param limiter: Optional adaptive limit to stay under as well (set by the client
+          when `adaptive_concurrency` is enabled).
+        :type limiter: Optional[AdaptiveLimiter]
+        :raises ValueError: If a weight is not positive, or a cap is for an unknown class.
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.weights = dict(weights or DEFAULT_PRIORITY_WEIGHTS)
+        self.caps = dict(caps or {})
+        self.limiter = limiter
+
+        if not self.weights or min(self.weights.values()) <= 0:
+            raise ValueError("Priority weights must be positive.")
+        unknown = set(self.caps) - set(self.weights)
+        if unknown:
+            raise ValueError(f"Caps for unknown priority classes: {', '.join(sorted(unknown))}.")
+
+        self.in_flight = 0
+        self.__queues: t.Dict[str, t.Deque[t.List[bool]]] = {
+            name: deque() for name in self.weights
+        }
+        self.__running = dict.fromkeys(self.weights, 0)
+        self.__served = dict.fromkeys(self.weights, 0)
+        self.__pass = dict.fromkeys(self.weights, 0.0)
+        self.__condition = threading.Condition()
+
+    def __getstate__(self) -> t.Dict:
+        # Conditions can't be pickled; the client re-attaches its limiter after unpickling
+        return {
+            "max_concurrency": self.max_concurrency,
+            "weights": self.weights,
+            "caps": self.caps,
+        }
+
+    def __setstate__(self, state: t.Dict):
+        self.__init__(**state)
+
+    @property
+    def capacity(self) -> int:
+        """
+        :return: The current total concurrency: `max_concurrency`, or the adaptive limit if lower.
+        :rtype: int
+        """
+        if self.limiter is None:
+            return self.max_concurrency
+        return min(self.max_concurrency, self.limiter.stats()["limit"])
+
+    def acquire(self, priority: str = "default"):
+        """
+        Wait until a request of a priority class is admitted.
+        Every call must be followed by a call to `release()` with the same class.
+
+        :param priority: The request's priority class.
+        :type priority: str
+        :raises ValueError: If the priority class is unknown.
+        """
+        if priority not in self.weights:
+            raise ValueError(
+                f"Unknown priority '{priority}' (expected one of: {', '.join(self.weights)})."
+            )
+
+        with self.__condition:
+            if not self.__queues[priority] and not self.__running[priority]:
+                # a class that was idle doesn't get to spend the share it didn't use
+                active = [
+                    self.__pass[name]
+                    for name in self.weights
+                    if self.__queues[name] or self.__running[name]
+                ]
+                if active:
+                    self.__pass[priority] = max(self.__pass[priority], min(active))
+
+            ticket = [False]
+            self.__queues[priority].append(ticket)
+            self.__dispatch()
+            try:
+                while not ticket[0]:
+                    self.__condition.wait()
+            except BaseException:
+                if ticket[0]:
+                    self.__release(priority=priority)
+                else:
+                    self.__queues[priority].remove(ticket)
+                raise
+
+    def release(self, priority: str = "default"):
+        """
+        Free the slot of a finished request, and admit the next ones.
+
+        :param priority: The request's priority class.
+        :type priority: str
+        """
+        with self.__condition:
+            self.__release(priority=priority)
+
+    def stats(self) -> t.Dict[str, t.Dict]:
+        """
+        :return: The number of queued, running and served requests of each priority class.
+        :rtype: Dict[str, Dict]
+        """
+        with self.__condition:
+            return {
+                name: {
+                    "queued": len(self.__queues[name]),
+                    "running": self.__running[name],
+                    "served": self.__served[name],
+                    "weight": self.weights[name],
+                    "cap": self.caps.get(name),
+                }
+                for name in self.weights
+            }
+
+    def __release(self, priority: str):
+        """
+        (Private function) Free a slot; the caller holds the condition.
+        """
+        self.in_flight -= 1
+        self.__running[priority] -= 1
+        self.__dispatch()
+
+    def __dispatch(self):
+        """
+        (Private function) Admit queued requests while there are free slots, each time from the
+        class that has received the least of its share (stride scheduling); the caller holds the condition.
+        """
+        admitted = False
+        capacity = self.capacity
+        while self.in_flight < capacity:
+            ready = [
+                name
+                for name, queue in self.__queues.items()
+                if queue
+                and (self.caps.get(name) is None or self.__running[name] < self.caps[name])
+            ]
+            if not ready:
+                break
+
+            name = min(ready, key=self.__pass.__getitem__)
+            self.__queues[name].popleft()[0] = True
+            self.__pass[name] += 1 / self.weights[name]
+            self.__running[name] += 1
+            self.__served[name] += 1
+            self.in_flight += 1
+            admitted = True
+
+        if admitted:
+            self.__condition.notify_all()
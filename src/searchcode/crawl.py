@@ -0,0 +1,269 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import math
+import time
+import typing as t
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from types import SimpleNamespace
+
+import requests
+
+from .api import Searchcode
+from .filters import LANGUAGES, SOURCES, get_language_ids, get_source_ids
+
+__all__ = ["RESULTS_CAP", "CrawlSlice", "crawl", "split_slice"]
+
+MAX_PAGES = 50
+MAX_PER_PAGE = 100
+RESULTS_CAP = MAX_PAGES * MAX_PER_PAGE
+
+# Internal lines of code bounds. The API accepts 0 to 10000, so -1 and 10001 stand for "no bound".
+_LOC_MIN = -1
+_LOC_MAX = 10001
+
+# Attempts per page, and the delay before the first retry (doubled for each one after it).
+_ATTEMPTS = 3
+_RETRY_BACKOFF = 0.5
+
+_client: t.Optional[Searchcode] = None
+
+
+class CrawlSlice(t.NamedTuple):
+    """
+    A disjoint part of a query's result set, described by search filters.
+
+    `languages` and `sources` hold names or IDs (slices split off by `split_slice()` use the IDs,
+    which also cover facets missing from the filter tables). `lines_of_code_gt` and
+    `lines_of_code_lt` are exclusive bounds, as in `search()`.
+    """
+
+    languages: t.Optional[t.Tuple[t.Union[str, int], ...]] = None
+    sources: t.Optional[t.Tuple[t.Union[str, int], ...]] = None
+    lines_of_code_gt: int = _LOC_MIN
+    lines_of_code_lt: int = _LOC_MAX
+
+    def search_filters(self) -> t.Dict:
+        """
+        :return: The slice as `search()` keyword arguments.
+        :rtype: Dict
+        """
+        return {
+            "languages": list(self.languages) if self.languages else None,
+            "sources": list(self.sources) if self.sources else None,
+            "lines_of_code_gt": (
+                None if self.lines_of_code_gt == _LOC_MIN else self.lines_of_code_gt
+            ),
+            "lines_of_code_lt": (
+                None if self.lines_of_code_lt == _LOC_MAX else self.lines_of_code_lt
+            ),
+        }
+
+
+def _facet_ids(
+    facets: t.Optional[t.List[SimpleNamespace]], total: int
+) -> t.Optional[t.List[int]]:
+    """
+    Get the IDs of the facets with hits, if the facets account for every result.
+    """
+    if not facets or any(getattr(facet, "id", None) is None for facet in facets):
+        return None
+
+    if sum(facet.count for facet in facets) < total:
+        return None
+
+    return [facet.id for facet in facets if facet.count]
+
+
+def split_slice(crawl_slice: CrawlSlice, response: SimpleNamespace) -> t.List[CrawlSlice]:
+    """
+    Split a slice whose total is over the results cap into smaller, disjoint slices.
+
+    Slices are split by source first, then by bisecting the lines of code range,
+    and finally by language once the range holds a single lines of code value.
+    Source and language splits use the IDs of the facets in the probe response when they
+    account for every result, and only include facets that have hits. Splitting on IDs rather
+    than names means a facet the filter tables don't know still gets a filtered slice, instead
+    of one that repeats its parent's results.
+
+    :param crawl_slice: The slice to split.
+    :type crawl_slice: CrawlSlice
+    :param response: The search response of the slice's first page.
+    :type response: SimpleNamespace
+    :return: The smaller slices, or an empty list if the slice cannot be split further.
+    :rtype: List[CrawlSlice]
+    """
+    if crawl_slice.sources is None:
+        ids = _facet_ids(getattr(response, "source_filters", None), response.total)
+        ids = ids or get_source_ids(source_names=list(t.get_args(SOURCES)))
+        return [crawl_slice._replace(sources=(id,)) for id in ids]
+
+    low, high = crawl_slice.lines_of_code_gt, crawl_slice.lines_of_code_lt
+    if high - low > 2:
+        middle = (low + high + 1) // 2
+        return [
+            crawl_slice._replace(lines_of_code_lt=middle),
+            crawl_slice._replace(lines_of_code_gt=middle - 1),
+        ]
+
+    if crawl_slice.languages is None:
+        ids = _facet_ids(getattr(response, "language_filters", None), response.total)
+        ids = ids or get_language_ids(language_names=list(t.get_args(LANGUAGES)))
+        return [crawl_slice._replace(languages=(id,)) for id in ids]
+
+    return []
+
+
+def _init_worker(client: Searchcode):
+    global _client
+    _client = client
+
+
+def _search_page(query: str, crawl_slice: CrawlSlice, page: int) -> SimpleNamespace:
+    """
+    (Worker function) Fetch a page of a slice, retrying failed requests with exponential backoff.
+    """
+    for attempt in range(_ATTEMPTS):
+        try:
+            return _client.search(
+                query=query, page=page, per_page=MAX_PER_PAGE, **crawl_slice.search_filters()
+            )
+        except requests.RequestException:
+            if attempt == _ATTEMPTS - 1:
+                raise
+            time.sleep(_RETRY_BACKOFF * 2**attempt)
+
+
+def _crawl_slice(
+    query: str, crawl_slice: CrawlSlice
+) -> t.Tuple[t.List[CrawlSlice], t.List[SimpleNamespace], bool, t.Optional[t.Tuple[int, str]]]:
+    """
+    (Worker function) Fetch every result of a slice, or split it if it is over the cap.
+
+    A page that still fails after its retries ends the slice; the results of the pages before it are kept.
+
+    :return: Tuple of (sub-slices, results, whether the results were truncated at the cap,
+      and the page that failed with its error, if any).
+    """
+    try:
+        response = _search_page(query=query, crawl_slice=crawl_slice, page=0)
+    except Exception as error:
+        return [], [], False, (0, f"{type(error).__name__}: {error}")
+
+    if response.total > RESULTS_CAP:
+        sub_slices = split_slice(crawl_slice=crawl_slice, response=response)
+        if sub_slices:
+            return sub_slices, [], False, None
+
+    truncated = response.total > RESULTS_CAP
+    results = list(response.results)
+    pages = min(math.ceil(response.total / MAX_PER_PAGE), MAX_PAGES)
+    for page in range(1, pages):
+        try:
+            page_response = _search_page(query=query, crawl_slice=crawl_slice, page=page)
+        except Exception as error:
+            return [], results, truncated, (page, f"{type(error).__name__}: {error}")
+        if not page_response.results:
+            break
+        results.extend(page_response.results)
+
+    return [], results, truncated, None
+
+
+def crawl(
+    client: Searchcode,
+    query: str,
+    languages: t.Optional[t.List[LANGUAGES]] = None,
+    sources: t.Optional[t.List[SOURCES]] = None,
+    lines_of_code_gt: t.Optional[int] = None,
+    lines_of_code_lt: t.Optional[int] = None,
+    processes: t.Optional[int] = None,
+    stats: t.Optional[SimpleNamespace] = None,
+) -> t.Iterator[SimpleNamespace]:
+    """
+    Yield every result of a query, getting past the 50 pages x 100 results cap of `search()`.
+
+    The query is split into disjoint slices (by source, lines of code range and language)
+    until each slice's total fits under the cap. Slices are probed and fetched in parallel
+    across worker processes, and results are de-duplicated by id. Failed requests are retried
+    with exponential backoff; a slice whose page still fails is reported in `stats.failed`,
+    and the crawl carries on with the other slices.
+
+    :param client: The Searchcode client to crawl with (copied into each worker process).
+    :type client: Searchcode
+    :param query: Search term.
+    :type query: str
+    :param languages: Optional languages to restrict the crawl to.
+    :type languages: Optional[List[LANGUAGES]]
+    :param sources: Optional sources to restrict the crawl to.
+    :type sources: Optional[List[SOURCES]]
+    :param lines_of_code_gt: Optional lower (exclusive) lines of code bound.
+    :type lines_of_code_gt: Optional[int]
+    :param lines_of_code_lt: Optional upper (exclusive) lines of code bound.
+    :type lines_of_code_lt: Optional[int]
+    :param processes: Number of worker processes (defaults to the number of CPUs).
+    :type processes: Optional[int]
+    :param stats: Optional namespace that is updated with `slices`, `results`, `duplicates`,
+      `truncated` (slices that could not be split under the cap) and `failed` (a list of
+      (slice, page, error) for slices whose page failed; results before that page are kept)
+      as the crawl runs.
+    :type stats: Optional[SimpleNamespace]
+    :return: An iterator over the unique results.
+    :rtype: Iterator[SimpleNamespace]
+    """
+    stats = stats if stats is not None else SimpleNamespace()
+    stats.slices, stats.results, stats.duplicates, stats.truncated = 0, 0, 0, 0
+    stats.failed = []
+
+    root = CrawlSlice(
+        languages=tuple(languages) if languages else None,
+        sources=tuple(sources) if sources else None,
+        lines_of_code_gt=_LOC_MIN if lines_of_code_gt is None else lines_of_code_gt,
+        lines_of_code_lt=_LOC_MAX if lines_of_code_lt is None else lines_of_code_lt,
+    )
+    seen_ids: t.Set[int] = set()
+
+    executor = ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker, initargs=(client,)
+    )
+    try:
+        pending: t.Dict[Future, CrawlSlice] = {executor.submit(_crawl_slice, query, root): root}
+        while pending:
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                crawl_slice = pending.pop(future)
+                sub_slices, results, truncated, failed = future.result()
+                pending.update(
+                    (executor.submit(_crawl_slice, query, sub_slice), sub_slice)
+                    for sub_slice in sub_slices
+                )
+                if sub_slices:
+                    continue
+
+                stats.slices += 1
+                stats.truncated += truncated
+                if failed:
+                    stats.failed.append((crawl_slice, *failed))
+                for result in results:
+                    if result.id in seen_ids:
+                        stats.duplicates += 1
+                        continue
+                    seen_ids.add(result.id)
+                    stats.results += 1
+                    yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,97 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import typing as t
+from types import SimpleNamespace
+
+from ._lib import snippet_lines
+
+__all__ = ["Deduplicator", "fingerprint"]
+
+
+def fingerprint(result: SimpleNamespace) -> t.Optional[bytes]:
+    """
+    Hash a search result's snippet content, ignoring whitespace and line numbers,
+    so the same snippet from a fork or mirror gets the same fingerprint.
+
+    :param result: The search result to fingerprint.
+    :type result: SimpleNamespace
+    :return: A 16-byte BLAKE2b digest, or None if the snippet has no content.
+    :rtype: Optional[bytes]
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    empty = True
+    for line in snippet_lines(result=result):
+        normalized = " ".join(line.split())
+        if normalized:
+            digest.update(normalized.encode())
+            digest.update(b"\n")
+            empty = False
+
+    return None if empty else digest.digest()
+
+
+class Deduplicator:
+    """
+    Drops search results that were already seen, by id or by snippet content.
+
+    Keeps only the ids and 16-byte fingerprints of the results it has seen,
+    so it can be used across pages, queries and long-running iterations.
+    """
+
+    def __init__(self):
+        self.seen_ids: t.Set[int] = set()
+        self.seen_fingerprints: t.Set[bytes] = set()
+        self.collapsed: int = 0
+
+    def is_duplicate(self, result: SimpleNamespace) -> bool:
+        """
+        Check a result against the results seen so far, and remember it.
+
+        :param result: The search result to check.
+        :type result: SimpleNamespace
+        :return: True if a result with the same id or snippet content was already seen.
+        :rtype: bool
+        """
+        result_fingerprint = fingerprint(result=result)
+        if result.id in self.seen_ids or (
+            result_fingerprint is not None
+            and result_fingerprint in self.seen_fingerprints
+        ):
+            self.collapsed += 1
+            return True
+
+        self.seen_ids.add(result.id)
+        if result_fingerprint is not None:
+            self.seen_fingerprints.add(result_fingerprint)
+        return False
+
+    def __call__(
+        self, results: t.Iterable[SimpleNamespace]
+    ) -> t.Iterator[SimpleNamespace]:
+        """
+        Yield only the results that are not duplicates.
+
+        :param results: The search results to de-duplicate.
+        :type results: Iterable[SimpleNamespace]
+        :return: An iterator over the unique results.
+        :rtype: Iterator[SimpleNamespace]
+        """
+        for result in results:
+            if not self.is_duplicate(result=result):
+                yield result
@@ -0,0 +1,173 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import typing as t
+from types import SimpleNamespace
+
+from ._lib import snippet_lines
+
+__all__ = ["EXPORT_FORMATS", "ArrowSink", "export_results"]
+
+EXPORT_FORMATS = t.Literal["parquet", "arrow"]
+
+_COLUMNS = ("id", "repo", "filename", "language", "linescount", "url", "snippet")
+
+
+def _import_pyarrow():
+    """
+    Import pyarrow, which is an optional dependency.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Exporting to Arrow/Parquet requires pyarrow: pip install searchcode[arrow]"
+        ) from None
+
+    return pyarrow
+
+
+class ArrowSink:
+    """
+    Writes search results to an Arrow IPC or Parquet file in fixed-size record batches.
+
+    Only one batch of results is held in memory at a time, however many results are written.
+    Columns: id, repo, filename, language, linescount, url and snippet (the snippet lines).
+    """
+
+    def __init__(
+        self, path: str, format: EXPORT_FORMATS = "parquet", batch_size: int = 10_000
+    ):
+        """
+        :param path: Path of the file to write.
+        :type path: str
+        :param format: File format, `parquet` or `arrow` (Arrow IPC).
+        :type format: EXPORT_FORMATS
+        :param batch_size: Number of results per record batch (and Parquet row group).
+        :type batch_size: int
+        """
+        pyarrow = _import_pyarrow()
+        self.path = path
+        self.batch_size = batch_size
+        self.count = 0
+
+        self.__pyarrow = pyarrow
+        self.__schema = pyarrow.schema(
+            [
+                ("id", pyarrow.int64()),
+                ("repo", pyarrow.string()),
+                ("filename", pyarrow.string()),
+                ("language", pyarrow.string()),
+                ("linescount", pyarrow.int64()),
+                ("url", pyarrow.string()),
+                ("snippet", pyarrow.large_string()),
+            ]
+        )
+        self.__columns: t.Dict[str, t.List] = {column: [] for column in _COLUMNS}
+
+        if format == "parquet":
+            self.__writer = pyarrow.parquet.ParquetWriter(path, schema=self.__schema)
+        elif format == "arrow":
+            self.__writer = pyarrow.ipc.new_file(path, schema=self.__schema)
+        else:
+            raise ValueError(f"Unsupported export format: {format}")
+
+    def __enter__(self) -> "ArrowSink":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, result: SimpleNamespace):
+        """
+        Add a search result, writing a record batch whenever `batch_size` results are buffered.
+
+        :param result: The search result to write.
+        :type result: SimpleNamespace
+        """
+        columns = self.__columns
+        columns["id"].append(result.id)
+        columns["repo"].append(result.repo)
+        columns["filename"].append(result.filename)
+        columns["language"].append(result.language)
+        columns["linescount"].append(result.linescount)
+        columns["url"].append(getattr(result, "url", None))
+        columns["snippet"].append("\n".join(snippet_lines(result=result)))
+        self.count += 1
+
+        if len(columns["id"]) >= self.batch_size:
+            self.flush()
+
+    def write_all(self, results: t.Iterable[SimpleNamespace]) -> int:
+        """
+        Write every result of an iterable (e.g., `iter_search()` or `crawl()`).
+
+        :param results: The search results to write.
+        :type results: Iterable[SimpleNamespace]
+        :return: Total number of results written to this sink.
+        :rtype: int
+        """
+        for result in results:
+            self.write(result=result)
+
+        return self.count
+
+    def flush(self):
+        """
+        Write the buffered results as a record batch.
+        """
+        if not self.__columns["id"]:
+            return
+
+        batch = self.__pyarrow.RecordBatch.from_pydict(
+            self.__columns, schema=self.__schema
+        )
+        self.__writer.write_batch(batch)
+        self.__columns = {column: [] for column in _COLUMNS}
+
+    def close(self):
+        """
+        Write any buffered results and close the file.
+        """
+        self.flush()
+        self.__writer.close()
+
+
+def export_results(
+    results: t.Iterable[SimpleNamespace],
+    path: str,
+    format: EXPORT_FORMATS = "parquet",
+    batch_size: int = 10_000,
+) -> int:
+    """
+    Write search results to an Arrow IPC or Parquet file.
+
+    :param results: The search results to write (e.g., from `iter_search()` or `crawl()`).
+    :type results: Iterable[SimpleNamespace]
+    :param path: Path of the file to write.
+    :type path: str
+    :param format: File format, `parquet` or `arrow` (Arrow IPC).
+    :type format: EXPORT_FORMATS
+    :param batch_size: Number of results per record batch.
+    :type batch_size: int
+    :return: Number of results written.
+    :rtype: int
+    """
+    with ArrowSink(path=path, format=format, batch_size=batch_size) as sink:
+        return sink.write_all(results=results)
@@ -387,12 +387,13 @@ LANGUAGES = t.Literal[
 ]
 
 
-def get_source_ids(source_names: t.List[SOURCES]) -> t.List[int]:
+def get_source_ids(source_names: t.List[t.Union[SOURCES, int]]) -> t.List[int]:
     """
     Gets a list of source IDs corresponding to the given source names.
+    Unknown names are skipped, and ints (e.g., the `id` of a `source_filters` facet) are kept as they are.
 
-    :param source_names: A list of source names to look up (e.g., "GitHub", "GitLab").
-    :type source_names: List[SOURCES]
+    :param source_names: A list of source names to look up (e.g., "GitHub", "GitLab"), or IDs.
+    :type source_names: List[Union[SOURCES, int]]
     :return: A list of IDs corresponding to the given source names.
     :rtype: List[int]
     """
@@ -415,15 +416,20 @@ def get_source_ids(source_names: t.List[SOURCES]) -> t.List[int]:
         "Sr.ht": 16,
     }
 
-    return [sources[name] for name in source_names if name in sources]
+    return [
+        name if isinstance(name, int) else sources[name]
+        for name in source_names
+        if isinstance(name, int) or name in sources
+    ]
 
 
-def get_language_ids(language_names: t.List[LANGUAGES]) -> t.List:
+def get_language_ids(language_names: t.List[t.Union[LANGUAGES, int]]) -> t.List:
     """
     Gets a list of language IDs corresponding to the given language names.
+    Unknown names are skipped, and ints (e.g., the `id` of a `language_filters` facet) are kept as they are.
 
-    :param language_names: A list of language names to look up (e.g., "Python", "JavaScript").
-    :type language_names: List[LANGUAGES]
+    :param language_names: A list of language names to look up (e.g., "Python", "JavaScript"), or IDs.
+    :type language_names: List[Union[LANGUAGES, int]]
     :return: A list of IDs corresponding to the given language names.
     :rtype: List[int]
     """
@@ -776,4 +782,8 @@ def get_language_ids(language_names: t.List[LANGUAGES]) -> t.List:
         "TL": 378,
     }
 
-    return [languages[name] for name in language_names if name in languages]
+    return [
+        name if isinstance(name, int) else languages[name]
+        for name in language_names
+        if isinstance(name, int) or name in languages
+    ]
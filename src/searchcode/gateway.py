@@ -0,0 +1,284 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import re
+import threading
+import time
+import typing as t
+from collections import defaultdict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+from ._lib import ResponseCache
+from .api import Searchcode
+
+__all__ = ["Gateway", "TokenBucket"]
+
+_ROUTES = re.compile(r"^/api/(codesearch_I/?|jsonp_codesearch_I/?|result/\d+/?)$")
+
+
+class TokenBucket:
+    """
+    A blocking token bucket: allows `rate` acquisitions per second, with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.__tokens = float(self.burst)
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available.
+        """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(
+                    self.burst, self.__tokens + (now - self.__updated) * self.rate
+                )
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.rate
+            time.sleep(wait)
+
+
+class _ClientStats:
+    __slots__ = ("requests", "cache_hits", "coalesced", "upstream", "rejected", "errors")
+
+    def __init__(self):
+        self.requests = self.cache_hits = self.coalesced = 0
+        self.upstream = self.rejected = self.errors = 0
+
+
+class Gateway:
+    """
+    A searchcode-compatible HTTP gateway, serving the `/api/codesearch_I/`, `/api/jsonp_codesearch_I/`
+    and `/api/result/<id>` routes for many internal clients through one shared Searchcode client.
+
+    Responses are cached, identical in-flight requests are coalesced into one upstream request,
+    and upstream requests are rate limited and capped in concurrency. Each client (identified by
+    its `X-Client-Id` header, or its address) can be given a quota of requests per minute, and
+    per-client counters are served as JSON on `/stats`.
+    """
+
+    def __init__(
+        self,
+        client: Searchcode,
+        rate: float = 5.0,
+        burst: int = 10,
+        max_concurrency: int = 8,
+        quota_per_minute: t.Optional[int] = None,
+        cache_ttl: float = 300,
+        cache_entries: int = 4096,
+    ):
+        """
+        :param client: The Searchcode client to forward requests with.
+        :type client: Searchcode
+        :param rate: Maximum upstream requests per second.
+        :type rate: float
+        :param burst: Maximum burst of upstream requests.
+        :type burst: int
+        :param max_concurrency: Maximum concurrent upstream requests.
+        :type max_concurrency: int
+        :param quota_per_minute: Optional maximum requests per client per minute.
+        :type quota_per_minute: Optional[int]
+        :param cache_ttl: Seconds cached responses stay valid.
+        :type cache_ttl: float
+        :param cache_entries: Maximum number of cached responses.
+        :type cache_entries: int
+        """
+        self.client = client
+        self.quota_per_minute = quota_per_minute
+        self.cache = ResponseCache(max_entries=cache_entries, ttl=cache_ttl)
+
+        self.__bucket = TokenBucket(rate=rate, burst=burst)
+        self.__concurrency = threading.BoundedSemaphore(max_concurrency)
+        self.__in_flight: t.Dict[str, Future] = {}
+        self.__lock = threading.Lock()
+        self.__stats: t.Dict[str, _ClientStats] = defaultdict(_ClientStats)
+        self.__windows: t.Dict[str, t.Tuple[int, int]] = {}
+
+    def handle(
+        self, path: str, query: str, client_id: str
+    ) -> t.Tuple[int, str, bytes]:
+        """
+        Answer a request to one of the gateway's routes.
+
+        :param path: The request path (e.g., `/api/codesearch_I/`).
+        :type path: str
+        :param query: The request's query string.
+        :type query: str
+        :param client_id: Identifies the client, for quotas and accounting.
+        :type client_id: str
+        :return: Tuple of (status code, content type, body).
+        :rtype: Tuple[int, str, bytes]
+        """
+        with self.__lock:
+            stats = self.__stats[client_id]
+            stats.requests += 1
+            if not self.__within_quota(client_id=client_id):
+                stats.rejected += 1
+                return 429, "application/json", b'{"error": "quota exceeded"}'
+
+        if not _ROUTES.match(path):
+            return 404, "application/json", b'{"error": "not found"}'
+
+        params = sorted(parse_qsl(query, keep_blank_values=True))
+        key = f"{path}?{json.dumps(params)}"
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self.__lock:
+                stats.cache_hits += 1
+            return (200, *cached)
+
+        with self.__lock:
+            future = self.__in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.__in_flight[key] = Future()
+            else:
+                stats.coalesced += 1
+
+        if leader:
+            self.__fetch(key=key, path=path, params=params, future=future, stats=stats)
+
+        try:
+            return (200, *future.result())
+        except requests.HTTPError as error:
+            status = error.response.status_code if error.response is not None else 502
+            return status, "application/json", json.dumps({"error": str(error)}).encode()
+        except Exception as error:
+            return 502, "application/json", json.dumps({"error": str(error)}).encode()
+
+    def stats(self) -> t.Dict:
+        """
+        :return: Per-client request counters, and cache statistics.
+        :rtype: Dict
+        """
+        with self.__lock:
+            clients = {
+                client_id: {name: getattr(stats, name) for name in _ClientStats.__slots__}
+                for client_id, stats in self.__stats.items()
+            }
+        return {
+            "clients": clients,
+            "cache": {
+                "entries": len(self.cache),
+                "hits": self.cache.hits,
+                "misses": self.cache.misses,
+            },
+        }
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8080):
+        """
+        Serve the gateway over HTTP until interrupted.
+
+        :param host: Address to listen on.
+        :type host: str
+        :param port: Port to listen on.
+        :type port: int
+        """
+        with self.make_server(host=host, port=port) as server:
+            server.serve_forever()
+
+    def make_server(self, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+        """
+        :return: An HTTP server for the gateway (not yet serving).
+        :rtype: ThreadingHTTPServer
+        """
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                client_id = self.headers.get("X-Client-Id") or self.client_address[0]
+
+                if url.path == "/stats":
+                    status, content_type = 200, "application/json"
+                    body = json.dumps(gateway.stats()).encode()
+                else:
+                    status, content_type, body = gateway.handle(
+                        path=url.path, query=url.query, client_id=client_id
+                    )
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        return server
+
+    def __within_quota(self, client_id: str) -> bool:
+        """
+        (Private function) Count a request against the client's quota for the current minute.
+        """
+        if self.quota_per_minute is None:
+            return True
+
+        minute = int(time.time() // 60)
+        window, count = self.__windows.get(client_id, (minute, 0))
+        if window != minute:
+            window, count = minute, 0
+        if count >= self.quota_per_minute:
+            return False
+
+        self.__windows[client_id] = (window, count + 1)
+        return True
+
+    def __fetch(
+        self,
+        key: str,
+        path: str,
+        params: t.List[t.Tuple[str, str]],
+        future: Future,
+        stats: _ClientStats,
+    ):
+        """
+        (Private function) Fetch a response upstream and settle the future waiting on it.
+        """
+        try:
+            with self.__concurrency:
+                self.__bucket.acquire()
+                body, content_type = self.client.request(
+                    path=path[len("/api/") :], params=params
+                )
+            self.cache.set(key, (content_type, body))
+            future.set_result((content_type, body))
+        except Exception as error:
+            future.set_exception(error)
+            with self.__lock:
+                stats.errors += 1
+        finally:
+            with self.__lock:
+                stats.upstream += 1
+                self.__in_flight.pop(key, None)
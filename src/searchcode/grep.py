@@ -0,0 +1,181 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from ._lib import LineMap
+from .index import LocalIndex
+
+__all__ = ["grep", "grep_file"]
+
+_pattern: t.Optional[t.Pattern[str]] = None
+
+
+def grep_file(
+    path: str, pattern: t.Pattern[str], max_count: t.Optional[int] = None
+) -> t.List[t.Tuple[int, str]]:
+    """
+    Find the lines of a file that match a regex.
+
+    The file is decoded as UTF-8 (undecodable bytes are replaced), so `\\w`, `\\b` and case-insensitive
+    matching follow Unicode rules.
+
+    :param path: Path of the file.
+    :type path: str
+    :param pattern: Compiled regex (multi-line mode, so `^` and `$` match at line boundaries).
+    :type pattern: Pattern[str]
+    :param max_count: Optional maximum number of matching lines.
+    :type max_count: Optional[int]
+    :return: List of (line number, line) of the matching lines.
+    :rtype: List[Tuple[int, str]]
+    """
+    matches = []
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as file:
+        data = file.read()
+
+    line_number, counted_to, position = 1, 0, 0
+    while max_count is None or len(matches) < max_count:
+        match = pattern.search(data, position)
+        if match is None:
+            break
+
+        start = data.rfind("\n", 0, match.start()) + 1
+        end = data.find("\n", match.start())
+        end = len(data) if end == -1 else end
+
+        # count newlines only between the previous match and this one
+        line_number += data.count("\n", counted_to, start)
+        counted_to = start
+        matches.append((line_number, data[start:end]))
+
+        # one match per line: resume on the next line
+        position = end + 1
+        if position > len(data):
+            break
+
+    return matches
+
+
+def _init_worker(pattern: str, flags: int):
+    """
+    Compile the pattern once per worker process.
+    """
+    global _pattern
+    _pattern = re.compile(pattern, flags)
+
+
+def _grep_document(
+    task: t.Tuple[int, str, t.Optional[int]]
+) -> t.Tuple[int, t.List[t.Tuple[int, str]]]:
+    """
+    Grep one code file in a worker process.
+    """
+    code_id, path, max_count = task
+    try:
+        return code_id, grep_file(path=path, pattern=_pattern, max_count=max_count)
+    except FileNotFoundError:
+        return code_id, []
+
+
+def grep(
+    pattern: str,
+    index: t.Optional[LocalIndex] = None,
+    languages: t.Optional[t.List[str]] = None,
+    sources: t.Optional[t.List[str]] = None,
+    ignore_case: bool = False,
+    max_count: t.Optional[int] = None,
+    processes: t.Optional[int] = None,
+) -> t.Iterator[SimpleNamespace]:
+    """
+    Search the code files stored in the local index with a regex, without sending any requests.
+
+    Files are searched by a pool of worker processes.
+    Each file with matches is yielded (in id order) as a result shaped like a search result,
+    whose `lines` are the matching lines.
+
+    :param pattern: Regex to search for (Python syntax, multi-line mode).
+    :type pattern: str
+    :param index: The local index to search (defaults to the one at `default_index_path()`).
+    :type index: Optional[LocalIndex]
+    :param languages: Optional language names to restrict the search to.
+    :type languages: Optional[List[str]]
+    :param sources: Optional sources (matched against the repository's host) to restrict the search to.
+    :type sources: Optional[List[str]]
+    :param ignore_case: Whether to match case-insensitively.
+    :type ignore_case: bool
+    :param max_count: Optional maximum number of matching lines per file.
+    :type max_count: Optional[int]
+    :param processes: Number of worker processes (defaults to the number of CPUs).
+      With 1, files are searched in this process.
+    :type processes: Optional[int]
+    :return: An iterator over the files with matches.
+    :rtype: Iterator[SimpleNamespace]
+    :raises re.error: If the pattern is not a valid regex.
+    """
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    compiled = re.compile(pattern, flags)
+
+    owns_index = index is None
+    index = index or LocalIndex()
+    try:
+        documents = {
+            document.id: document
+            for document in index.code_documents(languages=languages, sources=sources)
+        }
+        tasks = [
+            (code_id, index.code_file(code_id), max_count) for code_id in documents
+        ]
+    finally:
+        if owns_index:
+            index.close()
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(tasks) < 2:
+        _init_worker(pattern=compiled.pattern, flags=flags)
+        matches = map(_grep_document, tasks)
+        yield from _to_results(documents=documents, matches=matches)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(compiled.pattern, flags),
+    ) as executor:
+        matches = executor.map(
+            _grep_document, tasks, chunksize=max(1, len(tasks) // (processes * 8))
+        )
+        yield from _to_results(documents=documents, matches=matches)
+
+
+def _to_results(
+    documents: t.Dict[int, SimpleNamespace],
+    matches: t.Iterable[t.Tuple[int, t.List[t.Tuple[int, str]]]],
+) -> t.Iterator[SimpleNamespace]:
+    """
+    Attach each file's matching lines to its metadata, skipping files without matches.
+    """
+    for code_id, lines in matches:
+        if lines:
+            result = documents[code_id]
+            result.lines = LineMap(
+                numbers=(number for number, _ in lines), lines=(line for _, line in lines)
+            )
+            yield result
@@ -0,0 +1,463 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import typing as t
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+from ._lib import LineMap, namespace_to_dict, searchcode_home
+
+__all__ = ["LocalIndex", "default_index_path", "parse_query"]
+
+_QUERY_FILTER = re.compile(r"\b(lang|repo|ext):(\S+)", re.IGNORECASE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    filename TEXT,
+    repo TEXT,
+    source TEXT,
+    language TEXT,
+    linescount INTEGER,
+    url TEXT,
+    lines TEXT,
+    has_code INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS documents_language ON documents (language COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS documents_repo ON documents (repo);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5 (text, content='');
+"""
+
+
+def default_index_path() -> str:
+    """
+    Get the default index directory: `$SEARCHCODE_HOME/index`, or `~/.searchcode/index`.
+
+    :return: Path of the default index directory.
+    :rtype: str
+    """
+    return os.path.join(searchcode_home(), "index")
+
+
+def parse_query(query: str) -> t.Tuple[t.List[str], t.Dict[str, str]]:
+    """
+    Split a query into its search terms and its `lang:`, `repo:` and `ext:` filters.
+
+    :param query: The query, in searchcode's query syntax.
+    :type query: str
+    :return: Tuple of (terms, filters).
+    :rtype: Tuple[List[str], Dict[str, str]]
+    """
+    filters = {
+        name.lower(): value for name, value in _QUERY_FILTER.findall(string=query)
+    }
+    terms = _QUERY_FILTER.sub(repl="", string=query).split()
+    return terms, filters
+
+
+def _source_of(repo: t.Optional[str]) -> t.Optional[str]:
+    """
+    Get the host a repository is on (e.g., github.com), which identifies its source.
+    """
+    return urlparse(repo).netloc.lower() or None if repo else None
+
+
+class LocalIndex:
+    """
+    A local full-text index of fetched search results and code files.
+
+    Metadata and snippets are stored in SQLite, and searched through a contentless FTS5 table.
+    Full code files are stored as plain files under `code/`, so they are only kept once on disk.
+    """
+
+    def __init__(self, path: t.Optional[str] = None):
+        """
+        :param path: Directory to keep the index in (defaults to `default_index_path()`).
+        :type path: Optional[str]
+        """
+        self.path = path or default_index_path()
+        self.code_path = os.path.join(self.path, "code")
+        os.makedirs(self.code_path, exist_ok=True)
+
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(
+            os.path.join(self.path, "index.db"), check_same_thread=False
+        )
+        self.__db.row_factory = sqlite3.Row
+        self.__db.executescript(_SCHEMA)
+
+    def close(self):
+        self.__db.close()
+
+    def __enter__(self) -> "LocalIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def code_file(self, __id: int) -> str:
+        """
+        :param __id: The unique identifier of the code file.
+        :type __id: int
+        :return: Path of the file a code file's body is stored in.
+        :rtype: str
+        """
+        return os.path.join(self.code_path, str(__id))
+
+    def add_results(self, results: t.Iterable[SimpleNamespace]) -> int:
+        """
+        Add (or update) search results in the index.
+
+        Results that carry their code file (e.g., from `search(..., with_code=True)`) store it too.
+
+        :param results: The search results to add.
+        :type results: Iterable[SimpleNamespace]
+        :return: Number of results added.
+        :rtype: int
+        """
+        count = 0
+        with self.__lock, self.__db:
+            for result in results:
+                lines = namespace_to_dict(obj=getattr(result, "lines", None)) or {}
+                self.__upsert(
+                    code_id=result.id,
+                    filename=result.filename,
+                    repo=result.repo,
+                    language=result.language,
+                    linescount=result.linescount,
+                    url=getattr(result, "url", None),
+                    lines=lines,
+                    code=getattr(result, "code", None),
+                )
+                count += 1
+
+        return count
+
+    def add_code(
+        self,
+        __id: int,
+        data: SimpleNamespace,
+        result: t.Optional[SimpleNamespace] = None,
+    ):
+        """
+        Add (or update) a code file in the index.
+
+        :param __id: The unique identifier of the code file.
+        :type __id: int
+        :param data: The code file, as returned by `Searchcode.code()`.
+        :type data: SimpleNamespace
+        :param result: Optional search result of the same file, for its metadata.
+        :type result: Optional[SimpleNamespace]
+        """
+        with self.__lock, self.__db:
+            existing = self.__db.execute(
+                "SELECT * FROM documents WHERE id = ?", (__id,)
+            ).fetchone()
+            metadata = dict(existing) if existing else {}
+            if result is not None:
+                metadata.update(
+                    filename=result.filename,
+                    repo=result.repo,
+                    linescount=result.linescount,
+                    url=getattr(result, "url", None),
+                )
+
+            self.__upsert(
+                code_id=__id,
+                filename=metadata.get("filename"),
+                repo=metadata.get("repo"),
+                language=getattr(data, "language", None) or metadata.get("language"),
+                linescount=metadata.get("linescount") or data.code.count("\n") + 1,
+                url=metadata.get("url"),
+                lines=json.loads(metadata["lines"]) if metadata.get("lines") else {},
+                code=data.code,
+            )
+
+    def document(self, __id: int) -> t.Optional[SimpleNamespace]:
+        """
+        Get the metadata of an indexed document.
+
+        :param __id: The unique identifier of the code file.
+        :type __id: int
+        :return: The document's metadata (id, filename, repo, language, linescount and url),
+          or None if it is not indexed.
+        :rtype: Optional[SimpleNamespace]
+        """
+        row = self.__db.execute(
+            "SELECT id, filename, repo, language, linescount, url FROM documents WHERE id = ?",
+            (__id,),
+        ).fetchone()
+        return SimpleNamespace(**dict(row)) if row else None
+
+    def code(self, __id: int) -> t.Optional[SimpleNamespace]:
+        """
+        Get a code file from the index.
+
+        :param __id: The unique identifier of the code file.
+        :type __id: int
+        :return: SimpleNamespace with `code` and `language`, or None if the file is not indexed.
+        :rtype: Optional[SimpleNamespace]
+        """
+        row = self.__db.execute(
+            "SELECT language FROM documents WHERE id = ? AND has_code", (__id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        with open(self.code_file(__id), encoding="utf-8") as file:
+            return SimpleNamespace(code=file.read(), language=row["language"])
+
+    def search(
+        self,
+        query: str,
+        page: int = 0,
+        per_page: int = 100,
+        pages: int = 1,
+        languages: t.Optional[t.List[str]] = None,
+        sources: t.Optional[t.List[str]] = None,
+        lines_of_code_gt: t.Optional[int] = None,
+        lines_of_code_lt: t.Optional[int] = None,
+    ) -> SimpleNamespace:
+        """
+        Search the index with searchcode's query syntax (including `lang:`, `repo:` and `ext:`).
+
+        :param query: Search term.
+        :type query: str
+        :param page: Result page starting at 0.
+        :type page: int
+        :param per_page: Number of results wanted per page.
+        :type per_page: int
+        :param pages: Number of consecutive pages to return, starting at `page`.
+        :type pages: int
+        :param languages: Optional language names (case-insensitive).
+        :type languages: Optional[List[str]]
+        :param sources: Optional sources, matched against the repository's host
+          (e.g., `GitHub` matches github.com).
+        :type sources: Optional[List[str]]
+        :param lines_of_code_gt: Optional (exclusive) lower lines of code bound.
+        :type lines_of_code_gt: Optional[int]
+        :param lines_of_code_lt: Optional (exclusive) upper lines of code bound.
+        :type lines_of_code_lt: Optional[int]
+        :return: SimpleNamespace with `total` and `results`, shaped like a `search()` response.
+        :rtype: SimpleNamespace
+        """
+        terms, filters = parse_query(query=query)
+        clauses, params = self.__metadata_clauses(languages=languages, sources=sources)
+        if lines_of_code_gt is not None:
+            clauses.append("documents.linescount > ?")
+            params.append(lines_of_code_gt)
+        if lines_of_code_lt is not None:
+            clauses.append("documents.linescount < ?")
+            params.append(lines_of_code_lt)
+
+        if terms:
+            clauses.append(
+                "documents.id IN (SELECT rowid FROM documents_fts WHERE documents_fts MATCH ?)"
+            )
+            params.append(" ".join('"' + term.replace('"', '""') + '"' for term in terms))
+        if "lang" in filters:
+            clauses.append("documents.language = ? COLLATE NOCASE")
+            params.append(filters["lang"])
+        if "repo" in filters:
+            clauses.append("documents.repo LIKE ?")
+            params.append(f"%{filters['repo']}%")
+        if "ext" in filters:
+            clauses.append("documents.filename LIKE ?")
+            params.append(f"%.{filters['ext'].lstrip('.')}")
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        total = self.__db.execute(
+            f"SELECT COUNT(*) FROM documents {where}", params
+        ).fetchone()[0]
+        rows = self.__db.execute(
+            f"SELECT * FROM documents {where} ORDER BY id LIMIT ? OFFSET ?",
+            [*params, per_page * pages, page * per_page],
+        ).fetchall()
+
+        return SimpleNamespace(
+            query=query,
+            total=total,
+            page=page,
+            results=[self.__row_to_result(row=row, terms=terms) for row in rows],
+        )
+
+    def code_documents(
+        self,
+        languages: t.Optional[t.List[str]] = None,
+        sources: t.Optional[t.List[str]] = None,
+    ) -> t.List[SimpleNamespace]:
+        """
+        List the indexed documents that have a stored code file, optionally filtered by their metadata.
+
+        :param languages: Optional language names (case-insensitive).
+        :type languages: Optional[List[str]]
+        :param sources: Optional sources, matched against the repository's host
+          (e.g., `GitHub` matches github.com).
+        :type sources: Optional[List[str]]
+        :return: The documents' metadata (id, filename, repo, language, linescount and url), ordered by id.
+        :rtype: List[SimpleNamespace]
+        """
+        clauses, params = self.__metadata_clauses(languages=languages, sources=sources)
+        clauses.insert(0, "has_code")
+
+        rows = self.__db.execute(
+            "SELECT id, filename, repo, language, linescount, url FROM documents "
+            f"WHERE {' AND '.join(clauses)} ORDER BY id",
+            params,
+        ).fetchall()
+        return [SimpleNamespace(**dict(row)) for row in rows]
+
+    def stats(self) -> SimpleNamespace:
+        """
+        :return: SimpleNamespace with the number of indexed `documents` and `code_files`, and the `path`.
+        :rtype: SimpleNamespace
+        """
+        documents, code_files = self.__db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(has_code), 0) FROM documents"
+        ).fetchone()
+        return SimpleNamespace(documents=documents, code_files=code_files, path=self.path)
+
+    def clear(self):
+        """
+        Remove everything from the index.
+        """
+        with self.__lock, self.__db:
+            self.__db.execute("DELETE FROM documents")
+            self.__db.execute("INSERT INTO documents_fts(documents_fts) VALUES ('delete-all')")
+        shutil.rmtree(self.code_path, ignore_errors=True)
+        os.makedirs(self.code_path, exist_ok=True)
+
+    @staticmethod
+    def __metadata_clauses(
+        languages: t.Optional[t.List[str]], sources: t.Optional[t.List[str]]
+    ) -> t.Tuple[t.List[str], t.List[t.Any]]:
+        """
+        (Private function) Build the WHERE clauses (and their parameters) of language and source filters.
+        """
+        clauses, params = [], []
+        if languages:
+            clauses.append(
+                f"language COLLATE NOCASE IN ({', '.join('?' * len(languages))})"
+            )
+            params.extend(languages)
+        if sources:
+            clauses.append(
+                f"({' OR '.join('source LIKE ?' for _ in sources)})"
+            )
+            params.extend(f"%{source.replace(' ', '').lower()}%" for source in sources)
+
+        return clauses, params
+
+    def __document_text(
+        self, code_id: int, has_code: bool, lines: t.Dict[str, str]
+    ) -> str:
+        """
+        (Private function) Get the text a document is indexed with: its code file if stored,
+        otherwise its snippet lines.
+        """
+        if has_code:
+            with open(self.code_file(code_id), encoding="utf-8") as file:
+                return file.read()
+
+        return "\n".join(line for _, line in sorted(lines.items(), key=lambda x: int(x[0])))
+
+    def __upsert(
+        self,
+        code_id: int,
+        filename: t.Optional[str],
+        repo: t.Optional[str],
+        language: t.Optional[str],
+        linescount: t.Optional[int],
+        url: t.Optional[str],
+        lines: t.Dict[str, str],
+        code: t.Optional[str] = None,
+    ):
+        """
+        (Private function) Insert or replace a document and its full-text entry.
+
+        The FTS table is contentless, so an old entry can only be deleted with the
+        exact text it was indexed with, which is rebuilt before it is overwritten.
+        """
+        existing = self.__db.execute(
+            "SELECT has_code, lines FROM documents WHERE id = ?", (code_id,)
+        ).fetchone()
+        if existing:
+            old_text = self.__document_text(
+                code_id, bool(existing["has_code"]), json.loads(existing["lines"] or "{}")
+            )
+            self.__db.execute(
+                "INSERT INTO documents_fts(documents_fts, rowid, text) VALUES ('delete', ?, ?)",
+                (code_id, old_text),
+            )
+
+        has_code = code is not None or bool(existing and existing["has_code"])
+        if code is not None:
+            with open(self.code_file(code_id), "w", encoding="utf-8") as file:
+                file.write(code)
+
+        self.__db.execute(
+            "INSERT OR REPLACE INTO documents "
+            "(id, filename, repo, source, language, linescount, url, lines, has_code) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                code_id,
+                filename,
+                repo,
+                _source_of(repo=repo),
+                language,
+                linescount,
+                url,
+                json.dumps(lines),
+                has_code,
+            ),
+        )
+        self.__db.execute(
+            "INSERT INTO documents_fts(rowid, text) VALUES (?, ?)",
+            (code_id, code if code is not None else self.__document_text(code_id, has_code, lines)),
+        )
+
+    def __row_to_result(self, row: sqlite3.Row, terms: t.List[str]) -> SimpleNamespace:
+        """
+        (Private function) Convert a document row into a search result.
+
+        Documents that only have a code file get a snippet of the lines matching the terms.
+        """
+        lines = json.loads(row["lines"] or "{}")
+        if not lines and row["has_code"]:
+            lowered_terms = [term.lower() for term in terms]
+            with open(self.code_file(row["id"]), encoding="utf-8") as file:
+                for line_number, line in enumerate(file, start=1):
+                    if not lowered_terms or any(term in line.lower() for term in lowered_terms):
+                        lines[str(line_number)] = line.rstrip("\n")
+                        if len(lines) >= 10:
+                            break
+
+        return SimpleNamespace(
+            id=row["id"],
+            filename=row["filename"],
+            repo=row["repo"],
+            language=row["language"],
+            linescount=row["linescount"],
+            url=row["url"],
+            lines=LineMap.from_dict(lines),
+        )
@@ -0,0 +1,234 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import math
+import threading
+import typing as t
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+from .api import Searchcode
+from .filters import LANGUAGES, SOURCES
+
+# source names as they appear in a repository's host (e.g., "Fedora Project" in fedoraproject.org)
+_SOURCE_HOSTS = {name.replace(" ", "").lower(): name for name in t.get_args(SOURCES)}
+
+__all__ = ["LINESCOUNT_BUCKETS", "STATS_FIELDS", "aggregate_stats"]
+
+STATS_FIELDS = ("language", "source", "repo", "linescount")
+
+LINESCOUNT_BUCKETS = (10, 50, 100, 500, 1000, 5000)
+
+
+def _bucket_labels(bounds: t.Sequence[int]) -> t.List[str]:
+    """
+    Label the linescount buckets split at the bounds, e.g. `<10`, `10-49`, ..., `5000+`.
+    """
+    return [
+        f"<{bounds[0]}",
+        *(f"{low}-{high - 1}" for low, high in zip(bounds, bounds[1:])),
+        f"{bounds[-1]}+",
+    ]
+
+
+def _source_name(repo: t.Optional[str]) -> t.Optional[str]:
+    """
+    Get the name of the source a repository is on, as in the `source_filters` facets
+    (e.g., GitHub for github.com), or its host if no source name is part of it.
+    """
+    host = urlparse(repo or "").netloc.lower()
+    return next((name for key, name in _SOURCE_HOSTS.items() if key in host), host or None)
+
+
+def _facet_counts(
+    facets: t.Optional[t.List[SimpleNamespace]], field: str, total: int
+) -> t.Optional[Counter]:
+    """
+    Get the counts of the facets, if they account for every result.
+    """
+    if not facets or sum(facet.count for facet in facets) < total:
+        return None
+
+    return Counter({getattr(facet, field): facet.count for facet in facets if facet.count})
+
+
+def _count_facets(stats: SimpleNamespace, response: SimpleNamespace, fields: t.Sequence[str]):
+    """
+    Take the language and source counts from the facets of a response, where they account for every result.
+    """
+    for field, facets in (
+        ("language", getattr(response, "language_filters", None)),
+        ("source", getattr(response, "source_filters", None)),
+    ):
+        counts = (
+            _facet_counts(facets=facets, field=field, total=stats.total)
+            if field in fields
+            else None
+        )
+        if counts is not None:
+            setattr(stats, field, counts)
+            stats.from_facets.append(field)
+
+
+def _count_results(
+    stats: SimpleNamespace,
+    results: t.List[SimpleNamespace],
+    fields: t.Sequence[str],
+    buckets: t.Sequence[int],
+    labels: t.Sequence[str],
+):
+    """
+    Count a page of results into the Counters of the fields.
+    """
+    for result in results:
+        if "language" in fields:
+            stats.language[result.language] += 1
+        if "source" in fields:
+            stats.source[_source_name(repo=result.repo)] += 1
+        if "repo" in fields:
+            stats.repo[result.repo] += 1
+        if "linescount" in fields:
+            stats.linescount[labels[bisect.bisect_right(buckets, result.linescount or 0)]] += 1
+    stats.counted += len(results)
+
+
+def aggregate_stats(
+    client: Searchcode,
+    query: str,
+    pages: int = 10,
+    per_page: int = 100,
+    languages: t.Optional[t.List[LANGUAGES]] = None,
+    sources: t.Optional[t.List[SOURCES]] = None,
+    lines_of_code_gt: t.Optional[int] = None,
+    lines_of_code_lt: t.Optional[int] = None,
+    fields: t.Sequence[str] = STATS_FIELDS,
+    buckets: t.Sequence[int] = LINESCOUNT_BUCKETS,
+    workers: int = 4,
+    on_page: t.Optional[t.Callable[[int, int], None]] = None,
+) -> SimpleNamespace:
+    """
+    Count the results of a query by language, source, repository and linescount bucket.
+
+    Language and source counts come from the facet totals of the first page when they account
+    for every result (so they cover the whole result set, not just the fetched pages). Only if
+    another field is asked for, or the facets are missing, are the remaining pages fetched,
+    concurrently, and counted as they arrive; no results are kept.
+    Counts from pages use the source name found in the repository's host (e.g., GitHub for
+    github.com), like the facets, or the host itself if none is. A page that fails is recorded
+    in `failed` and the other pages are still counted, so the stats are partial.
+
+    :param client: The Searchcode client to search with.
+    :type client: Searchcode
+    :param query: Search term.
+    :type query: str
+    :param pages: Maximum number of pages to count (at most 50).
+    :type pages: int
+    :param per_page: Number of results per page (at most 100).
+    :type per_page: int
+    :param languages: Optional language filters.
+    :type languages: Optional[List[LANGUAGES]]
+    :param sources: Optional source filters.
+    :type sources: Optional[List[SOURCES]]
+    :param lines_of_code_gt: Optional lower lines of code filter.
+    :type lines_of_code_gt: Optional[int]
+    :param lines_of_code_lt: Optional upper lines of code filter.
+    :type lines_of_code_lt: Optional[int]
+    :param fields: Fields to count by (any of `STATS_FIELDS`).
+    :type fields: Sequence[str]
+    :param buckets: Ascending bounds of the linescount buckets.
+    :type buckets: Sequence[int]
+    :param workers: Maximum number of pages fetched concurrently.
+    :type workers: int
+    :param on_page: Optional callable called with (page, number of results) after each page.
+    :type on_page: Optional[Callable[[int, int], None]]
+    :return: SimpleNamespace with the `total` number of results, the number of results `counted`
+      from pages, the number of `pages` fetched, a Counter per field (`language`, `source`, `repo`,
+      `linescount`; None for fields not asked for), `from_facets`, the fields counted from facets,
+      and `failed`, a list of (page, error) for the pages that could not be fetched.
+    :rtype: SimpleNamespace
+    :raises ValueError: If a field is unknown.
+    :raises requests.RequestException: If the first page can't be fetched.
+    """
+    unknown = set(fields) - set(STATS_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown stats fields: {', '.join(sorted(unknown))}.")
+
+    params = dict(
+        query=query,
+        per_page=per_page,
+        languages=languages,
+        sources=sources,
+        lines_of_code_gt=lines_of_code_gt,
+        lines_of_code_lt=lines_of_code_lt,
+    )
+    first = client.search(page=0, **params)
+    stats = SimpleNamespace(
+        total=first.total or 0,
+        counted=0,
+        pages=1,
+        from_facets=[],
+        failed=[],
+        **{field: Counter() if field in fields else None for field in STATS_FIELDS},
+    )
+
+    _count_facets(stats=stats, response=first, fields=fields)
+
+    # fields left to count from the results themselves
+    counting = [field for field in fields if field not in stats.from_facets]
+    if not counting:
+        return stats
+
+    labels = _bucket_labels(bounds=buckets)
+    lock = threading.Lock()
+
+    def count(results: t.List[SimpleNamespace]):
+        _count_results(
+            stats=stats, results=results, fields=counting, buckets=buckets, labels=labels
+        )
+
+    count(results=first.results)
+    if on_page:
+        on_page(0, len(first.results))
+
+    last_page = min(pages, 50, math.ceil(stats.total / per_page)) - 1
+
+    def fetch(page: int) -> int:
+        # counted on the worker, so each page is dropped as soon as it has been counted
+        results = client.search(page=page, **params).results
+        with lock:
+            count(results=results)
+            stats.pages += 1
+        return len(results)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(fetch, page): page for page in range(1, last_page + 1)
+        }
+        for future in as_completed(futures):
+            page = futures[future]
+            try:
+                counted = future.result()
+            except Exception as error:
+                stats.failed.append((page, f"{type(error).__name__}: {error}"))
+                continue
+            if on_page:
+                on_page(page, counted)
+
+    return stats
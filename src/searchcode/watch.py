@@ -0,0 +1,136 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+import typing as t
+from types import SimpleNamespace
+
+from .api import Searchcode
+from .dedupe import fingerprint
+from .filters import LANGUAGES, SOURCES
+
+__all__ = ["Watcher", "watch"]
+
+
+class Watcher:
+    """
+    Re-runs a search and reports only the results that are new or changed since the last poll.
+
+    Each page is requested conditionally (If-None-Match/If-Modified-Since) where the server
+    supports it, and paging stops at the first page that is unmodified or only has known results.
+    """
+
+    def __init__(
+        self,
+        client: Searchcode,
+        query: str,
+        pages: int = 5,
+        per_page: int = 100,
+        languages: t.Optional[t.List[LANGUAGES]] = None,
+        sources: t.Optional[t.List[SOURCES]] = None,
+        lines_of_code_gt: t.Optional[int] = None,
+        lines_of_code_lt: t.Optional[int] = None,
+    ):
+        """
+        :param client: The Searchcode client to poll with.
+        :type client: Searchcode
+        :param query: Search term.
+        :type query: str
+        :param pages: Maximum number of pages to fetch per poll.
+        :type pages: int
+        :param per_page: Number of results per page.
+        :type per_page: int
+        """
+        self.client = client
+        self.query = query
+        self.pages = max(1, min(pages, 50))
+        self.per_page = per_page
+        self.filters = {
+            "languages": languages,
+            "sources": sources,
+            "lines_of_code_gt": lines_of_code_gt,
+            "lines_of_code_lt": lines_of_code_lt,
+        }
+        self.requests = 0
+        self.not_modified = 0
+        self.__known: t.Dict[int, t.Optional[bytes]] = {}
+        self.__validators: t.Dict[int, t.Dict[str, str]] = {}
+
+    def poll(self) -> t.List[SimpleNamespace]:
+        """
+        Run the search once.
+
+        :return: The results whose ids are new, or whose snippets changed, since the last poll.
+        :rtype: List[SimpleNamespace]
+        """
+        changes = []
+
+        for page in range(self.pages):
+            self.requests += 1
+            response = self.client.search(
+                query=self.query,
+                page=page,
+                per_page=self.per_page,
+                validators=self.__validators.setdefault(page, {}),
+                **self.filters,
+            )
+            if response is None:
+                self.not_modified += 1
+                break
+
+            page_changes = []
+            for result in response.results:
+                result_fingerprint = fingerprint(result=result)
+                if (
+                    result.id not in self.__known
+                    or self.__known[result.id] != result_fingerprint
+                ):
+                    self.__known[result.id] = result_fingerprint
+                    page_changes.append(result)
+
+            changes.extend(page_changes)
+            if not page_changes or len(response.results) < self.per_page:
+                break
+
+        return changes
+
+
+def watch(
+    client: Searchcode,
+    query: str,
+    interval: float = 300,
+    **watcher_options,
+) -> t.Iterator[t.List[SimpleNamespace]]:
+    """
+    Poll a search forever, yielding the new or changed results of each poll.
+
+    The first poll yields every result (up to `pages`), since none are known yet.
+
+    :param client: The Searchcode client to poll with.
+    :type client: Searchcode
+    :param query: Search term.
+    :type query: str
+    :param interval: Seconds to wait between polls.
+    :type interval: float
+    :param watcher_options: Other options for `Watcher` (pages, per_page and search filters).
+    :return: An iterator over each poll's new or changed results.
+    :rtype: Iterator[List[SimpleNamespace]]
+    """
+    watcher = Watcher(client=client, query=query, **watcher_options)
+    while True:
+        yield watcher.poll()
+        time.sleep(interval)
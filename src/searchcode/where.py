@@ -0,0 +1,279 @@
+"""
+Copyright (C) 2024  Ritchie Mwewa
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import fnmatch
+import re
+import typing as t
+from types import SimpleNamespace
+
+from ._lib import snippet_lines
+
+__all__ = [
+    "Where",
+    "code_matches",
+    "filename_matches",
+    "language_in",
+    "line_matches",
+    "linescount_between",
+    "repo_matches",
+]
+
+Predicate = t.Callable[[SimpleNamespace], bool]
+
+_CLAUSE = re.compile(r"^\s*(?P<field>\w+)\s*(?P<op>!~|~|!=|>=|<=|=|>|<)\s*(?P<value>.*?)\s*$")
+
+
+def _compile_globs(globs: t.Iterable[str], ignore_case: bool = False) -> t.Pattern:
+    """
+    Compile glob patterns into one regex that matches if any of them does.
+    """
+    if not globs:
+        raise ValueError("Expected at least one glob.")
+
+    return re.compile(
+        "|".join(fnmatch.translate(glob) for glob in globs),
+        re.IGNORECASE if ignore_case else 0,
+    )
+
+
+def line_matches(pattern: str) -> Predicate:
+    """
+    :param pattern: Regex to search each snippet line for.
+    :type pattern: str
+    :return: A predicate that holds if any snippet line of a result matches.
+    :rtype: Callable[[SimpleNamespace], bool]
+    """
+    search = re.compile(pattern).search
+    return lambda result: any(search(line) for line in snippet_lines(result=result))
+
+
+def _reads_code(predicate: Predicate) -> Predicate:
+    """
+    Mark a predicate as one that reads a result's code file, so `search()` and `iter_search()`
+    apply it after the code files are attached. Results without their code never match it.
+    """
+
+    def reads_code(result: SimpleNamespace) -> bool:
+        return getattr(result, "code", None) is not None and predicate(result)
+
+    reads_code.needs_code = True
+    return reads_code
+
+
+def code_matches(pattern: str) -> Predicate:
+    """
+    :param pattern: Regex to search a result's code file for (multi-line mode).
+      Results without their code attached (see `with_code`) never match.
+    :type pattern: str
+    :return: A predicate that holds if the code file matches.
+    :rtype: Callable[[SimpleNamespace], bool]
+    """
+    search = re.compile(pattern, re.MULTILINE).search
+    return _reads_code(lambda result: bool(search(result.code)))
+
+
+def filename_matches(*globs: str) -> Predicate:
+    """
+    :param globs: Filename glob patterns (e.g., `*.py`, `test_*`).
+    :type globs: str
+    :return: A predicate that holds if a result's filename matches any of the globs.
+    :rtype: Callable[[SimpleNamespace], bool]
+    """
+    match = _compile_globs(globs=globs).match
+    return lambda result: bool(match(result.filename or ""))
+
+
+def repo_matches(*globs: str) -> Predicate:
+    """
+    :param globs: Repository URL glob patterns (e.g., `*github.com/torvalds/*`).
+    :type globs: str
+    :return: A predicate that holds if a result's repository matches any of the globs.
+    :rtype: Callable[[SimpleNamespace], bool]
+    """
+    match = _compile_globs(globs=globs, ignore_case=True).match
+    return lambda result: bool(match(result.repo or ""))
+
+
+def language_in(*languages: str) -> Predicate:
+    """
+    :param languages: Language names (case-insensitive).
+    :type languages: str
+    :return: A predicate that holds if a result is in any of the languages.
+    :rtype: Callable[[SimpleNamespace], bool]
+    """
+    names = {language.lower() for language in languages}
+    return lambda result: (result.language or "").lower() in names
+
+
+def linescount_between(
+    low: t.Optional[int] = None, high: t.Optional[int] = None
+) -> Predicate:
+    """
+    :param low: Minimum number of lines (inclusive).
+    :type low: Optional[int]
+    :param high: Maximum number of lines (inclusive).
+    :type high: Optional[int]
+    :return: A predicate that holds if a result's line count is in the range
+      (results without a line count never match).
+    :rtype: Callable[[SimpleNamespace], bool]
+    """
+    return lambda result: (
+        result.linescount is not None
+        and (low is None or result.linescount >= low)
+        and (high is None or result.linescount <= high)
+    )
+
+
+def _negate(predicate: Predicate) -> Predicate:
+    return lambda result: not predicate(result)
+
+
+def _parse_list_clause(clause: str, field: str, op: str, value: str) -> Predicate:
+    """
+    Compile a `filename`, `repo` or `language` clause (`=` or `!=` a comma-separated list) into a predicate.
+    """
+    values = [item.strip() for item in value.split(",") if item.strip()]
+    if not values:
+        raise ValueError(f"Invalid clause: '{clause}' (expected at least one value).")
+
+    factory = {
+        "filename": filename_matches,
+        "repo": repo_matches,
+        "language": language_in,
+    }[field]
+    predicate = factory(*values)
+    return _negate(predicate) if op == "!=" else predicate
+
+
+def _parse_linescount_clause(clause: str, op: str, value: str) -> Predicate:
+    """
+    Compile a `linescount` comparison clause into a predicate.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid number in clause '{clause}'.") from None
+
+    return {
+        ">": linescount_between(low=number + 1),
+        ">=": linescount_between(low=number),
+        "<": linescount_between(high=number - 1),
+        "<=": linescount_between(high=number),
+        "=": linescount_between(low=number, high=number),
+        "!=": lambda result: result.linescount not in (None, number),
+    }[op]
+
+
+class Where:
+    """
+    A post-filter over search results: holds for a result if all of its predicates hold.
+
+    Predicates are compiled once, when the filter is built. Filters combine with `&`, and
+    can be parsed from clauses of the form `FIELD OP VALUE`:
+
+        - `line~REGEX`, `line!~REGEX`: any snippet line matches (or none does)
+        - `code~REGEX`, `code!~REGEX`: the attached code file matches, or doesn't (see `with_code`;
+          results without their code file match neither)
+        - `filename=GLOB,...`, `filename!=GLOB,...`: the filename matches any glob (or none)
+        - `repo=GLOB,...`, `repo!=GLOB,...`: repository allow and deny lists
+        - `language=NAME,...`, `language!=NAME,...`
+        - `linescount>N`, `linescount>=N`, `linescount<N`, `linescount<=N`, `linescount=N`,
+          `linescount!=N` (results without a line count match none of them)
+    """
+
+    def __init__(self, *predicates: Predicate):
+        """
+        :param predicates: Callables that take a search result and return whether it matches.
+        :type predicates: Callable[[SimpleNamespace], bool]
+        """
+        self.predicates = predicates
+
+    @classmethod
+    def parse(cls, *clauses: str) -> "Where":
+        """
+        Build a filter from clauses (see the class docstring for their syntax).
+
+        :param clauses: The clauses, all of which must hold.
+        :type clauses: str
+        :return: The filter.
+        :rtype: Where
+        :raises ValueError: If a clause is invalid.
+        """
+        return cls(*(cls.__parse_clause(clause=clause) for clause in clauses))
+
+    def __call__(self, result: SimpleNamespace) -> bool:
+        return all(predicate(result) for predicate in self.predicates)
+
+    def __and__(self, other: "Where") -> "Where":
+        return Where(*self.predicates, *other.predicates)
+
+    @property
+    def needs_code(self) -> bool:
+        """
+        :return: Whether any predicate reads the results' code files (e.g., `code~REGEX`).
+        :rtype: bool
+        """
+        return any(getattr(predicate, "needs_code", False) for predicate in self.predicates)
+
+    def split(self) -> t.Tuple[t.Optional["Where"], t.Optional["Where"]]:
+        """
+        Split the filter into the predicates that only read a result's metadata and snippet,
+        and those that read its code file.
+
+        :return: Tuple of (metadata filter, code filter); None for either if it has no predicates.
+        :rtype: Tuple[Optional[Where], Optional[Where]]
+        """
+        code = [p for p in self.predicates if getattr(p, "needs_code", False)]
+        metadata = [p for p in self.predicates if not getattr(p, "needs_code", False)]
+        return Where(*metadata) if metadata else None, Where(*code) if code else None
+
+    def filter(self, results: t.Iterable[SimpleNamespace]) -> t.Iterator[SimpleNamespace]:
+        """
+        :param results: The search results to filter.
+        :type results: Iterable[SimpleNamespace]
+        :return: An iterator over the results that match.
+        :rtype: Iterator[SimpleNamespace]
+        """
+        return filter(self, results)
+
+    @staticmethod
+    def __parse_clause(clause: str) -> Predicate:
+        """
+        (Private function) Compile one `FIELD OP VALUE` clause into a predicate.
+        """
+        match = _CLAUSE.match(clause)
+        if not match or not match["value"]:
+            raise ValueError(f"Invalid clause: '{clause}' (expected FIELD OP VALUE).")
+
+        field, op, value = match["field"].lower(), match["op"], match["value"]
+        try:
+            if field == "line" and op in ("~", "!~"):
+                predicate = line_matches(value)
+                return _negate(predicate) if op == "!~" else predicate
+            elif field == "code" and op in ("~", "!~"):
+                predicate = code_matches(value)
+                return _reads_code(_negate(predicate)) if op == "!~" else predicate
+        except re.error as error:
+            raise ValueError(f"Invalid regex in clause '{clause}': {error}") from None
+
+        if field in ("filename", "repo", "language") and op in ("=", "!="):
+            return _parse_list_clause(clause=clause, field=field, op=op, value=value)
+        if field == "linescount" and op not in ("~", "!~"):
+            return _parse_linescount_clause(clause=clause, op=op, value=value)
+
+        raise ValueError(f"Unsupported clause: '{clause}'.")
+
@@ -15,11 +15,175 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import json
+import threading
+import typing as t
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+from click.testing import CliRunner
+
 from searchcode import Searchcode
+from searchcode._cli.highlight import HIGHLIGHT_STYLE, TermMatcher
+from searchcode._cli import panels
+from searchcode._cli.browse import ResultBrowser
+from searchcode._cli.daemon import daemon_socket_path, forward_to_daemon, run_daemon
+from searchcode._cli.main import _parse_daemon_request, main
+from searchcode._cli.app import _parse_line_range, cli
+from searchcode._cli.panels import (
+    _make_result_panel,
+    page_code,
+    print_panels,
+    render_panels,
+    slice_code_lines,
+)
+from searchcode._lib import LineMap, MemoryReport, SpillableList, memory_phase
+from searchcode._stream import iter_json_array
+from searchcode.balancer import EndpointBalancer
+from searchcode.batch import run_batch
+from searchcode.concurrency import AdaptiveLimiter, RequestScheduler
+from searchcode.crawl import CrawlSlice, crawl, split_slice
+from searchcode.dedupe import Deduplicator
+from searchcode.export import export_results
+from searchcode.gateway import Gateway
+from searchcode.grep import grep
+from searchcode.index import LocalIndex
+from searchcode.stats import aggregate_stats
+from searchcode.watch import Watcher
+from searchcode.where import Where, linescount_between
 
 sc = Searchcode(user_agent="Pytest")
 
 
+class _LocalAPIHandler(BaseHTTPRequestHandler):
+    """
+    Serves a small, fixed stand-in of the searchcode API: 25 results, and code files for any id.
+    """
+
+    total = 25
+    missing_code: t.Set[int] = set()
+
+    def matching_ids(self, params: t.List[t.Tuple[str, str]]) -> t.List[int]:
+        return list(range(self.total))
+
+    def facets(self, ids: t.List[int]) -> t.Dict:
+        return {"language_filters": [{"count": len(ids), "id": 19, "language": "Python"}]}
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        if url.path == "/api/codesearch_I/":
+            page, per_page = int(params.get("p", 0)), int(params.get("per_page", 100))
+            ids = self.matching_ids(params=parse_qsl(url.query))
+            body = {
+                "total": len(ids),
+                "page": page,
+                "results": [
+                    {
+                        "id": id,
+                        "filename": f"file{id}.py",
+                        "repo": f"https://github.com/user/repo{id % 3}",
+                        "language": "Python",
+                        "linescount": 10 + id,
+                        "lines": {"1": f"import module{id}"},
+                    }
+                    for id in ids[page * per_page : (page + 1) * per_page]
+                ],
+                **self.facets(ids=ids),
+            }
+        elif url.path.startswith("/api/result/"):
+            id = int(url.path.rsplit("/", 1)[-1])
+            if id in self.missing_code:
+                self.send_error(404)
+                return
+            body = {"code": f"import module{id}\n", "language": "Python"}
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _CrawlAPIHandler(_LocalAPIHandler):
+    """
+    Serves more results than one query can page through, from two sources (filtered with `src`);
+    the client's filter tables don't know the second one.
+    """
+
+    total = 6000
+
+    @staticmethod
+    def source(id: int) -> int:
+        return 99 if id % 5 == 0 else 2
+
+    def matching_ids(self, params: t.List[t.Tuple[str, str]]) -> t.List[int]:
+        sources = {int(value) for key, value in params if key == "src"}
+        return [id for id in range(self.total) if not sources or self.source(id) in sources]
+
+    def facets(self, ids: t.List[int]) -> t.Dict:
+        mystery = sum(self.source(id) == 99 for id in ids)
+        return {
+            **super().facets(ids=ids),
+            "source_filters": [
+                {"count": len(ids) - mystery, "id": 2, "source": "GitHub"},
+                {"count": mystery, "id": 99, "source": "Mystery"},
+            ],
+        }
+
+
+class _FailingCrawlAPIHandler(_CrawlAPIHandler):
+    """
+    Fails the first request for page 1 of the GitHub slice once, and every page from 2 on of the other slice.
+    """
+
+    flaked: t.Set[str] = set()
+
+    def do_GET(self):
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        page, source = int(params.get("p", 0)), params.get("src")
+        flaky = source == "2" and page == 1 and source not in self.flaked
+        if flaky or (source == "99" and page >= 2):
+            self.flaked.add(source)
+            self.send_error(500)
+            return
+        super().do_GET()
+
+
+def _serve(handler: t.Type[BaseHTTPRequestHandler]) -> t.Iterator[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/api"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def local_api():
+    yield from _serve(handler=_LocalAPIHandler)
+
+
+@pytest.fixture
+def crawl_api():
+    yield from _serve(handler=_CrawlAPIHandler)
+
+
+@pytest.fixture
+def failing_crawl_api(monkeypatch):
+    monkeypatch.setattr(_FailingCrawlAPIHandler, "flaked", set())
+    yield from _serve(handler=_FailingCrawlAPIHandler)
+
+
 def test_filter_by_extension():
     search = sc.search("gsub ext:erb")
     for result in search.results:
@@ -36,6 +200,791 @@ def test_code_result():
     assert language == "C"
 
 
+def test_line_range_parsing_and_slicing(monkeypatch):
+    import rich_click as click
+
+    assert _parse_line_range(None, None, "120-180") == (120, 180)
+    assert _parse_line_range(None, None, "100-") == (100, None)
+    assert _parse_line_range(None, None, "-50") == (None, 50)
+    for value in ("5--3", "0-3", "9-4", "-", "5", "a-b"):
+        with pytest.raises(click.BadParameter):
+            _parse_line_range(None, None, value)
+
+    code = "\n".join(f"line {number}" for number in range(1, 11))
+    assert slice_code_lines(code, 3, 5) == ("line 3\nline 4\nline 5", 3)
+    assert slice_code_lines(code, None, 2) == ("line 1\nline 2", 1)
+    assert slice_code_lines(code, 9, None) == ("line 9\nline 10", 9)
+
+    class Screen:
+        footers = []
+
+        def update(self, renderable):
+            self.footers.append(renderable.renderables[-1].plain.split(" · ")[0])
+
+    keys = iter(["j", " ", "G", "k", "g", "q"])
+    monkeypatch.setattr(panels.click, "getchar", lambda: next(keys))
+    monkeypatch.setattr(panels.console, "height", 7)
+    page_code(code="\n".join(code.splitlines()[2:]), language="text", start_line=3, screen=Screen())
+    assert Screen.footers == [
+        "lines 3-6 of 10",
+        "lines 4-7 of 10",
+        "lines 7-10 of 10",
+        "lines 7-10 of 10",
+        "lines 6-9 of 10",
+        "lines 3-6 of 10",
+    ]
+
+
+def test_iter_json_array_across_chunk_boundaries():
+    results = [{"id": 1, "lines": {"1": 'print("}]")'}}, {"id": 2, "lines": {}}]
+    body = json.dumps({"total": 2, "other": [{"results": []}], "results": results})
+    body = body.encode()
+
+    for size in (1, 3, 64):
+        chunks = (body[i : i + size] for i in range(0, len(body), size))
+        assert list(iter_json_array(chunks=chunks, key="results")) == results
+
+
+def test_run_batch_resumes_from_checkpoint(tmp_path):
+    class Client:
+        calls = []
+
+        def search(self, query, page, per_page=100):
+            self.calls.append((query, page))
+            results = [SimpleNamespace(id=page * per_page + i) for i in range(per_page)]
+            return SimpleNamespace(total=per_page * 3, results=results)
+
+    client = Client()
+    queries = [{"query": "a", "pages": 5, "per_page": 2}, {"query": "b"}]
+    output = tmp_path / "results.jsonl"
+
+    summary = run_batch(client=client, queries=queries, output=str(output))
+    assert summary.pages == 4 and summary.results == 106
+    assert len(output.read_text().splitlines()) == 106
+
+    # malformed entries are skipped, like torn writes
+    with open(f"{output}.checkpoint", "a", encoding="utf-8") as checkpoint:
+        checkpoint.write('{"page": 9}\n[]\n{"key": "x", "page": "one", "last": false}\n{"key": "y", "pa')
+    client.calls.clear()
+    summary = run_batch(client=client, queries=queries, output=str(output))
+    assert client.calls == [] and summary.skipped == 2
+
+
+def test_split_slice_bisects_lines_of_code_into_disjoint_ranges():
+    response = SimpleNamespace(total=10**6)
+    slices = [CrawlSlice(sources=("GitHub",), lines_of_code_gt=99, lines_of_code_lt=200)]
+    leaves = []
+    while slices:
+        crawl_slice = slices.pop()
+        if crawl_slice.lines_of_code_lt - crawl_slice.lines_of_code_gt <= 2:
+            leaves.append(crawl_slice)
+        else:
+            slices.extend(split_slice(crawl_slice=crawl_slice, response=response))
+
+    values = [
+        value
+        for leaf in leaves
+        for value in range(leaf.lines_of_code_gt + 1, leaf.lines_of_code_lt)
+    ]
+    assert sorted(values) == list(range(100, 200))
+
+
+def test_crawl_splits_on_facet_ids_without_duplicates(crawl_api):
+    client = Searchcode(user_agent="Pytest", endpoints=crawl_api)
+    stats = SimpleNamespace()
+
+    ids = [result.id for result in crawl(client=client, query="module", processes=2, stats=stats)]
+    assert sorted(ids) == list(range(6000))
+    # one slice per source facet, including the one missing from the filter tables
+    assert (stats.slices, stats.duplicates, stats.truncated) == (2, 0, 0)
+
+
+def test_crawl_retries_and_reports_failed_slices(failing_crawl_api, monkeypatch):
+    monkeypatch.setattr("searchcode.crawl._RETRY_BACKOFF", 0)
+    client = Searchcode(user_agent="Pytest", endpoints=failing_crawl_api)
+    stats = SimpleNamespace()
+
+    ids = [result.id for result in crawl(client=client, query="module", processes=2, stats=stats)]
+    # the GitHub slice recovers from its flaky page; the other keeps the 2 pages it got before failing
+    mystery = [id for id in range(6000) if id % 5 == 0]
+    assert sorted(ids) == sorted([id for id in range(6000) if id % 5] + mystery[:200])
+    assert stats.slices == 2
+    [(failed_slice, page, error)] = stats.failed
+    assert (failed_slice.sources, page) == ((99,), 2) and "500" in error
+
+
+def test_deduplicator_collapses_same_id_and_same_snippet():
+    results = [
+        SimpleNamespace(id=1, lines=SimpleNamespace(**{"3": "int  x;", "4": "}"})),
+        SimpleNamespace(id=1, lines=SimpleNamespace(**{"3": "other"})),
+        SimpleNamespace(id=2, lines=SimpleNamespace(**{"10": "int x;  ", "11": "}"})),
+        SimpleNamespace(id=3, lines=SimpleNamespace(**{"3": "int y;"})),
+    ]
+    deduplicator = Deduplicator()
+
+    assert [result.id for result in deduplicator(results)] == [1, 3]
+    assert deduplicator.collapsed == 2
+
+
+def test_local_index_search_with_filters(tmp_path):
+    result = SimpleNamespace(
+        id=7,
+        filename="q_math.c",
+        repo="https://github.com/id-Software/Quake-III-Arena",
+        language="C",
+        linescount=1000,
+        url="https://searchcode.com/file/7",
+        lines=SimpleNamespace(**{"552": "float Q_rsqrt( float number )"}),
+    )
+
+    with LocalIndex(path=str(tmp_path)) as index:
+        index.add_results(results=[result])
+        assert index.search("Q_rsqrt lang:c ext:c repo:quake").total == 1
+        assert index.search("Q_rsqrt lang:python").total == 0
+
+        index.add_code(7, SimpleNamespace(code="int main() {}\nfloat Q_rsqrt", language="C"))
+        assert index.search("main").results[0].id == 7
+        assert index.code(7).code.startswith("int main")
+
+        index.add_results(
+            results=[
+                SimpleNamespace(
+                    id=id,
+                    filename=f"{id}.py",
+                    repo=f"https://{'github.com' if id % 2 else 'gitlab.com'}/a/b",
+                    language="Python",
+                    linescount=id,
+                    url=None,
+                    lines=SimpleNamespace(**{"1": "import module"}),
+                )
+                for id in range(10, 30)
+            ]
+        )
+        page = index.search("module", page=1, per_page=4, pages=2)
+        assert page.total == 20 and [result.id for result in page.results] == list(range(14, 22))
+        filtered = index.search(
+            "module", sources=["GitHub"], lines_of_code_gt=20, lines_of_code_lt=27
+        )
+        assert [result.id for result in filtered.results] == [21, 23, 25]
+        assert index.search("module", languages=["c"]).total == 0
+
+
+def test_grep_local_code_files(tmp_path):
+    with LocalIndex(path=str(tmp_path)) as index:
+        for id, (language, repo) in enumerate(
+            [("C", "https://github.com/a/b"), ("Python", "https://bitbucket.org/c/d")]
+        ):
+            result = SimpleNamespace(
+                filename=f"{id}.txt", repo=repo, linescount=3, url=None
+            )
+            code = SimpleNamespace(code=f"first\n// TODO {id}\nlast TODO", language=language)
+            index.add_code(id, code, result)
+        index.add_code(2, SimpleNamespace(code="", language="C"))
+
+        for processes in (1, 2):
+            results = list(grep(r"TODO \d", index=index, processes=processes))
+            assert [(result.id, list(result.lines.numbers)) for result in results] == [
+                (0, [2]),
+                (1, [2]),
+            ]
+            assert results[1].lines.lines == ["// TODO 1"]
+
+        python = grep("todo", index=index, languages=["python"], ignore_case=True)
+        assert [result.id for result in python] == [1]
+        github = list(grep("TODO", index=index, sources=["GitHub"], max_count=1))
+        assert [len(result.lines) for result in github] == [1] and github[0].id == 0
+
+        # patterns match decoded text: Unicode word characters and case folding, replaced bad bytes
+        index.add_code(3, SimpleNamespace(code="x = 1\nÉcole naïve_ÉCOLE\n", language="C"))
+        with open(index.code_file(3), "ab") as file:
+            file.write(b"\xff ecole")
+        [result] = grep(r"\bécole \w+\b|ecole$", index=index, ignore_case=True, processes=1)
+        assert result.id == 3 and result.lines.lines == ["École naïve_ÉCOLE", "\ufffd ecole"]
+
+
+def test_cli_grep_prints_matching_lines(tmp_path, monkeypatch):
+    monkeypatch.setenv("SEARCHCODE_HOME", str(tmp_path))
+    with LocalIndex() as index:
+        code = "def on_handler(request):\n    pass\n\ndef helper():\n    pass\n"
+        index.add_code(
+            7,
+            SimpleNamespace(code=code, language="Python"),
+            SimpleNamespace(filename="app.py", repo="https://github.com/a/b", linescount=5, url=None),
+        )
+
+    result = CliRunner().invoke(cli, ["grep", r"def \w+_handler", "--processes", "1"])
+    assert result.exit_code == 0, result.output
+    assert "app.py" in result.output and "def on_handler(request):" in result.output
+    assert "helper" not in result.output and "1 matching lines in 1 files" in result.output
+
+
+def test_blob_store_dedupes_compresses_and_trains(tmp_path):
+    pytest.importorskip("zstandard")
+    from searchcode.blobstore import BlobStore
+
+    def source(i):
+        return "".join(
+            f"def handler_{i}_{n}(request):\n    return respond(request.data, status={n})\n"
+            for n in range(i % 7, 40)
+        )
+
+    with BlobStore(path=str(tmp_path), train_after=None, dictionary_size=4096) as store:
+        for i in range(300):
+            store.add_code(i, SimpleNamespace(code=source(i), language="Python"))
+        # a vendored copy of file 3 is stored once
+        digest = store.add_code(
+            1000, SimpleNamespace(code=source(3), language="Python"), SimpleNamespace(repo="fork")
+        )
+        assert store.code(3).hash == digest
+
+        assert store.train(samples=300) <= 4096
+        store.add_code(2000, SimpleNamespace(code=source(2000), language="Python"))
+        stats = store.stats()
+
+    assert (stats.codes, stats.blobs, stats.dictionaries) == (302, 301, 1)
+    assert stats.stored * 4 < stats.size
+
+    with BlobStore(path=str(tmp_path)) as store:
+        assert store.code(1000).code == source(3) and store.code(1000).repo == "fork"
+        assert store.code(2000).code == source(2000)
+        assert store.code(5000) is None
+
+
+def test_cli_stores_code_files_with_their_repositories(local_api, tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    from searchcode.blobstore import BlobStore
+
+    monkeypatch.setenv("SEARCHCODE_HOME", str(tmp_path))
+    monkeypatch.setattr(
+        "searchcode._cli.app.sc", Searchcode(user_agent="Pytest", endpoints=local_api)
+    )
+    runner = CliRunner()
+    args = ["search", "module", "--per-page", "5", "--pages", "2", "--with-code", "8", "--store"]
+    assert runner.invoke(cli, args).exit_code == 0
+    assert runner.invoke(cli, [*args, "--stream", "--page", "4"]).exit_code == 0
+    # only the saved search result has the repository of code file 12
+    assert runner.invoke(cli, ["search", "module", "--per-page", "5", "--page", "2", "--save"]).exit_code == 0
+    for id in (12, 16):
+        assert runner.invoke(cli, ["code", str(id), "--store", "--output", str(tmp_path / "out")]).exit_code == 0
+
+    with BlobStore() as store:
+        assert [store.code(id).repo for id in (2, 7, 12, 16, 23)] == [
+            "https://github.com/user/repo2",
+            "https://github.com/user/repo1",
+            "https://github.com/user/repo0",
+            None,
+            "https://github.com/user/repo2",
+        ]
+        assert store.code(8) is None
+        assert store.code(7).code == "import module7\n"
+
+
+def test_export_results_to_parquet_in_batches(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    results = (
+        SimpleNamespace(
+            id=i,
+            repo="https://github.com/boyter/batf",
+            filename=f"{i}.py",
+            language="Python",
+            linescount=i,
+            url=None,
+            lines=SimpleNamespace(**{"2": "b", "1": "a"}),
+        )
+        for i in range(25)
+    )
+    path = tmp_path / "results.parquet"
+
+    assert export_results(results=results, path=str(path), batch_size=10) == 25
+
+    file = parquet.ParquetFile(path)
+    assert file.metadata.num_rows == 25 and file.num_row_groups == 3
+    assert file.read().column("snippet")[0].as_py() == "a\nb"
+
+
+def test_watcher_reports_only_new_or_changed_results():
+    snippets = {1: "a", 2: "b"}
+
+    class Client:
+        def search(self, query, page, per_page, validators, **filters):
+            if validators.get("etag") == str(snippets):
+                return None
+            validators["etag"] = str(snippets)
+            results = [
+                SimpleNamespace(id=id, lines=SimpleNamespace(**{"1": line}))
+                for id, line in snippets.items()
+            ]
+            return SimpleNamespace(total=len(results), results=results)
+
+    watcher = Watcher(client=Client(), query="secret")
+    assert [result.id for result in watcher.poll()] == [1, 2]
+    assert watcher.poll() == [] and watcher.not_modified == 1
+
+    snippets.update({2: "changed", 3: "c"})
+    assert [result.id for result in watcher.poll()] == [2, 3]
+
+
+def test_spillable_list_keeps_order_and_length():
+    with SpillableList(max_in_memory=3) as results:
+        results.extend(SimpleNamespace(id=i) for i in range(10))
+
+        assert len(results) == 10 and results.spilled == 9
+        assert [result.id for result in results] == list(range(10))
+        results.append(SimpleNamespace(id=10))
+        assert [result.id for result in results] == list(range(11))
+
+
+def test_line_map_ranges_and_numbered_text():
+    lines = LineMap.from_dict({"12": "}", "10": "int main() {", "11": "  return 0;  "})
+
+    assert lines.ranges() == [(10, 12)]
+    assert lines.numbered_text == "  10 int main() {\n  11   return 0;\n  12 }"
+    assert getattr(lines, "11") == "  return 0;  " and lines.get(13) is None
+    assert vars(lines) == {"10": "int main() {", "11": "  return 0;  ", "12": "}"}
+
+
+def test_term_matcher_highlights_query_terms_in_one_pass():
+    from rich.console import Console
+
+    matcher = TermMatcher(terms=["he", "she", "his", "hers"])
+    assert matcher.find("ushers and HIS") == [(1, 6), (11, 14)]
+    assert matcher.find("ushers", start=2) == [(2, 6)]
+    assert matcher.find("no terms at all") == [] and matcher.find("his", start=1) == []
+
+    matcher = TermMatcher.from_query('Q_rsqrt "float" lang:c AND')
+    assert matcher.terms == ["float", "q_rsqrt"]
+
+    result = SimpleNamespace(
+        filename="q.c",
+        repo="https://github.com/id/quake",
+        language="C",
+        linescount=3,
+        lines=LineMap(
+            numbers=[12, 13, 14],
+            lines=["float Q_rsqrt(float number)", "  float12", "\t\tx = Q_rsqrt(float);"],
+        ),
+    )
+    console = Console(width=100, color_system="truecolor", force_terminal=True)
+    highlighted = "".join(
+        segment.text if segment.style and segment.style.bgcolor == HIGHLIGHT_STYLE.bgcolor else " "
+        for segment in console.render(_make_result_panel(item=result, matcher=matcher))
+    )
+    assert highlighted.split() == ["float", "Q_rsqrt", "float", "float", "Q_rsqrt", "float"]
+
+
+def test_render_panels_matches_serial_output_and_reads_lazily(monkeypatch):
+    import io
+
+    from rich.console import Console
+
+    def results(pulled: t.Optional[t.List[int]] = None) -> t.Iterator[SimpleNamespace]:
+        for id in range(40):
+            if pulled is not None:
+                pulled.append(id)
+            yield SimpleNamespace(
+                filename=f"{id}.py",
+                repo="https://github.com/user/repo",
+                language="Python",
+                linescount=id,
+                lines=LineMap(numbers=[1, 2], lines=[f"import module{id}", "print(module)"]),
+            )
+
+    file = io.StringIO()
+    monkeypatch.setattr(
+        panels,
+        "console",
+        Console(file=file, width=90, color_system="truecolor", force_terminal=True, log_time=False),
+    )
+    print_panels(data=list(results()), highlight="module")
+    serial = file.getvalue()
+    file.seek(0)
+    file.truncate()
+    print_panels(data=results(), processes=2, highlight="module")
+    assert file.getvalue() == serial
+
+    pulled = []
+    chunks = render_panels(data=results(pulled=pulled), processes=1, chunk_size=2)
+    next(chunks)
+    assert len(pulled) <= 4
+    chunks.close()
+
+
+def test_result_browser_evicts_failed_fetches():
+    class Client:
+        calls = []
+
+        def search(self, query, page, per_page):
+            self.calls.append(page)
+            if self.calls.count(page) == 1:
+                raise ConnectionError("connection reset")
+            return SimpleNamespace(total=1, results=[SimpleNamespace(id=page)])
+
+        def code(self, __id):
+            self.calls.append(f"code {__id}")
+            if self.calls.count(f"code {__id}") == 1:
+                raise TimeoutError("timed out")
+            return SimpleNamespace(code="x", language="Python")
+
+    client = Client()
+    browser = ResultBrowser(client=client, query="module", per_page=1)
+
+    assert browser.get_page(page=0) is None
+    assert browser.error == "Could not fetch page 0: connection reset"
+    assert browser.get_page(page=0).results[0].id == 0
+    assert browser.get_page(page=0).total == 1 and client.calls == [0, 0]
+
+    assert browser.get_code(7) is None and browser.error.startswith("Could not fetch code file 7")
+    assert browser.get_code(7).code == "x"
+    assert browser.get_code(7).code == "x" and client.calls.count("code 7") == 2
+
+
+def test_daemon_round_trip(local_api, tmp_path, monkeypatch, capsys):
+    import os
+    import stat
+    import time
+
+    monkeypatch.setenv("SEARCHCODE_HOME", str(tmp_path / "home"))
+    monkeypatch.setenv("SEARCHCODE_ENDPOINTS", local_api)
+    thread = threading.Thread(target=run_daemon, daemon=True)
+    thread.start()
+    path = daemon_socket_path()
+    while not forward_to_daemon(command="ping", params={}, timeout=1):
+        time.sleep(0.05)
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) == 0o700
+
+    params = {"query": "module", "per_page": 10, "pages": 2, "width": 80, "color_system": None}
+    for _ in range(2):
+        reply = forward_to_daemon(command="search", params=params)
+        assert (reply["count"], reply["total"]) == (20, 25) and "file19.py" in reply["output"]
+    reply = forward_to_daemon(command="code", params={"id": 3, "width": 80, "color_system": None})
+    assert reply["found"] and "import module3" in reply["output"]
+    assert forward_to_daemon(command="ping", params={})["hits"] == 2
+
+    # the entry point forwards plain calls, and falls back to the CLI for everything else
+    monkeypatch.setattr("searchcode._cli.main.clear_screen", lambda: None)
+    monkeypatch.setattr("sys.argv", ["sc", "search", "module", "--per-page=10", "--pages", "2"])
+    main()
+    assert "Showing 20 of 25 results for 'module'" in capsys.readouterr().out
+    assert forward_to_daemon(command="ping", params={})["misses"] == 5
+    assert _parse_daemon_request(args=["code", "3"]) == ("code", {"id": 3})
+    for args in (["search", "module", "--stream"], ["search", "a", "b"], ["--memory-report", "code", "3"]):
+        assert _parse_daemon_request(args=args) is None
+
+    assert forward_to_daemon(command="shutdown", params={})["ok"]
+    thread.join(timeout=10)
+    assert not thread.is_alive() and not os.path.exists(path)
+
+
+def test_entry_point_imports_no_client():
+    import subprocess
+    import sys
+
+    code = "import sys, searchcode._cli.main; print('requests' in sys.modules, 'rich' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert output.stdout.split() == ["False", "False"]
+
+
+def test_gateway_coalesces_caches_and_enforces_quota():
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+
+    class Client:
+        def request(self, path, params=None):
+            calls.append((path, params))
+            time.sleep(0.1)
+            return b'{"results": []}', "application/json"
+
+    gateway = Gateway(client=Client(), rate=100, quota_per_minute=6)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        replies = list(
+            executor.map(
+                lambda _: gateway.handle("/api/codesearch_I/", "q=test&p=0", "ci"),
+                range(4),
+            )
+        )
+
+    assert replies == [(200, "application/json", b'{"results": []}')] * 4
+    assert calls == [("codesearch_I/", [("p", "0"), ("q", "test")])]
+    assert gateway.handle("/api/codesearch_I/", "p=0&q=test", "ci")[0] == 200
+    assert len(calls) == 1
+    assert gateway.handle("/api/unknown", "", "ci")[0] == 404
+    assert gateway.handle("/api/codesearch_I/", "q=test", "ci")[0] == 429
+
+    stats = gateway.stats()["clients"]["ci"]
+    assert stats["upstream"] == 1 and stats["rejected"] == 1
+    assert stats["coalesced"] + stats["cache_hits"] == 4
+
+
+def test_endpoint_balancer_spreads_ejects_and_reprobes():
+    import pickle
+    import time
+
+    balancer = EndpointBalancer(
+        endpoints=["http://a/api", "http://b/api/"],
+        probe=lambda endpoint: True,
+        min_requests=2,
+        probe_interval=0.05,
+    )
+    for _ in range(2):
+        acquired = {balancer.acquire(), balancer.acquire()}
+        assert acquired == {"http://a/api", "http://b/api"}
+        balancer.release("http://a/api")
+        balancer.release("http://b/api", failed=True)
+
+    assert [stats["healthy"] for stats in balancer.stats()] == [True, False]
+    assert {balancer.acquire() for _ in range(3)} == {"http://a/api"}
+
+    time.sleep(0.2)
+    assert [stats["healthy"] for stats in balancer.stats()] == [True, True]
+    client = Searchcode(user_agent="Pytest", endpoints=balancer.endpoints)
+    assert pickle.loads(pickle.dumps(client)).endpoints == ["http://a/api", "http://b/api"]
+
+
+def test_search_with_code_attaches_code_in_order(local_api):
+    client = Searchcode(user_agent="Pytest", endpoints=local_api, max_workers=3)
+
+    results = list(
+        client.iter_search(query="module", per_page=10, pages=3, with_code=True, max_hydrate=12)
+    )
+    assert [result.id for result in results] == list(range(25))
+    assert [result.code for result in results[:12]] == [
+        f"import module{id}\n" for id in range(12)
+    ]
+    assert all(result.code is None for result in results[12:])
+
+    response = client.search(query="module", per_page=5, with_code=True)
+    assert [result.code for result in response.results] == [
+        f"import module{id}\n" for id in range(5)
+    ]
+
+
+def test_search_with_code_survives_failed_code_files():
+    handler = type("_MissingCodeHandler", (_LocalAPIHandler,), {"missing_code": {3, 7}})
+    server = _serve(handler=handler)
+    client = Searchcode(user_agent="Pytest", endpoints=next(server), max_workers=3)
+    try:
+        results = list(client.iter_search(query="module", per_page=10, with_code=True))
+        response = client.search(query="module", per_page=10, with_code=True)
+    finally:
+        next(server, None)
+
+    for results in (results, response.results):
+        assert len(results) == 10
+        assert [result.id for result in results if result.code is None] == [3, 7]
+        assert "404" in results[3].code_error and not hasattr(results[4], "code_error")
+
+
+def test_where_parses_clauses_and_stops_paging(local_api):
+    where = Where.parse("line~module1\\d$", "repo!=*repo0", "filename=*.py")
+    assert [
+        result.id
+        for result in where.filter(
+            SimpleNamespace(
+                id=id,
+                filename=f"file{id}.py",
+                repo=f"https://github.com/user/repo{id % 3}",
+                lines={"1": f"import module{id}"},
+            )
+            for id in range(25)
+        )
+    ] == [10, 11, 13, 14, 16, 17, 19]
+
+    with pytest.raises(ValueError):
+        Where.parse("linescount~abc")
+    with pytest.raises(ValueError, match="at least one value"):
+        Where.parse("filename=, ,")
+
+    # results without a line count match no linescount clause
+    unknown = SimpleNamespace(linescount=None)
+    for op in (">", ">=", "<", "<=", "=", "!="):
+        assert not Where.parse(f"linescount{op}5")(unknown)
+    assert Where.parse("linescount!=5")(SimpleNamespace(linescount=6))
+
+    client = Searchcode(user_agent="Pytest", endpoints=local_api)
+    results = list(
+        client.iter_search(
+            query="module",
+            per_page=5,
+            pages=5,
+            where=Where(linescount_between(low=21)),
+            limit=3,
+        )
+    )
+    assert [result.id for result in results] == [11, 12, 13]
+    assert client.balancer.stats()[0]["requests"] == 3
+
+
+def test_where_code_clauses_apply_after_hydration(local_api, tmp_path, monkeypatch):
+    client = Searchcode(user_agent="Pytest", endpoints=local_api)
+    matches = Where.parse("code~^import module1")
+    others = Where.parse("code!~^import module1")
+    with pytest.raises(ValueError):
+        client.search(query="module", where=matches)
+
+    response = client.search(query="module", per_page=25, with_code=True, where=matches)
+    assert [result.id for result in response.results] == [1, *range(10, 20)]
+    results = client.iter_search(query="module", per_page=25, with_code=True, where=others)
+    assert [result.id for result in results] == [0, *range(2, 10), *range(20, 25)]
+    # results without their code file match neither way
+    results = client.iter_search(
+        query="module", per_page=25, with_code=True, max_hydrate=5, where=others, limit=3
+    )
+    assert [result.id for result in results] == [0, 2, 3]
+
+    monkeypatch.setenv("SEARCHCODE_HOME", str(tmp_path))
+    monkeypatch.setattr("searchcode._cli.app.sc", client)
+    runner = CliRunner()
+    output = runner.invoke(cli, ["search", "module", "--per-page", "5", "--limit", "7"]).output
+    assert "Showing 7 of 25 results" in output and "file6.py" in output
+    output = runner.invoke(
+        cli, ["search", "module", "--per-page", "5", "--pages", "5", "--with-code", "25", "--where", "code~module2"]
+    ).output
+    assert "Showing 6 of 25 results" in output and "file24.py" in output
+    result = runner.invoke(cli, ["search", "module", "--where", "code~module2"])
+    assert result.exit_code == 2 and "Invalid value for --where" in result.output
+
+
+def test_adaptive_limiter_grows_and_backs_off(local_api):
+    limiter = AdaptiveLimiter(initial=2, max_limit=8)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    grown = limiter.stats()["limit"]
+    assert 2 < grown <= 8
+
+    # one decrease per window, however many requests fail at once
+    for _ in range(3):
+        limiter.acquire()
+    for _ in range(3):
+        limiter.release(latency=0.1, overloaded=True)
+    assert limiter.stats()["limit"] == grown // 2 and limiter.stats()["decreases"] == 1
+
+    limiter.acquire()
+    limiter.release(latency=10)
+    assert limiter.stats()["decreases"] == 2
+
+    client = Searchcode(
+        user_agent="Pytest", endpoints=local_api, max_workers=4, adaptive_concurrency=True
+    )
+    response = client.search(query="module", per_page=10, with_code=True)
+    assert len(response.results) == 10
+    concurrency = client.stats()["concurrency"]
+    assert concurrency["in_flight"] == 0 and 1 <= concurrency["limit"] <= 4
+
+
+def test_request_scheduler_shares_slots_by_weight(local_api):
+    import time
+
+    scheduler = RequestScheduler(max_concurrency=1, caps={"background": 1})
+    order = []
+
+    def request(priority):
+        scheduler.acquire(priority=priority)
+        order.append(priority)
+        scheduler.release(priority=priority)
+
+    scheduler.acquire()
+    threads = [
+        threading.Thread(target=request, args=(priority,))
+        for priority in ["background"] * 3 + ["interactive"] * 2
+    ]
+    for thread in threads:
+        thread.start()
+    while sum(stats["queued"] for stats in scheduler.stats().values()) < 5:
+        time.sleep(0.01)
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+
+    # stride scheduling: interactive gets 8 slots per background one, but can't starve it
+    assert order == ["interactive", "background", "interactive", "background", "background"]
+    with pytest.raises(ValueError):
+        scheduler.acquire(priority="urgent")
+
+    client = Searchcode(
+        user_agent="Pytest",
+        endpoints=local_api,
+        max_workers=2,
+        adaptive_concurrency=True,
+        scheduler=RequestScheduler(max_concurrency=1),
+    )
+    results = client.iter_search(
+        query="module", per_page=10, pages=2, with_code=True, priority="background"
+    )
+    assert len(list(results)) == 20
+    priorities = client.stats()["priorities"]
+    assert priorities["background"]["served"] == 22 and priorities["interactive"]["served"] == 0
+
+
+def test_cli_code_writes_line_range_to_output(local_api, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "searchcode._cli.app.sc", Searchcode(user_agent="Pytest", endpoints=local_api)
+    )
+    runner = CliRunner()
+    output = tmp_path / "code.py"
+    for lines, expected in (("1-1", "import module3\n"), ("2-9", "")):
+        result = runner.invoke(cli, ["code", "3", "--lines", lines, "--output", str(output)])
+        assert result.exit_code == 0 and output.read_text() == expected
+
+
+def test_aggregate_stats_uses_facets_and_counts_pages(local_api):
+    client = Searchcode(user_agent="Pytest", endpoints=local_api)
+
+    stats = aggregate_stats(client=client, query="module", fields=["language"])
+    assert stats.language == {"Python": 25} and stats.from_facets == ["language"]
+    assert stats.pages == 1 and stats.source is None
+
+    stats = aggregate_stats(client=client, query="module", per_page=10, buckets=(20, 30))
+    assert (stats.total, stats.counted, stats.pages) == (25, 25, 3)
+    # keyed by source name, like the facets
+    assert stats.source == {"GitHub": 25} and stats.failed == []
+    assert stats.repo["https://github.com/user/repo0"] == 9
+    assert stats.linescount == {"<20": 10, "20-29": 10, "30+": 5}
+
+
+def test_aggregate_stats_reports_failed_pages():
+    class Handler(_LocalAPIHandler):
+        def do_GET(self):
+            if "p=1&" in self.path:
+                self.send_error(500)
+                return
+            super().do_GET()
+
+    server = _serve(handler=Handler)
+    client = Searchcode(user_agent="Pytest", endpoints=next(server))
+    try:
+        stats = aggregate_stats(client=client, query="module", per_page=10, fields=["repo"])
+    finally:
+        next(server, None)
+
+    assert (stats.counted, stats.pages) == (15, 2)
+    [(page, error)] = stats.failed
+    assert page == 1 and "500" in error
+
+
+def test_memory_report_measures_nested_phases():
+    with memory_phase("untracked"):
+        pass
+
+    kept = []
+    with MemoryReport() as report:
+        with memory_phase("outer"):
+            with memory_phase("inner"):
+                kept.append(bytearray(1024 * 1024))
+            temporary = bytearray(2 * 1024 * 1024)
+            del temporary
+
+    assert set(report.phases) == {"outer", "inner"}
+    inner, outer = report.phases["inner"], report.phases["outer"]
+    assert inner.calls == 1 and inner.retained >= 1024 * 1024
+    assert outer.peak >= 3 * 1024 * 1024 > outer.retained >= inner.retained
+    assert any("test_searchcode.py" in site for site in inner.sites)
+
+
 # deprecated (for now)
 # def test_related_results():
 #    related = sc.related_results(4061576)